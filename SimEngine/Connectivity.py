@@ -9,9 +9,11 @@ Each cell of the matrix is a dict with the fields `pdr` and `rssi`
 The connectivity matrix can be filled statically at startup or be updated along
 time if a connectivity trace is given.
 
-The propagate() method is called at every slot. It loops through the
-transmissions occurring during that slot and checks if the transmission fails or
-succeeds.
+The multi_network_propagate() method is called at every time step of the
+engine and models sub-slot timing (lock-on and capture). With the 'slot'
+fidelity (conn_fidelity), the propagate() method is called at every slot
+instead. It loops through the transmissions occurring during that slot and
+checks if the transmission fails or succeeds.
 """
 from __future__ import print_function
 from __future__ import absolute_import
@@ -33,7 +35,9 @@ import datetime as dt
 import json
 import itertools
 
-from SimEngine.SimEngineDefines import SECOND, Event
+import numpy
+
+from SimEngine.SimEngineDefines import SECOND, FIDELITY_SLOT, FIDELITY_ADAPTIVE, Event
 
 from . import SimSettings
 from . import SimLog
@@ -78,6 +82,9 @@ class Connectivity(object):
 
         # short-hands and local variables
         self.num_channels = self.settings.phy_numChans
+        self.channels     = frozenset(
+            d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
+        )
         
         # store the ongoing transmissions by channels
         self.transmission_queue = {}
@@ -90,8 +97,10 @@ class Connectivity(object):
         self.matrix = matrix_class(self)
 
         # schedule propagation task
-        # self._schedule_propagate()
-        self._schedule_multi_network_propagate()
+        if self.engine.fidelity == FIDELITY_SLOT:
+            self._schedule_propagate()
+        else:
+            self._schedule_multi_network_propagate()
 
     def destroy(self):
         cls           = type(self)
@@ -101,17 +110,31 @@ class Connectivity(object):
     def get_pdr(self, src_id, dst_id, channel):
         assert isinstance(src_id, int)
         assert isinstance(dst_id, int)
-        assert channel in d.TSCH_HOPPING_SEQUENCE
+        assert channel in d.TSCH_CHANNELS
 
         return self.matrix.get_pdr(src_id, dst_id, channel)
 
     def get_rssi(self, src_id, dst_id, channel):
         assert isinstance(src_id, int)
         assert isinstance(dst_id, int)
-        assert channel in d.TSCH_HOPPING_SEQUENCE
+        assert channel in d.TSCH_CHANNELS
 
         return self.matrix.get_rssi(src_id, dst_id, channel)
 
+    def get_mean_pdr(self, src_id, dst_id):
+        """Return the PDR of the link averaged over all the channels"""
+        assert isinstance(src_id, int)
+        assert isinstance(dst_id, int)
+
+        return self.matrix.get_mean_pdr(src_id, dst_id)
+
+    def get_mean_rssi(self, src_id, dst_id):
+        """Return the RSSI of the link averaged over all the channels"""
+        assert isinstance(src_id, int)
+        assert isinstance(dst_id, int)
+
+        return self.matrix.get_mean_rssi(src_id, dst_id)
+
     def delete_transmission(self, mote_id, channel=None):
         """ Delete transmission for a given mote_id """
         if channel is not None and channel in self.transmission_queue:
@@ -158,6 +181,10 @@ class Connectivity(object):
                     u'end_time': mote.radio.onGoingTransmission[u'end_time'],
                     # duration of this transmission
                     u'duration': mote.radio.onGoingTransmission[u'end_time'] - mote.radio.onGoingTransmission[u'start_time'],
+                    # number of ACKs received by this packet
+                    u'numACKs': 0,
+                    # whether another transmission overlaps with this one
+                    u'contended': False,
                     # whether this transmission is acknowledged or not
                     u'deleted': False
                 }
@@ -167,6 +194,9 @@ class Connectivity(object):
                 bisect.insort(self.transmission_queue[transmission[u'channel']], transmission, key=lambda x: x[u'tx_time'])
                 bisect.insort(new_transmission, transmission, key=lambda x: x[u'tx_time'])
                 mote.radio.state = d.RADIO_STATE_TRANSMITTING
+        if self.engine.fidelity == FIDELITY_ADAPTIVE:
+            # transmissions overlapping on a channel need the lock-on model
+            self._mark_contended_transmissions(new_transmission)
         # for each new transmission, check whether any radio lock on it 
         for transmission in new_transmission:
             # if the CCA is enabled, then its logic starts from here
@@ -203,9 +233,15 @@ class Connectivity(object):
                                     reception[u'locked_transmission'] = transmission
                     
 
+        if self.engine.fidelity == FIDELITY_ADAPTIVE:
+            # transmissions which stayed alone on their channel get one PDR draw
+            self._resolve_uncontended_transmissions()
+
         # check whether reception is finished or not
         for channel in self.reception_queue:
             for reception in self.reception_queue[channel]:
+                if reception[u'deleted'] is True:
+                    continue
                 # if the transmission is locked and ends at this point
                 if reception[u'locked_transmission'] is not None:
                     if self.engine.global_time >= reception[u'locked_transmission'][u'end_time']:
@@ -230,16 +266,41 @@ class Connectivity(object):
                         )
                         if lockon_random_value < packet_pdr:
                             # packet received!
-                            reception[u'mote'].radio.rxDone(
+                            receivedAck = reception[u'mote'].radio.rxDone(
                                 packet=lockon_transmission[u'packet']
                             )
                             reception[u'deleted'] = True
+
+                            if receivedAck and self.settings.conn_simulate_ack_drop:
+                                pdr_of_return_link = self.get_pdr(
+                                    src_id=reception[u'mote'].id,
+                                    dst_id=lockon_transmission[u'mote'].id,
+                                    channel=channel
+                                )
+                                receivedAck = random.random() < pdr_of_return_link
+
+                            if receivedAck:
+                                # the ACK is given to the transmitter when
+                                # its transmission ends, right below
+                                lockon_transmission[u'numACKs'] += 1
                         else:
                             # receive nothing
                             reception[u'mote'].radio.rxDone(
                                 packet=None
                             )
                             reception[u'deleted'] = True
+                elif (
+                        (self.engine.fidelity == FIDELITY_ADAPTIVE)
+                        and
+                        self._is_rx_window_closed(reception)
+                        and
+                        self._is_channel_idle(channel)
+                    ):
+                    # nothing was heard within the RX window; idle listen
+                    reception[u'mote'].radio.rxDone(
+                        packet=None
+                    )
+                    reception[u'deleted'] = True
             self.reception_queue[channel] = [reception for reception in self.reception_queue[channel] if reception[u'deleted'] is False]
 
         # check whether transmission is finished or not
@@ -247,44 +308,156 @@ class Connectivity(object):
             for transmission in self.transmission_queue[channel]:
                 # if the transmission ends then close its radio
                 if self.engine.global_time >= transmission[u'end_time']:
-                    transmission[u'mote'].radio.txDone(False)
+                    # the receptions locked on it ended at this point as
+                    # well, and have counted the ACKs
+                    if transmission[u'numACKs'] == 0:
+                        isACKed = False
+                    elif transmission[u'numACKs'] == 1:
+                        isACKed = True
+                    else:
+                        # we do not expect multiple ACKs (would indicate
+                        # duplicate MAC addresses)
+                        raise SystemError()
+                    transmission[u'mote'].radio.txDone(isACKed)
                     transmission[u'deleted'] = True
             self.transmission_queue[channel] = [transmission for transmission in self.transmission_queue[channel] if transmission[u'deleted'] is False]
         self._schedule_multi_network_propagate()
     
+    def _mark_contended_transmissions(self, new_transmission):
+        """ Flag the transmissions overlapping with another one on their channel
+
+        Used with the 'adaptive' fidelity. A flagged transmission is left to
+        the lock-on/capture model; the flag is never cleared, as the overlap
+        already happened.
+        """
+        for transmission in new_transmission:
+            transmissions = [
+                t for t in self.transmission_queue[transmission[u'channel']]
+                if t[u'deleted'] is False
+            ]
+            if len(transmissions) > 1:
+                for t in transmissions:
+                    t[u'contended'] = True
+
+    def _resolve_uncontended_transmissions(self):
+        """ Resolve the transmissions which ended alone on their channel
+
+        Used with the 'adaptive' fidelity. A transmission is resolved at its
+        end_time, in one PDR draw per listener, provided no other transmission
+        started on its channel meanwhile. Every reception of the channel
+        opened before the end of the frame hears it, including the ones opened
+        before the transmission started.
+        """
+        for channel in self.transmission_queue:
+            for transmission in self.transmission_queue[channel]:
+                if (
+                        (transmission[u'deleted'] is True)
+                        or
+                        (transmission[u'contended'] is True)
+                        or
+                        (self.engine.global_time < transmission[u'end_time'])
+                    ):
+                    continue
+
+                listener_ids = []
+                for reception in self.reception_queue.get(channel, []):
+                    if reception[u'deleted'] is True:
+                        continue
+                    if reception[u'rx_time'] >= transmission[u'end_time']:
+                        # opened after the frame was over
+                        continue
+                    assert (
+                        (reception[u'locked_transmission'] is None)
+                        or
+                        (reception[u'locked_transmission'] is transmission)
+                    )
+                    reception[u'deleted'] = True
+                    listener_ids.append(reception[u'mote'].id)
+
+                if listener_ids:
+                    self._propagate_on_channel(
+                        channel       = channel,
+                        transmissions = [transmission],
+                        listener_ids  = listener_ids
+                    )
+                else:
+                    transmission[u'mote'].radio.txDone(False)
+                transmission[u'deleted'] = True
+            self.transmission_queue[channel] = [transmission for transmission in self.transmission_queue[channel] if transmission[u'deleted'] is False]
+
+    def _is_rx_window_closed(self, reception):
+        # a frame may start up to the guard time after the radio is opened
+        return (
+            self.engine.global_time >=
+            reception[u'rx_time'] + reception[u'mote'].tsch.guard_time
+        )
+
+    def _is_channel_idle(self, channel):
+        for transmission in self.transmission_queue.get(channel, []):
+            if transmission[u'deleted'] is False:
+                return False
+        return True
+
+    def _is_air_idle(self):
+        for queue in itertools.chain(
+                list(self.transmission_queue.values()),
+                list(self.reception_queue.values())
+            ):
+            for entry in queue:
+                if entry[u'deleted'] is False:
+                    return False
+        return True
+
     def _schedule_multi_network_propagate(self):
         # schedule propagation every time step
+        next_time = self.engine.global_time + self.engine.time_step
+        if (
+                (self.engine.fidelity == FIDELITY_ADAPTIVE)
+                and
+                self._is_air_idle()
+            ):
+            # nothing on the air; skip to the first step of the next slot
+            next_time = min([
+                self.engine.asn_to_global_time(
+                    self.engine.global_time_to_asn(
+                        self.engine.global_time,
+                        network_id
+                    ) + 1,
+                    network_id
+                )
+                for network_id in self.engine.networks
+            ]) + self.engine.time_step
         self.engine.scheduleAtPreciseTime(Event(
-            time            = self.engine.global_time + self.engine.time_step,
+            time            = next_time,
             callback        = self.multi_network_propagate,
             uniqueTag       = (None, u'Connectivity.multi_network_propagate'),
             intraSlotOrder  = d.INTRASLOTORDER_PROPAGATE
         ))
 
     def propagate(self):
-        """ Simulate the propagation of frames in a slot. """
+        """ Simulate the propagation of frames in a slot.
 
-        # local shorthands
-        asn        = self.engine.getAsn()
-        slotOffset = asn % self.settings.tsch_slotframeLength
+        Used with the 'slot' fidelity: all the transmissions and receptions
+        started in this slot are resolved in a single pass, without the
+        sub-slot capture/lock-on model of multi_network_propagate().
+        """
 
         # get all motes TXing or RXing on this slot organized by channel
         transmissions_by_channel = {}
         receivers_by_channel = {}
 
-        # organize all transmissions and receptions by channel
+        # organize all transmissions by channel
         for mote in self.engine.motes:
-            # get all transmissions
             if mote.radio.state == d.RADIO_STATE_TX:
                 assert mote.radio.onGoingTransmission
                 thisTran = {
                     # channel
                     u'channel': mote.radio.onGoingTransmission[u'channel'],
                     # packet
-                    u'tx_mote_id': mote.id,
+                    u'mote': mote,
                     u'packet': mote.radio.onGoingTransmission[u'packet'],
                     # time at which the packet starts transmitting
-                    u'txTime': mote.tsch.clock.get_drift(),
+                    u'tx_time': mote.radio.onGoingTransmission[u'start_time'],
                     # number of ACKs received by this packet
                     u'numACKs': 0,
                 }
@@ -294,21 +467,21 @@ class Connectivity(object):
 
                 transmissions_by_channel[thisTran[u'channel']] += [thisTran]
 
-            # get all receivers
-            elif mote.radio.state == d.RADIO_STATE_RX:
-                if mote.radio.channel not in receivers_by_channel:
-                    receivers_by_channel[mote.radio.channel] = []
-
-                receivers_by_channel[mote.radio.channel] += [mote.id]
-
-            else:
-                # mote is idle, do nothing
-                pass
+        # organize all receivers by channel; radios register themselves to
+        # reception_queue on startRx()
+        for channel in self.reception_queue:
+            for reception in self.reception_queue[channel]:
+                if reception[u'deleted'] is True:
+                    continue
+                if channel not in receivers_by_channel:
+                    receivers_by_channel[channel] = []
+                receivers_by_channel[channel] += [reception[u'mote'].id]
+            self.reception_queue[channel] = []
 
         # remove all motes that are listening to channels without any transmission
         for channel in set(receivers_by_channel.keys()) - set(transmissions_by_channel.keys()):
             assert channel not in transmissions_by_channel
-            assert channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
+            assert channel in self.channels
 
             for listener_id in receivers_by_channel[channel]:
                 sentAck = self.engine.motes[listener_id].radio.rxDone(
@@ -319,194 +492,202 @@ class Connectivity(object):
         # remove all transmissions that are sent on channels without any listeners
         for channel in set(transmissions_by_channel.keys()) - set(receivers_by_channel.keys()):
             assert channel not in receivers_by_channel
-            assert channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
+            assert channel in self.channels
 
             for t in transmissions_by_channel[channel]:
-                self.engine.motes[t[u'tx_mote_id']].radio.txDone(False)
+                t[u'mote'].radio.txDone(False)
 
         # prosses packets sent on channels with listeners
         for channel in set(transmissions_by_channel.keys()) & set(receivers_by_channel.keys()):
-            assert channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
+            self._propagate_on_channel(
+                channel       = channel,
+                transmissions = transmissions_by_channel[channel],
+                listener_ids  = receivers_by_channel[channel]
+            )
 
-            for listener_id in receivers_by_channel[channel]:
-                # list the transmissions that listener can hear and lock to the earliest one
-                lockon_transmission = None
-                lockon_random_value = None
-                interfering_transmissions = []
-                detected_transmissions = 0
-
-                # deal with collisions
-                if len(transmissions_by_channel[channel]) > 1:
-                    for t in transmissions_by_channel[channel]:
-                        # random_value will be used for comparison against PDR
-                        random_value = random.random()
-
-                        peamble_pdr = self.get_pdr(
-                            src_id=t[u'tx_mote_id'],
-                            dst_id=listener_id,
-                            channel=channel,
-                        )
+        # verify all radios off
+        for mote in self.engine.motes:
+            assert mote.radio.state == d.RADIO_STATE_OFF
+            assert mote.radio.channel is None
 
-                        # you can interpret the following line as decision for
-                        # reception of the preamble of 't'
-                        if random_value > peamble_pdr:
-                            # reception failed, continue to the next transmission
-                            continue
-
-                        # update counter
-                        detected_transmissions += 1
-
-                        # begin locking to the first heard transmission
-                        if lockon_transmission is None:
-                            lockon_transmission = t
-                            lockon_random_value = random_value
-                            continue
-
-                        # then update the locked transmission if it's earlier than the previous earliest
-                        if t[u'txTime'] < lockon_transmission[u'txTime']:
-                            # add previous locked on tranmission to the interference list
-                            interfering_transmissions += [t]
-                            # and lock to the new earliest transmission
-                            lockon_transmission = t
-                            lockon_random_value = random_value
-                        else:
-                            interfering_transmissions += [t]
+        # schedule next propagation
+        self._schedule_propagate()
+
+    def _schedule_propagate(self):
+        '''
+        schedule a propagation task at the next slot.
+        FIXME: only schedule for next active slot.
+        '''
+        self.engine.scheduleAtAsn(
+            asn              = self.engine.getAsn() + 1,
+            cb               = self.propagate,
+            uniqueTag        = (None, u'Connectivity.propagate'),
+            intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
+        )
+
+    def _propagate_on_channel(self, channel, transmissions, listener_ids):
+        """ Resolve the transmissions of a slot on a channel having listeners """
+        assert channel in self.channels
+
+        for listener_id in listener_ids:
+            # list the transmissions that listener can hear and lock to the earliest one
+            lockon_transmission = None
+            lockon_random_value = None
+            interfering_transmissions = []
+            detected_transmissions = 0
+
+            # deal with collisions
+            if len(transmissions) > 1:
+                for t in transmissions:
+                    # random_value will be used for comparison against PDR
+                    random_value = random.random()
+
+                    peamble_pdr = self.get_pdr(
+                        src_id=t[u'mote'].id,
+                        dst_id=listener_id,
+                        channel=channel,
+                    )
+
+                    # you can interpret the following line as decision for
+                    # reception of the preamble of 't'
+                    if random_value > peamble_pdr:
+                        # reception failed, continue to the next transmission
+                        continue
+
+                    # update counter
+                    detected_transmissions += 1
 
-                    # check if it received anything
+                    # begin locking to the first heard transmission
                     if lockon_transmission is None:
-                        # nope, set the receiver to idle listen and cotinue to next one
-                        sentAck = self.engine.motes[listener_id].radio.rxDone(
-                            packet=None,
-                        )
+                        lockon_transmission = t
+                        lockon_random_value = random_value
                         continue
 
-                    # something was received, continue execution
-                    self.log(
-                        SimLog.LOG_PROP_INTERFERENCE,
-                        {
-                            u'_mote_id': listener_id,
-                            u'channel': lockon_transmission[u'channel'],
-                            u'lockon_transmission': (
-                                lockon_transmission[u'packet']
-                            ),
-                            u'interfering_transmissions': [
-                                t[u'packet']
-                                for t in interfering_transmissions
-                            ]
-                        }
-                    )
+                    # then update the locked transmission if it's earlier than the previous earliest
+                    if t[u'tx_time'] < lockon_transmission[u'tx_time']:
+                        # add previous locked on tranmission to the interference list
+                        interfering_transmissions += [lockon_transmission]
+                        # and lock to the new earliest transmission
+                        lockon_transmission = t
+                        lockon_random_value = random_value
+                    else:
+                        interfering_transmissions += [t]
 
-                    # calculate the resulting pdr when taking
-                    # interferers into account
-                    packet_pdr = self._compute_pdr_with_interference(
-                        listener_id=listener_id,
-                        lockon_transmission=lockon_transmission,
-                        interfering_transmissions=interfering_transmissions
+                # check if it received anything
+                if lockon_transmission is None:
+                    # nope, set the receiver to idle listen and cotinue to next one
+                    sentAck = self.engine.motes[listener_id].radio.rxDone(
+                        packet=None,
                     )
+                    continue
 
-                # no collision, easy peasy
-                elif len(transmissions_by_channel[channel]) == 1:
-                    # there's no point in testing the preamble here, so we'll skip it
-                    detected_transmissions = 1
-
-                    lockon_random_value = random.random()
-                    lockon_transmission = transmissions_by_channel[channel][0]
-                    packet_pdr = self.get_pdr(
-                        src_id  = lockon_transmission[u'tx_mote_id'],
-                        dst_id  = listener_id,
-                        channel = channel
-                    )
+                # something was received, continue execution
+                self.log(
+                    SimLog.LOG_PROP_INTERFERENCE,
+                    {
+                        u'_mote_id': listener_id,
+                        u'channel': lockon_transmission[u'channel'],
+                        u'lockon_transmission': (
+                            lockon_transmission[u'packet']
+                        ),
+                        u'interfering_transmissions': [
+                            t[u'packet']
+                            for t in interfering_transmissions
+                        ]
+                    }
+                )
 
-                # this souldn't really happen
-                else:
-                    assert False
+                # calculate the resulting pdr when taking
+                # interferers into account
+                packet_pdr = self._compute_pdr_with_interference(
+                    listener_id=listener_id,
+                    lockon_transmission=lockon_transmission,
+                    interfering_transmissions=interfering_transmissions
+                )
 
-                # lockon transmission selected
-                # all other transmissions are now intereferers
-                assert (
-                        detected_transmissions ==
-                        (len(interfering_transmissions) + 1)
+            # no collision, easy peasy
+            elif len(transmissions) == 1:
+                # there's no point in testing the preamble here, so we'll skip it
+                detected_transmissions = 1
+
+                lockon_random_value = random.random()
+                lockon_transmission = transmissions[0]
+                packet_pdr = self.get_pdr(
+                    src_id  = lockon_transmission[u'mote'].id,
+                    dst_id  = listener_id,
+                    channel = channel
                 )
 
-                # decide whether listener receives
-                # lockon_transmission or not
-                if lockon_random_value < packet_pdr:
-                    # listener receives!
+            # this souldn't really happen
+            else:
+                assert False
 
-                    # lockon_transmission received correctly
-                    receivedAck = self.engine.motes[listener_id].radio.rxDone(
-                        packet=lockon_transmission[u'packet'],
-                    )
+            # lockon transmission selected
+            # all other transmissions are now intereferers
+            assert (
+                    detected_transmissions ==
+                    (len(interfering_transmissions) + 1)
+            )
 
-                    if receivedAck and self.settings.conn_simulate_ack_drop:
-                        pdr_of_return_link = self.get_pdr(
-                            src_id=listener_id,
-                            dst_id=lockon_transmission[u'tx_mote_id'],
-                            channel=channel
-                        )
-                        receivedAck = random.random() < pdr_of_return_link
+            # decide whether listener receives
+            # lockon_transmission or not
+            if lockon_random_value < packet_pdr:
+                # listener receives!
 
-                    if receivedAck:
-                        # keep track of the number of ACKs received by
-                        # that transmission
-                        lockon_transmission[u'numACKs'] += 1
-                    else:
-                        # ACK is lost in the air
-                        pass
-                else:
-                    # lockon_transmission NOT received correctly
-                    # (interference)
-                    receivedAck = self.engine.motes[listener_id].radio.rxDone(
-                        packet=None,
-                    )
-                    self.log(
-                        SimLog.LOG_PROP_DROP_LOCKON,
-                        {
-                            u'_mote_id': listener_id,
-                            u'channel': lockon_transmission[u'channel'],
-                            u'lockon_transmission': (
-                                lockon_transmission[u'packet']
-                            )
-                        }
-                    )
-                    assert receivedAck is False
+                # lockon_transmission received correctly
+                receivedAck = self.engine.motes[listener_id].radio.rxDone(
+                    packet=lockon_transmission[u'packet'],
+                )
 
-                # done processing this listener
+                if receivedAck and self.settings.conn_simulate_ack_drop:
+                    pdr_of_return_link = self.get_pdr(
+                        src_id=listener_id,
+                        dst_id=lockon_transmission[u'mote'].id,
+                        channel=channel
+                    )
+                    receivedAck = random.random() < pdr_of_return_link
 
-            # after processing all listeners send back ACK to transmitter if possible
-            for t in transmissions_by_channel[channel]:
-                # decide whether transmitter received an ACK
-                if t[u'numACKs'] == 0:
-                    isACKed = False
-                elif t[u'numACKs'] == 1:
-                    isACKed = True
+                if receivedAck:
+                    # keep track of the number of ACKs received by
+                    # that transmission
+                    lockon_transmission[u'numACKs'] += 1
                 else:
-                    # we do not expect multiple ACKs (would indicate
-                    # duplicate MAC addresses)
-                    raise SystemError()
+                    # ACK is lost in the air
+                    pass
+            else:
+                # lockon_transmission NOT received correctly
+                # (interference)
+                receivedAck = self.engine.motes[listener_id].radio.rxDone(
+                    packet=None,
+                )
+                self.log(
+                    SimLog.LOG_PROP_DROP_LOCKON,
+                    {
+                        u'_mote_id': listener_id,
+                        u'channel': lockon_transmission[u'channel'],
+                        u'lockon_transmission': (
+                            lockon_transmission[u'packet']
+                        )
+                    }
+                )
+                assert receivedAck is False
 
-                # indicate to source packet was sent
-                self.engine.motes[t[u'tx_mote_id']].radio.txDone(isACKed)
+            # done processing this listener
 
-        # verify all radios off
-        for mote in self.engine.motes:
-            assert mote.radio.state == d.RADIO_STATE_OFF
-            assert mote.radio.channel is None
+        # after processing all listeners send back ACK to transmitter if possible
+        for t in transmissions:
+            # decide whether transmitter received an ACK
+            if t[u'numACKs'] == 0:
+                isACKed = False
+            elif t[u'numACKs'] == 1:
+                isACKed = True
+            else:
+                # we do not expect multiple ACKs (would indicate
+                # duplicate MAC addresses)
+                raise SystemError()
 
-        # schedule next propagation
-        self._schedule_propagate()
-
-    def _schedule_propagate(self):
-        '''
-        schedule a propagation task in the middle of the next slot.
-        FIXME: only schedule for next active slot.
-        '''
-        self.engine.scheduleAtAsn(
-            asn              = self.engine.getAsn() + 1,
-            cb               = self.propagate,
-            uniqueTag        = (None, u'Connectivity.propagate'),
-            intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
-        )
+            # indicate to source packet was sent
+            t[u'mote'].radio.txDone(isACKed)
 
     def _get_listener_id_list(self, channel):
         returnVal = []
@@ -660,6 +841,9 @@ class ConnectivityMatrixBase(object):
         self.settings = connectivity.settings
         self.log = connectivity.log
         self._matrix = {}
+        # mean PDR and RSSI over the channels, indexed by (src_id, dst_id);
+        # an entry is dropped when a value of the link is set
+        self._mean_link_quality = {}
 
         # short hands
         self.num_channels = self.settings.phy_numChans
@@ -683,24 +867,51 @@ class ConnectivityMatrixBase(object):
 
     def set_pdr(self, src_id, dst_id, channel, pdr):
         self._matrix[src_id][dst_id][channel][u'pdr'] = pdr
+        self._mean_link_quality.pop((src_id, dst_id), None)
 
     def set_pdr_both_directions(self, mote_id_1, mote_id_2, channel, pdr):
-        self._matrix[mote_id_1][mote_id_2][channel][u'pdr'] = pdr
-        self._matrix[mote_id_2][mote_id_1][channel][u'pdr'] = pdr
+        self.set_pdr(mote_id_1, mote_id_2, channel, pdr)
+        self.set_pdr(mote_id_2, mote_id_1, channel, pdr)
 
     def get_pdr(self, src_id, dst_id, channel):
         return self._matrix[src_id][dst_id][channel][u'pdr']
 
     def set_rssi(self, src_id, dst_id, channel, rssi):
         self._matrix[src_id][dst_id][channel][u'rssi'] = rssi
+        self._mean_link_quality.pop((src_id, dst_id), None)
 
     def set_rssi_both_directions(self, mote_id_1, mote_id_2, channel, rssi):
-        self._matrix[mote_id_1][mote_id_2][channel][u'rssi'] = rssi
-        self._matrix[mote_id_2][mote_id_1][channel][u'rssi'] = rssi
+        self.set_rssi(mote_id_1, mote_id_2, channel, rssi)
+        self.set_rssi(mote_id_2, mote_id_1, channel, rssi)
 
     def get_rssi(self, src_id, dst_id, channel):
         return self._matrix[src_id][dst_id][channel][u'rssi']
 
+    def get_mean_pdr(self, src_id, dst_id):
+        return self._get_mean_link_quality(src_id, dst_id)[u'pdr']
+
+    def get_mean_rssi(self, src_id, dst_id):
+        return self._get_mean_link_quality(src_id, dst_id)[u'rssi']
+
+    def _get_mean_link_quality(self, src_id, dst_id):
+        key = (src_id, dst_id)
+        try:
+            return self._mean_link_quality[key]
+        except KeyError:
+            channels = d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
+            mean_link_quality = {
+                u'pdr': numpy.mean([
+                    self.get_pdr(src_id, dst_id, channel)
+                    for channel in channels
+                ]),
+                u'rssi': numpy.mean([
+                    self.get_rssi(src_id, dst_id, channel)
+                    for channel in channels
+                ])
+            }
+            self._mean_link_quality[key] = mean_link_quality
+            return mean_link_quality
+
     def dump(self):
         output = []
         output += [u'\n']
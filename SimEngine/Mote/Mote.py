@@ -22,6 +22,7 @@ from . import tsch
 from . import radio
 
 from . import MoteDefines as d
+from . import addr
 
 # Simulator-wide modules
 import SimEngine
@@ -54,6 +55,8 @@ class Mote(object):
         self.dagRoot                   = False
         self._init_eui64(eui64)
         self.ipv6_prefix               = None
+        self.ipv6_global_addr          = None
+        self.ipv6_global_addr_int      = None
 
         # stack
         self.app                       = app.App(self)
@@ -76,20 +79,38 @@ class Mote(object):
     # ==== address
 
     def is_my_ipv6_addr(self, ipv6_addr):
-        # get a address string in the canonical format
-        target_ipv6_addr = str(netaddr.IPAddress(ipv6_addr))
+        target_ipv6_addr_int = addr.ipv6_addr_to_int(ipv6_addr)
         return (
-            (self.get_ipv6_global_addr() == target_ipv6_addr)
-            or
-            (self.get_ipv6_link_local_addr() == target_ipv6_addr)
+            (target_ipv6_addr_int is not None)
+            and
+            (
+                (self.ipv6_global_addr_int == target_ipv6_addr_int)
+                or
+                (self.ipv6_link_local_addr_int == target_ipv6_addr_int)
+            )
         )
 
     def is_my_mac_addr(self, mac_addr):
-        return self.eui64 == mac_addr
+        return addr.mac_addr_to_int(mac_addr) == self.mac_addr_int
+
+    def set_eui64(self, eui64):
+        # change the MAC address, which changes the IPv6 addresses as well
+        old_mac_addr_int = self.mac_addr_int
+        self._init_eui64(eui64)
+        if self.ipv6_prefix is not None:
+            self.add_ipv6_prefix(self.ipv6_prefix)
+        self.engine.update_mote_mac_addr(self, old_mac_addr_int)
 
     def add_ipv6_prefix(self, prefix):
         # having more than one prefix is not supported
         self.ipv6_prefix = netaddr.IPAddress(prefix)
+        self.ipv6_global_addr_int = addr.mac_addr_int_to_ipv6_addr_int(
+            self.mac_addr_int,
+            int(self.ipv6_prefix)
+        )
+        self.ipv6_global_addr = addr.int_to_ipv6_addr(
+            self.ipv6_global_addr_int
+        )
         self.log(
             SimEngine.SimLog.LOG_IPV6_ADD_ADDR,
             {
@@ -102,18 +123,17 @@ class Mote(object):
     def delete_ipv6_prefix(self):
         # having more than one prefix is not supported
         self.ipv6_prefix = None
+        self.ipv6_global_addr = None
+        self.ipv6_global_addr_int = None
 
     def get_ipv6_global_addr(self, ref_addr=None):
-        if self.ipv6_prefix is None:
-            return None
-        else:
-            return str(self.eui64.ipv6(self.ipv6_prefix))
+        return self.ipv6_global_addr
 
     def get_ipv6_link_local_addr(self):
-        return str(self.eui64.ipv6_link_local())
+        return self.ipv6_link_local_addr
 
     def get_mac_addr(self):
-        return str(self.eui64)
+        return self.mac_addr
 
 
     # ==== location
@@ -214,12 +234,24 @@ class Mote(object):
                 self.eui64 = netaddr.EUI(local_eui64.value + self.id)
         else:
             self.eui64 = netaddr.EUI(eui64)
+
+        # the addresses are interned as strings and integers
+        self.mac_addr_int = int(self.eui64)
+        self.mac_addr     = addr.int_to_mac_addr(self.mac_addr_int)
+        self.ipv6_link_local_addr_int = addr.mac_addr_int_to_ipv6_addr_int(
+            self.mac_addr_int,
+            addr.ipv6_addr_to_int(d.IPV6_LINK_LOCAL_PREFIX)
+        )
+        self.ipv6_link_local_addr = addr.int_to_ipv6_addr(
+            self.ipv6_link_local_addr_int
+        )
+
         self.log(
             SimEngine.SimLog.LOG_MAC_ADD_ADDR,
             {
                 u'_mote_id': self.id,
                 u'type'    : self.MAC_ADDR_TYPE_EUI64,
-                u'addr'    : str(self.eui64)
+                u'addr'    : self.mac_addr
             }
         )
         self.log(
@@ -36,6 +36,7 @@ RPL_INFINITE_RANK                           = 65535
 # === ipv6
 IPV6_DEFAULT_HOP_LIMIT                      = 64
 IPV6_DEFAULT_PREFIX                         = u'fd00::'
+IPV6_LINK_LOCAL_PREFIX                      = u'fe80::'
 IPV6_ALL_RPL_NODES_ADDRESS                  = u'ff02::1a'
 
 # === sixlowpan
@@ -91,6 +92,7 @@ TSCH_MIN_BACKOFF_EXPONENT                   = 1
 TSCH_MAX_BACKOFF_EXPONENT                   = 7
 # https://gist.github.com/twatteyne/2e22ee3c1a802b685695#file-4e_tsch_default_ch-py
 TSCH_HOPPING_SEQUENCE                       = [16, 17, 23, 18, 26, 15, 25, 22, 19, 11, 12, 13, 24, 14, 20, 21]
+TSCH_CHANNELS                               = frozenset(TSCH_HOPPING_SEQUENCE) # for membership tests
 TSCH_MAX_EB_DELAY                           = 180
 TSCH_NUM_NEIGHBORS_TO_WAIT                  = 2
 TSCH_DESYNCHRONIZED_TIMEOUT_SLOTS           = 1750
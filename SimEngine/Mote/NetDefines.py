@@ -1,157 +1,254 @@
-from dataclasses import dataclass, field
 from typing import Optional, Dict, Any
 
-@dataclass
-class AppInfo:
-    rank: int
-    dodagId: str
-    extra: Dict[str, Any] = field(default_factory=dict)
-    
-    def __contains__(self, key: str) -> bool:
-        return key in self.__dict__ or key in self.extra
 
-    def __getitem__(self, key: str) -> Any:
-        if key in self.__dict__:
-            return self.__dict__[key]
-        elif key in self.extra:
-            return self.extra[key]
-        else:
-            raise KeyError(f"key is not existed in AppInfo: {key}")
-    
-    def __setitem__(self, key: str, value: Any) -> None:
-        if key in self.__dict__ and key != "extra":
-            self.__dict__[key] = value
-        else:
-            self.extra[key] = value
+class Header:
+    """
+    Base of the packet and its headers
+
+    The known keys are stored in __slots__ (FIELDS); a field set to None is
+    regarded as absent. Any other key goes to "extra", which is allocated
+    only when such a key is set.
+    """
+    FIELDS = ()
+    __slots__ = ("extra",)
+
+    def __init__(self, *args, **kwargs):
+        assert len(args) <= len(self.FIELDS)
+        for name, value in zip(self.FIELDS, args):
+            kwargs[name] = value
+        self.extra = None
+        for name in self.FIELDS:
+            self[name] = kwargs.pop(name, None)
+        for key, value in kwargs.items():
+            self[key] = value
 
-@dataclass
-class NetInfo:
-    srcIp: str
-    dstIp: str
-    hop_limit: int
-    downward: bool
-    extra: Dict[str, Any] = field(default_factory=dict)
+    @classmethod
+    def from_dict(cls, data: Any) -> "Header":
+        if isinstance(data, cls):
+            return data
+        ret = cls()
+        for key, value in data.items():
+            ret[key] = value
+        return ret
 
     def __contains__(self, key: str) -> bool:
-        return key in self.__dict__ or key in self.extra
+        if key in self.FIELDS:
+            return getattr(self, key) is not None
+        return (self.extra is not None) and (key in self.extra)
 
     def __getitem__(self, key: str) -> Any:
-        if key in self.__dict__:
-            return self.__dict__[key]
-        elif key in self.extra:
+        if key in self.FIELDS:
+            return getattr(self, key)
+        elif (self.extra is not None) and (key in self.extra):
             return self.extra[key]
         else:
-            raise KeyError(f"key is not existed in NetInfo: {key}")
-    
+            raise KeyError(f"key is not existed in {type(self).__name__}: {key}")
+
     def __setitem__(self, key: str, value: Any) -> None:
-        if key in self.__dict__ and key != "extra":
-            self.__dict__[key] = value
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        elif self.extra is None:
+            self.extra = {key: value}
         else:
             self.extra[key] = value
 
-@dataclass
-class MacInfo:
-    srcMac: str
-    dstMac: str
-    pending_bit: bool
-    retriesLeft: Optional[int] = None
-    seqnum: Optional[int] = None
-    priority: Optional[bool] = None
-    join_metric: Optional[int] = None
-    extra: Dict[str, Any] = field(default_factory=dict)
-    
-    def __contains__(self, key: str) -> bool:
-        return key in self.__dict__ or key in self.extra
-
-    def __getitem__(self, key: str) -> Any:
-        if key in self.__dict__:
-            return self.__dict__[key]
-        elif key in self.extra:
-            return self.extra[key]
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(f"key is not existed in {type(self).__name__}: {key}")
+        elif key in self.FIELDS:
+            setattr(self, key, None)
         else:
-            raise KeyError(f"key is not existed in MacInfo: {key}")
-    
-    def __setitem__(self, key: str, value: Any) -> None:
-        if key in self.__dict__ and key != "extra":
-            self.__dict__[key] = value
+            del self.extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def keys(self) -> list:
+        ret = [name for name in self.FIELDS if getattr(self, name) is not None]
+        if self.extra is not None:
+            ret += list(self.extra.keys())
+        return ret
+
+    def items(self) -> list:
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            key: value.to_dict() if isinstance(value, Header) else value
+            for key, value in self.items()
+        }
+
+    def copy(self) -> "Header":
+        # shallow copy; the values are shared with the original
+        ret = type(self).__new__(type(self))
+        for name in self.FIELDS:
+            setattr(ret, name, getattr(self, name))
+        ret.extra = dict(self.extra) if self.extra is not None else None
+        return ret
+
+    __copy__ = copy
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Header):
+            if type(other) is not type(self):
+                return False
+            for name in self.FIELDS:
+                if getattr(self, name) != getattr(other, name):
+                    return False
+            # an emptied "extra" is the same as none
+            return (self.extra or {}) == (other.extra or {})
+        elif isinstance(other, dict):
+            keys = self.keys()
+            if len(keys) != len(other):
+                return False
+            for key in keys:
+                if (key not in other) or (self[key] != other[key]):
+                    return False
+            return True
         else:
-            self.extra[key] = value
+            return NotImplemented
 
-@dataclass
-class Packet:
-    type: str
-    mac: MacInfo
-    app: Optional[AppInfo] = None
-    net: Optional[NetInfo] = None
-    pkt_len: int = 0
-    extra: Dict[str, Any] = field(default_factory=dict)
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class AppInfo(Header):
+    FIELDS = (
+        "rank",
+        "dodagId",
+        "parent_addr",
+        "appcounter",
+        "timestamp",
+        "msgType",
+        "code",
+        "seqNum",
+        "metadata",
+        "cellOptions",
+        "numCells",
+        "cellList",
+        "payload",
+    )
+    __slots__ = FIELDS
+
+    # RPL
+    rank: Optional[int]
+    dodagId: Optional[str]
+    parent_addr: Optional[str]
+    # application
+    appcounter: Optional[int]
+    timestamp: Optional[int]
+    # 6P
+    msgType: Optional[str]
+    code: Optional[str]
+    seqNum: Optional[int]
+    metadata: Optional[int]
+    cellOptions: Optional[list]
+    numCells: Optional[int]
+    cellList: Optional[list]
+    payload: Optional[Any]
+
+
+class NetInfo(Header):
+    FIELDS = (
+        "srcIp",
+        "dstIp",
+        "hop_limit",
+        "downward",
+        "rank_error",
+        "sourceRoute",
+        "packet_length",
+        "datagram_size",
+        "datagram_tag",
+        "datagram_offset",
+        "original_packet_type",
+    )
+    __slots__ = FIELDS
+
+    srcIp: Optional[str]
+    dstIp: Optional[str]
+    hop_limit: Optional[int]
+    downward: Optional[bool]
+    rank_error: Optional[bool]
+    sourceRoute: Optional[list]
+    packet_length: Optional[int]
+    # 6LoWPAN fragment header
+    datagram_size: Optional[int]
+    datagram_tag: Optional[int]
+    datagram_offset: Optional[int]
+    original_packet_type: Optional[str]
+
+
+class MacInfo(Header):
+    FIELDS = (
+        "srcMac",
+        "dstMac",
+        "pending_bit",
+        "retriesLeft",
+        "seqnum",
+        "priority",
+        "join_metric",
+    )
+    __slots__ = FIELDS
+
+    srcMac: Optional[str]
+    dstMac: Optional[str]
+    pending_bit: Optional[bool]
+    retriesLeft: Optional[int]
+    seqnum: Optional[int]
+    priority: Optional[bool]
+    join_metric: Optional[int]
+
+
+class Packet(Header):
+    FIELDS = ("type", "mac", "app", "net", "pkt_len")
+    __slots__ = FIELDS
+
+    # header class for each field
+    HEADERS = {"mac": MacInfo, "app": AppInfo, "net": NetInfo}
+
+    type: Optional[str]
+    mac: Optional[MacInfo]
+    app: Optional[AppInfo]
+    net: Optional[NetInfo]
+    pkt_len: Optional[int]
 
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "Packet":
-        assert data.get("pkt_len", None) is not None
-
-        mac_data = data.pop("mac", {})
-        
-        mac_defined_fields = {"srcMac", "dstMac", "pending_bit", "retriesLeft", "seqnum", "priority", "join_metric"}
-        mac_extra = {k: v for k, v in mac_data.items() if k not in mac_defined_fields}
-        mac_info = MacInfo(
-            srcMac=mac_data.get("srcMac"),
-            dstMac=mac_data.get("dstMac"),
-            pending_bit=mac_data.get("pending_bit"),
-            retriesLeft=mac_data.get("retriesLeft"),
-            seqnum=mac_data.get("seqnum"),
-            priority=mac_data.get("priority"),
-            join_metric=mac_data.get("join_metric"),
-            extra=mac_extra
-        )
-
-        app_info = None
-        app_data = data.pop("app", None)
-        if app_data:
-            app_extra = {k: v for k, v in app_data.items() if k not in {"rank", "dodagId"}}
-            app_info = AppInfo(
-                rank=app_data.get("rank"),
-                dodagId=app_data.get("dodagId"),
-                extra=app_extra
-            )
-
-        net_info = None
-        net_data = data.pop("net", None)
-        if net_data:
-            net_extra = {k: v for k, v in net_data.items() if k not in {"srcIp", "dstIp", "hop_limit", "downward"}}
-            net_info = NetInfo(
-                srcIp=net_data.get("srcIp"),
-                dstIp=net_data.get("dstIp"),
-                hop_limit=net_data.get("hop_limit"),
-                downward=net_data.get("downward"),
-                extra=net_extra
-            )
-
-        top_level_defined_fields = {"type", "app", "net", "mac", "pkt_len"}
-        top_extra = {k: v for k, v in data.items() if k not in top_level_defined_fields}
-
-        return cls(
-            type=data.get("type"),
-            mac=mac_info,
-            app=app_info,
-            net=net_info,
-            pkt_len=data.get("pkt_len"),
-            extra=top_extra
-        )
-    
-    def __contains__(self, key: str) -> bool:
-        return key in self.__dict__ or key in self.extra
+    def from_dict(cls, data: Any) -> "Packet":
+        if not isinstance(data, cls):
+            assert data.get("pkt_len", None) is not None
+        return super().from_dict(data)
 
-    def __getitem__(self, key: str) -> Any:
-        if key in self.__dict__:
-            return self.__dict__[key]
-        elif key in self.extra:
-            return self.extra[key]
-        else:
-            raise KeyError(f"key is not existed in Packet:{key}")
-    
     def __setitem__(self, key: str, value: Any) -> None:
-        if key in self.__dict__ and key != "extra":
-            self.__dict__[key] = value
-        else:
-            self.extra[key] = value
+        if (key in self.HEADERS) and isinstance(value, dict):
+            value = self.HEADERS[key].from_dict(value)
+        super().__setitem__(key, value)
+
+    def copy(self) -> "Packet":
+        # copy-on-write: the copy has its own MAC and network headers, whose
+        # fields can be updated in place; "app" and the values in the
+        # headers are shared with the original, so they must be replaced
+        # instead of being modified
+        ret = super().copy()
+        if ret.mac is not None:
+            ret.mac = ret.mac.copy()
+        if ret.net is not None:
+            ret.net = ret.net.copy()
+        return ret
+
+    __copy__ = copy
+
+
+def copy_headers(packet):
+    """
+    Return a copy of a packet, which is either a Packet or a dict, having
+    its own MAC and network headers; see Packet.copy()
+    """
+    if isinstance(packet, Packet):
+        return packet.copy()
+    ret = dict(packet)
+    for key in ["mac", "net"]:
+        if ret.get(key) is not None:
+            ret[key] = ret[key].copy()
+    return ret
@@ -0,0 +1,108 @@
+"""
+Address registry
+
+MAC (EUI-64) and IPv6 addresses are carried as strings in packets. Each
+string is parsed once here and interned with its integer value, so that
+the stack can compare and convert addresses as integers without calling
+netaddr every time. Strings are rendered once per address as well.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+import netaddr
+
+# =========================== defines =========================================
+
+EUI64_UL_BIT = 0x0200000000000000
+IPV6_INTERFACE_ID_MASK = 0xFFFFFFFFFFFFFFFF
+
+# string or netaddr object -> int (None for what is not an address)
+_mac_addr_to_int  = {}
+_ipv6_addr_to_int = {}
+# int -> string in the canonical format
+_int_to_mac_addr  = {}
+_int_to_ipv6_addr = {}
+
+# =========================== body ============================================
+
+def mac_addr_to_int(mac_addr):
+    """
+    :param mac_addr: a string or a netaddr.EUI
+    :return: the EUI-64 as int, or None if mac_addr is not an EUI-64
+    """
+    try:
+        return _mac_addr_to_int[mac_addr]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable
+        return None
+
+    if isinstance(mac_addr, netaddr.EUI):
+        value = int(mac_addr)
+    else:
+        try:
+            value = int(netaddr.EUI(mac_addr))
+        except (netaddr.AddrFormatError, TypeError, ValueError):
+            value = None
+    _mac_addr_to_int[mac_addr] = value
+    return value
+
+
+def int_to_mac_addr(value):
+    try:
+        return _int_to_mac_addr[value]
+    except KeyError:
+        mac_addr = str(netaddr.EUI(value))
+        _int_to_mac_addr[value] = mac_addr
+        return mac_addr
+
+
+def ipv6_addr_to_int(ipv6_addr):
+    """
+    :param ipv6_addr: a string or a netaddr.IPAddress
+    :return: the IPv6 address as int, or None if ipv6_addr is not an IPv6
+             address
+    """
+    try:
+        return _ipv6_addr_to_int[ipv6_addr]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable
+        return None
+
+    try:
+        value = int(netaddr.IPAddress(ipv6_addr, 6))
+    except (netaddr.AddrFormatError, TypeError, ValueError):
+        value = None
+    _ipv6_addr_to_int[ipv6_addr] = value
+    return value
+
+
+def int_to_ipv6_addr(value):
+    try:
+        return _int_to_ipv6_addr[value]
+    except KeyError:
+        ipv6_addr = str(netaddr.IPAddress(value, 6))
+        _int_to_ipv6_addr[value] = ipv6_addr
+        return ipv6_addr
+
+
+def mac_addr_int_to_ipv6_addr_int(mac_addr_int, prefix_int):
+    # the interface ID is the EUI-64 with the U/L bit inverted
+    return prefix_int | (mac_addr_int ^ EUI64_UL_BIT)
+
+
+def ipv6_addr_int_to_mac_addr_int(ipv6_addr_int):
+    return (ipv6_addr_int & IPV6_INTERFACE_ID_MASK) ^ EUI64_UL_BIT
+
+
+def is_ipv6_multicast_addr_int(ipv6_addr_int):
+    return (ipv6_addr_int >> 120) == 0xFF
+
+
+def is_ipv6_link_local_addr_int(ipv6_addr_int):
+    # same test as (words[0] & 0xFE80) == 0xFE80
+    return ((ipv6_addr_int >> 112) & 0xFE80) == 0xFE80
@@ -8,16 +8,26 @@ from __future__ import absolute_import
 from builtins import range
 from builtins import object
 from abc import abstractmethod
+import heapq
+import json
+import math
 import random
 
+import numpy
+
 # Mote sub-modules
 
 # Simulator-wide modules
 import SimEngine
 from . import MoteDefines as d
+from SimEngine.SimEngineDefines import SECOND
 
 # =========================== defines =========================================
 
+# added to the seed of the run to seed the stream of the arrivals, which is
+# kept apart from the one of the random module
+APP_RNG_SEED_OFFSET = 1
+
 # =========================== helpers =========================================
 
 # =========================== body ============================================
@@ -53,6 +63,13 @@ class AppBase(object):
 
         # local variables
         self.appcounter = 0
+        self.next_arrival = None # time of the next arrival to be generated
+
+        # the arrivals of all the motes are generated and dispatched by a
+        # single scheduler
+        if self.engine.app_scheduler is None:
+            self.engine.app_scheduler = AppTrafficScheduler(self.engine)
+        self.scheduler  = self.engine.app_scheduler
 
     #======================== public ==========================================
 
@@ -76,8 +93,69 @@ class AppBase(object):
             }
         )
 
+    @classmethod
+    def generate_arrivals(cls, apps, until, rng):
+        """Generate the arrivals of apps until a given time
+
+        The arrivals of all the apps are drawn at once, in chunks of
+        intervals; app.next_arrival is updated to the first arrival at
+        or after "until".
+
+        :param apps: applications of the same class
+        :param until: end of the window, in the simulator time
+        :param rng: numpy.random.Generator
+        :return: a list having an array of arrival times per app
+        """
+        next_arrivals = numpy.array(
+            [app.next_arrival for app in apps],
+            dtype = float
+        )
+        arrivals = [[] for _ in apps]
+        rows = numpy.nonzero(next_arrivals < until)[0]
+        mean_interval = cls._get_mean_interval()
+        while len(rows) > 0:
+            # draw enough intervals to reach "until" on average
+            chunk_size = int(
+                math.ceil((until - next_arrivals[rows].min()) / mean_interval)
+            ) + 1
+            intervals = cls._draw_intervals(rng, (len(rows), chunk_size))
+            offsets = numpy.cumsum(intervals, axis=1)
+            times = numpy.empty_like(intervals)
+            times[:, 0] = next_arrivals[rows]
+            times[:, 1:] = next_arrivals[rows, None] + offsets[:, :-1]
+            for (i, row) in enumerate(rows):
+                num_arrivals = numpy.searchsorted(times[i], until)
+                arrivals[row].append(times[i, :num_arrivals])
+                if num_arrivals < chunk_size:
+                    # the intervals after the next arrival are discarded;
+                    # they are drawn again in the next window
+                    next_arrivals[row] = times[i, num_arrivals]
+                else:
+                    next_arrivals[row] = times[i, -1] + intervals[i, -1]
+            rows = rows[next_arrivals[rows] < until]
+
+        for (app, next_arrival) in zip(apps, next_arrivals):
+            app.next_arrival = float(next_arrival)
+        return [numpy.concatenate(a) if a else numpy.empty(0) for a in arrivals]
+
     #======================== private ==========================================
 
+    @classmethod
+    def _get_mean_interval(cls):
+        raise NotImplementedError()  # abstractmethod
+
+    @classmethod
+    def _draw_intervals(cls, rng, shape):
+        raise NotImplementedError()  # abstractmethod
+
+    def _stop_on_dodag_leave(self):
+        if self.mote.rpl.dodagId == None:
+            # it seems we left the dodag; stop the transmission
+            self.scheduler.stop(self)
+            return True
+        else:
+            return False
+
     def _generate_packet(
             self,
             dstIp,
@@ -198,29 +276,32 @@ class AppPeriodic(AppBase):
         if self.settings.app_pkPeriod == 0:
             return
 
-        if self.sending_first_packet:
-            # compute initial time within the range of [next asn, next asn+pkPeriod]
-            delay = self.settings.tsch_slotDuration + (self.settings.app_pkPeriod * random.random())
-            self.sending_first_packet = False
-        else:
-            # compute random delay
-            assert self.settings.app_pkPeriodVar < 1
-            delay = self.settings.app_pkPeriod * (1 + random.uniform(-self.settings.app_pkPeriodVar, self.settings.app_pkPeriodVar))
-
-        # schedule
-        self.engine.scheduleIn(
-            delay           = delay,
-            cb              = self._send_a_single_packet,
-            uniqueTag       = (
-                u'AppPeriodic',
-                u'scheduled_by_{0}'.format(self.mote.id)
-            ),
-            intraSlotOrder  = d.INTRASLOTORDER_ADMINTASKS,
+        # compute initial time within the range of [next asn, next asn+pkPeriod]
+        delay = self.settings.tsch_slotDuration + (self.settings.app_pkPeriod * random.random())
+        self.sending_first_packet = False
+
+        # the following arrivals are generated by the scheduler
+        self.scheduler.start(self, self.engine.global_time + delay)
+
+    @classmethod
+    def _get_mean_interval(cls):
+        settings = SimEngine.SimSettings.SimSettings()
+        return settings.app_pkPeriod
+
+    @classmethod
+    def _draw_intervals(cls, rng, shape):
+        settings = SimEngine.SimSettings.SimSettings()
+        assert settings.app_pkPeriodVar < 1
+        return settings.app_pkPeriod * (
+            1 + rng.uniform(
+                -settings.app_pkPeriodVar,
+                settings.app_pkPeriodVar,
+                shape
+            )
         )
 
     def _send_a_single_packet(self):
-        if self.mote.rpl.dodagId == None:
-            # it seems we left the dodag; stop the transmission
+        if self._stop_on_dodag_leave():
             self.sending_first_packet = True
             return
 
@@ -228,8 +309,64 @@ class AppPeriodic(AppBase):
             dstIp          = self.mote.rpl.dodagId,
             packet_length  = self.settings.app_pkLength
         )
-        # schedule the next transmission
-        self._schedule_transmission()
+
+class AppPoisson(AppPeriodic):
+    """Send packets following a Poisson process
+
+    Intervals are distributed exponentially with the mean of pkPeriod.
+    """
+
+    def _schedule_transmission(self):
+        assert self.settings.app_pkPeriod >= 0
+        if self.settings.app_pkPeriod == 0:
+            return
+
+        # the process starts now; the scheduler defers an arrival in the
+        # current slot to the next one
+        delay = self._draw_intervals(self.scheduler.rng, None)
+        self.sending_first_packet = False
+
+        self.scheduler.start(self, self.engine.global_time + delay)
+
+    @classmethod
+    def _draw_intervals(cls, rng, shape):
+        settings = SimEngine.SimSettings.SimSettings()
+        return rng.exponential(settings.app_pkPeriod, shape)
+
+class AppTrace(AppPeriodic):
+    """Send packets at the times listed in a trace file
+
+    app_traceFile is a JSON file having a list of times in seconds, from
+    the beginning of the simulation, per mote ID:
+
+        {"1": [10.0, 12.5, 30.0], "2": [11.0]}
+
+    A time before the mote starts sending data is skipped.
+    """
+
+    def __init__(self, mote, **kwargs):
+        super(AppTrace, self).__init__(mote, **kwargs)
+        self.trace = self.scheduler.get_trace(self.mote.id)
+
+    def _schedule_transmission(self):
+        self.sending_first_packet = False
+        index = numpy.searchsorted(self.trace, self.engine.global_time, side='right')
+        if index < len(self.trace):
+            self.scheduler.start(self, float(self.trace[index]))
+
+    @classmethod
+    def generate_arrivals(cls, apps, until, rng):
+        arrivals = []
+        for app in apps:
+            start = numpy.searchsorted(app.trace, app.next_arrival)
+            end = numpy.searchsorted(app.trace, until)
+            arrivals.append(app.trace[start:end])
+            if end < len(app.trace):
+                app.next_arrival = float(app.trace[end])
+            else:
+                # no more arrival
+                app.next_arrival = float('inf')
+        return arrivals
 
 class AppBurst(AppBase):
     """Generate burst traffic to the root at the specified time (only once)
@@ -243,26 +380,222 @@ class AppBurst(AppBase):
     def startSendingData(self):
         if not self.done:
             # schedule app_burstNumPackets packets in app_burstTimestamp
-            self.engine.scheduleIn(
-                delay           = self.settings.app_burstTimestamp,
-                cb              = self._send_burst_packets,
-                uniqueTag       = (
-                    u'AppBurst',
-                    u'scheduled_by_{0}'.format(self.mote.id)
-                ),
-                intraSlotOrder  = d.INTRASLOTORDER_ADMINTASKS,
+            self.scheduler.start(
+                self,
+                self.engine.global_time + self.settings.app_burstTimestamp
             )
             self.done = True
 
+    @classmethod
+    def generate_arrivals(cls, apps, until, rng):
+        settings = SimEngine.SimSettings.SimSettings()
+        arrivals = []
+        for app in apps:
+            if app.next_arrival < until:
+                arrivals.append(
+                    numpy.full(settings.app_burstNumPackets, app.next_arrival)
+                )
+                # only once
+                app.next_arrival = float('inf')
+            else:
+                arrivals.append(numpy.empty(0))
+        return arrivals
+
     #======================== private ==========================================
 
-    def _send_burst_packets(self):
-        if self.mote.rpl.dodagId == None:
+    def _send_a_single_packet(self):
+        if self._stop_on_dodag_leave():
             # we're not part of the network now
             return
 
-        for _ in range(0, self.settings.app_burstNumPackets):
-            self._send_packet(
-                dstIp         = self.mote.rpl.dodagId,
-                packet_length = self.settings.app_pkLength
+        self._send_packet(
+            dstIp         = self.mote.rpl.dodagId,
+            packet_length = self.settings.app_pkLength
+        )
+
+class AppTrafficScheduler(object):
+    """
+    Arrivals of the application packets of all the motes
+
+    Arrivals are generated ahead by windows of app_scheduleWindow
+    slotframes: at the last slot of a window, the arrivals in the next
+    window are generated for all the motes at once, by the
+    generate_arrivals() of their application class. They are put into
+    buckets indexed by ASN; a single event fires the earliest non-empty
+    bucket, calling _send_a_single_packet() of the applications once per
+    arrival, at the beginning of the slot where the arrival falls.
+    """
+
+    def __init__(self, engine):
+
+        # store params
+        self.engine   = engine
+
+        # singletons (quicker access, instead of recreating every time)
+        self.settings = SimEngine.SimSettings.SimSettings()
+
+        # local variables; without a seed applied to the engine, numpy draws
+        # fresh entropy from the OS
+        if self.engine.random_seed is None:
+            self.rng        = numpy.random.default_rng()
+        else:
+            self.rng        = numpy.random.default_rng(
+                self.engine.random_seed + APP_RNG_SEED_OFFSET
+            )
+        self.window_length  = (
+            self.settings.app_scheduleWindow *
+            self.settings.tsch_slotframeLength
+        )
+        assert self.window_length > 0
+        self.window_end_asn = None # None when no application is running
+        self.apps           = {} # applications having arrivals to generate
+        self.pending_asns   = {} # indexed by application
+        self.buckets        = {} # indexed by ASN, {app: num_arrivals}
+        self.asn_heap       = [] # ASNs of self.buckets
+        self.next_asn       = None # ASN of the scheduled dispatch event
+        self.traces         = None # arrival times per mote ID for AppTrace
+
+    # ======================= public ==========================================
+
+    def start(self, app, first_arrival):
+        assert app not in self.apps
+        app.next_arrival = first_arrival
+        self.apps[app] = None
+        if self.window_end_asn is None:
+            # start a window from the next slot
+            self.window_end_asn = self.engine.getAsn() + 1
+            self._action_window()
+        else:
+            self._generate_arrivals([app])
+
+    def stop(self, app):
+        self.apps.pop(app, None)
+        for asn in self.pending_asns.pop(app, []):
+            bucket = self.buckets[asn]
+            del bucket[app]
+            if not bucket:
+                # the ASN stays in self.asn_heap; it is skipped when it comes
+                # on the top
+                del self.buckets[asn]
+        app.next_arrival = None
+
+    def get_trace(self, mote_id):
+        if self.traces is None:
+            with open(self.settings.app_traceFile, u'r') as f:
+                self.traces = dict(
+                    (
+                        int(mote_id),
+                        numpy.sort(numpy.array(times, dtype=float) * SECOND)
+                    )
+                    for (mote_id, times) in json.load(f).items()
+                )
+        return self.traces.get(mote_id, numpy.empty(0))
+
+    def __len__(self):
+        return sum(sum(bucket.values()) for bucket in self.buckets.values())
+
+    # ======================= private =========================================
+
+    def _generate_arrivals(self, apps):
+        until = self.engine.asn_to_global_time(
+            self.window_end_asn,
+            self.engine.default_network_id
+        )
+        # an arrival in the current slot is deferred to the next one
+        min_asn = self.engine.getAsn() + 1
+        start_time = self.engine.asn_to_global_time(
+            0,
+            self.engine.default_network_id
+        )
+
+        # the applications of the same class are processed in a batch
+        apps_by_class = {}
+        for app in apps:
+            apps_by_class.setdefault(type(app), []).append(app)
+        for (app_class, class_apps) in apps_by_class.items():
+            arrivals = app_class.generate_arrivals(class_apps, until, self.rng)
+            for (app, times) in zip(class_apps, arrivals):
+                if app.next_arrival == float('inf'):
+                    # no more arrival to generate
+                    del self.apps[app]
+                if len(times) == 0:
+                    continue
+                asns = numpy.maximum(
+                    numpy.floor(
+                        (times - start_time) / self.settings.tsch_slotDuration
+                    ).astype(numpy.int64),
+                    min_asn
+                )
+                (asns, counts) = numpy.unique(asns, return_counts=True)
+                for (asn, count) in zip(asns.tolist(), counts.tolist()):
+                    self._add(app, asn, count)
+
+    def _discard_pending_asn(self, app, asn):
+        pending_asns = self.pending_asns[app]
+        pending_asns.discard(asn)
+        if not pending_asns:
+            del self.pending_asns[app]
+
+    def _add(self, app, asn, count):
+        if asn not in self.buckets:
+            self.buckets[asn] = {}
+            heapq.heappush(self.asn_heap, asn)
+        bucket = self.buckets[asn]
+        bucket[app] = bucket.get(app, 0) + count
+        self.pending_asns.setdefault(app, set()).add(asn)
+
+        if (self.next_asn is None) or (asn < self.next_asn):
+            self._schedule(asn)
+
+    def _schedule(self, asn):
+        self.next_asn = asn
+        self.engine.scheduleAtAsn(
+            asn            = asn,
+            cb             = self._action_dispatch,
+            uniqueTag      = (u'AppTrafficScheduler', u'_action_dispatch'),
+            intraSlotOrder = d.INTRASLOTORDER_ADMINTASKS,
+        )
+
+    def _schedule_next(self):
+        # drop the ASNs of the buckets emptied by stop()
+        while self.asn_heap and (self.asn_heap[0] not in self.buckets):
+            heapq.heappop(self.asn_heap)
+        if self.asn_heap:
+            self._schedule(self.asn_heap[0])
+
+    def _action_window(self):
+        # generate the arrivals in the next window
+        self.window_end_asn += self.window_length
+        self._generate_arrivals(list(self.apps))
+
+        if self.apps:
+            self.engine.scheduleAtAsn(
+                asn            = self.window_end_asn - 1,
+                cb             = self._action_window,
+                uniqueTag      = (u'AppTrafficScheduler', u'_action_window'),
+                intraSlotOrder = d.INTRASLOTORDER_ADMINTASKS,
             )
+        else:
+            self.window_end_asn = None
+
+    def _action_dispatch(self):
+        # self.next_asn stays until the end so that arrivals added by an
+        # application started here, which go into later buckets, don't
+        # schedule the event before the pending buckets. An application
+        # stopped here is skipped.
+        asn = self.next_asn
+        bucket = self.buckets.get(asn, {})
+        while bucket:
+            # in the order the applications were added
+            app = next(iter(bucket))
+            count = bucket.pop(app)
+            self._discard_pending_asn(app, asn)
+            for _ in range(count):
+                app._send_a_single_packet()
+                if app.next_arrival is None:
+                    # stopped
+                    break
+        self.buckets.pop(asn, None)
+
+        self.next_asn = None
+        self._schedule_next()
@@ -10,6 +10,8 @@ from __future__ import absolute_import
 import bisect
 from builtins import object
 
+import numpy
+
 # Mote sub-modules
 from SimEngine.SimEngineDefines import MILLISECOND, SECOND
 from . import MoteDefines as d
@@ -51,21 +53,12 @@ class Radio(object):
         self.noisepower                     = -105                          # dBm
         self.state                          = d.RADIO_STATE_OFF
         self.channel                        = None
-        self.stats = {
-            u'last_updated'  : 0,
-            u'idle_listen'   : 0,
-            u'tx_data_rx_ack': 0,
-            u'tx_data'       : 0,
-            u'rx_data_tx_ack': 0,
-            u'rx_data'       : 0,
-            u'sleep'         : 0,
-        }
-        self.log_stats_interval_asn = int(
-            float(self.settings.radio_stats_log_period_s * SECOND) /
-            self.settings.tsch_slotDuration
+        # the counters are kept by the engine for all the motes
+        if self.engine.radio_stats is None:
+            self.engine.radio_stats = RadioStats(self.engine)
+        self.stats                          = (
+            self.engine.radio_stats.add_mote(self.mote.id)
         )
-        if self.log_stats_interval_asn > 0:
-            self._schedule_log_stats()
 
     # ======================= public ==========================================
 
@@ -123,7 +116,7 @@ class Radio(object):
 
 
     def startRx(self, channel):
-        assert channel in d.TSCH_HOPPING_SEQUENCE
+        assert channel in d.TSCH_CHANNELS
         assert self.state != d.RADIO_STATE_LISTENING
 
         self.channel = channel
@@ -179,19 +172,10 @@ class Radio(object):
         return is_acked
 
     def _update_stats(self, stats_type):
-        self.stats[u'sleep'] += (
-            self.engine.getAsn() - self.stats[u'last_updated'] - 1
-        )
-        self.stats[stats_type] += 1
-        self.stats[u'last_updated'] = self.engine.getAsn()
-
-    def _schedule_log_stats(self):
-        next_log_asn = self.engine.getAsn() + self.log_stats_interval_asn
-        self.engine.scheduleAtAsn(
-            asn = next_log_asn,
-            cb = self._log_stats,
-            uniqueTag = (self.mote.id, u'log_radio_stats'),
-            intraSlotOrder = d.INTRASLOTORDER_ADMINTASKS,
+        self.engine.radio_stats.update(
+            self.mote.id,
+            stats_type,
+            self.engine.getAsn()
         )
 
     def _log_stats(self):
@@ -208,5 +192,134 @@ class Radio(object):
             }
         )
 
+
+class RadioStats(object):
+    """
+    Radio activity counters of all the motes
+
+    The counters are stored in a NumPy array having one row per mote and
+    one column per type of activity (STATS_TYPES). Every
+    radio_stats_log_period_s, a single event logs the counters of all the
+    motes, together with the charge they have consumed, in one
+    LOG_RADIO_STATS_ALL record.
+    """
+
+    STATS_TYPES = [
+        u'idle_listen',
+        u'tx_data_rx_ack',
+        u'tx_data',
+        u'rx_data_tx_ack',
+        u'rx_data',
+        u'sleep',
+    ]
+    STATS_INDEX = dict([(t, i) for (i, t) in enumerate(STATS_TYPES)])
+    # charge consumed per slot of each type of activity, in uC
+    CHARGES_uC  = numpy.array([
+        d.CHARGE_IdleListen_uC,
+        d.CHARGE_TxDataRxAck_uC,
+        d.CHARGE_TxData_uC,
+        d.CHARGE_RxDataTxAck_uC,
+        d.CHARGE_RxData_uC,
+        d.CHARGE_Sleep_uC,
+    ])
+
+    def __init__(self, engine, num_motes=0):
+
+        # store params
+        self.engine   = engine
+
+        # singletons (quicker access, instead of recreating every time)
+        self.settings = SimEngine.SimSettings.SimSettings()
+        self.log      = SimEngine.SimLog.SimLog().log
+
+        # local variables
+        self.counters     = numpy.zeros(
+            (num_motes, len(self.STATS_TYPES)),
+            dtype = numpy.int64
+        )
+        self.last_updated = numpy.zeros(num_motes, dtype=numpy.int64)
+        self.log_stats_interval_asn = int(
+            float(self.settings.radio_stats_log_period_s * SECOND) /
+            self.settings.tsch_slotDuration
+        )
+        if self.log_stats_interval_asn > 0:
+            self._schedule_log_stats()
+
+    # ======================= public ==========================================
+
+    def add_mote(self, mote_id):
+        num_motes = len(self.last_updated)
+        if mote_id >= num_motes:
+            # grow the arrays
+            self.counters = numpy.vstack([
+                self.counters,
+                numpy.zeros(
+                    (mote_id + 1 - num_motes, len(self.STATS_TYPES)),
+                    dtype = numpy.int64
+                )
+            ])
+            self.last_updated = numpy.concatenate([
+                self.last_updated,
+                numpy.zeros(mote_id + 1 - num_motes, dtype=numpy.int64)
+            ])
+        return MoteRadioStats(self, mote_id)
+
+    def update(self, mote_id, stats_type, asn):
+        row = self.counters[mote_id]
+        row[self.STATS_INDEX[u'sleep']] += asn - self.last_updated[mote_id] - 1
+        row[self.STATS_INDEX[stats_type]] += 1
+        self.last_updated[mote_id] = asn
+
+    def get_charge(self):
+        """
+        :return: the charge consumed by each mote, in uC
+        :rtype: numpy.ndarray
+        """
+        return self.counters.dot(self.CHARGES_uC)
+
+    # ======================= private =========================================
+
+    def _schedule_log_stats(self):
+        self.engine.scheduleAtAsn(
+            asn            = self.engine.getAsn() + self.log_stats_interval_asn,
+            cb             = self._log_stats,
+            uniqueTag      = (u'RadioStats', u'_log_stats'),
+            intraSlotOrder = d.INTRASLOTORDER_ADMINTASKS,
+        )
+
+    def _log_stats(self):
+        content = {u'mote_ids': list(range(len(self.last_updated)))}
+        for (i, stats_type) in enumerate(self.STATS_TYPES):
+            content[stats_type] = self.counters[:, i].tolist()
+        content[u'charge'] = self.get_charge().tolist()
+        self.log(SimEngine.SimLog.LOG_RADIO_STATS_ALL, content)
+
         # schedule next
         self._schedule_log_stats()
+
+
+class MoteRadioStats(object):
+    """dict-like view of the counters of a mote in RadioStats"""
+
+    def __init__(self, radio_stats, mote_id):
+        self.radio_stats = radio_stats
+        self.mote_id     = mote_id
+
+    def __getitem__(self, stats_type):
+        if stats_type == u'last_updated':
+            return int(self.radio_stats.last_updated[self.mote_id])
+        return int(
+            self.radio_stats.counters[
+                self.mote_id,
+                RadioStats.STATS_INDEX[stats_type]
+            ]
+        )
+
+    def __setitem__(self, stats_type, value):
+        if stats_type == u'last_updated':
+            self.radio_stats.last_updated[self.mote_id] = value
+        else:
+            self.radio_stats.counters[
+                self.mote_id,
+                RadioStats.STATS_INDEX[stats_type]
+            ] = value
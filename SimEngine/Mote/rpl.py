@@ -16,19 +16,19 @@ from __future__ import division
 from builtins import str
 from builtins import object
 import traceback
+import heapq
 from past.utils import old_div
 import random
 import math
 import sys
 
-import netaddr
-import numpy
-
 # Mote sub-modules
 
 # Simulator-wide modules
 import SimEngine
 from . import MoteDefines as d
+from . import addr
+from .NetDefines import Packet, AppInfo, NetInfo
 from .trickle_timer import TrickleTimer
 from SimEngine.SimEngineDefines import SECOND
 # =========================== defines =========================================
@@ -67,6 +67,8 @@ class Rpl(object):
             callback       = self._send_DIO
         )
         self.parentChildfromDAOs       = {}      # dictionary containing parents of each node
+        self.childrenfromDAOs          = {}      # dictionary containing children of each node
+        self._source_routes            = {}      # cached source routes, indexed by destination
         self._tx_stat                  = {}      # indexed by mote_id
         self.dis_mode = self._get_dis_mode()
 
@@ -84,7 +86,20 @@ class Rpl(object):
             return int(old_div(self.of.rank, d.RPL_MINHOPRANKINCREASE))
 
     def addParentChildfromDAOs(self, parent_addr, child_addr):
+        old_parent_addr = self.parentChildfromDAOs.get(child_addr, None)
+        if (child_addr in self.parentChildfromDAOs) and (old_parent_addr == parent_addr):
+            # nothing changes
+            return
+
         self.parentChildfromDAOs[child_addr] = parent_addr
+        if child_addr in self.childrenfromDAOs.get(old_parent_addr, ()):
+            self.childrenfromDAOs[old_parent_addr].remove(child_addr)
+            if len(self.childrenfromDAOs[old_parent_addr]) == 0:
+                del self.childrenfromDAOs[old_parent_addr]
+        self.childrenfromDAOs.setdefault(parent_addr, set()).add(child_addr)
+
+        # the source routes to the subtree of the child are not valid anymore
+        self._invalidate_source_routes(child_addr)
 
     def getPreferredParent(self):
         # return the MAC address of the current preferred parent
@@ -290,18 +305,18 @@ class Rpl(object):
             rank = self.of.rank
 
         # create
-        newDIO = {
-            u'type':              d.PKT_TYPE_DIO,
-            u'app': {
-                u'rank':          rank,
-                u'dodagId':       self.dodagId,
-            },
-            u'net': {
-                u'srcIp':         self.mote.get_ipv6_link_local_addr(),
-                u'dstIp':         dstIp,
-            },
-            u'pkt_len':           d.PKT_LEN_DIO
-        }
+        newDIO = Packet(
+            type    = d.PKT_TYPE_DIO,
+            app     = AppInfo(
+                rank    = rank,
+                dodagId = self.dodagId,
+            ),
+            net     = NetInfo(
+                srcIp   = self.mote.get_ipv6_link_local_addr(),
+                dstIp   = dstIp,
+            ),
+            pkt_len = d.PKT_LEN_DIO
+        )
         return newDIO
 
     def action_receiveDIO(self, packet):
@@ -435,9 +450,12 @@ class Rpl(object):
         if self.mote.clear_to_send_EBs_DATA()==False:
             return
 
-        parent_mac_addr = netaddr.EUI(self.of.get_preferred_parent())
-        prefix = netaddr.IPAddress(d.IPV6_DEFAULT_PREFIX)
-        parent_ipv6_addr = str(parent_mac_addr.ipv6(prefix))
+        parent_ipv6_addr = addr.int_to_ipv6_addr(
+            addr.mac_addr_int_to_ipv6_addr_int(
+                addr.mac_addr_to_int(self.of.get_preferred_parent()),
+                addr.ipv6_addr_to_int(d.IPV6_DEFAULT_PREFIX)
+            )
+        )
 
         # create
         newDAO = {
@@ -493,26 +511,56 @@ class Rpl(object):
 
     def computeSourceRoute(self, dst_addr):
         assert self.mote.dagRoot
-        try:
-            sourceRoute = []
-            cur_addr = dst_addr
-            while self.mote.is_my_ipv6_addr(cur_addr) is False:
-                sourceRoute += [cur_addr]
-                cur_addr     = self.parentChildfromDAOs[cur_addr]
-                if cur_addr in sourceRoute:
-                    # routing loop is detected; cannot return an effective
-                    # source-routing header
-                    returnVal = None
-                    break
-        except KeyError:
-            returnVal = None
+        if dst_addr not in self._source_routes:
+            self._update_source_routes(dst_addr)
+        sourceRoute = self._source_routes[dst_addr]
+        if sourceRoute is None:
+            return None
         else:
-            # reverse (so goes from source to destination)
-            sourceRoute.reverse()
-
-            returnVal = sourceRoute
-
-        return returnVal
+            return list(sourceRoute)
+
+    def _update_source_routes(self, dst_addr):
+        # go up toward the root until we find a node whose route is known
+        path     = []
+        visited  = set()
+        cur_addr = dst_addr
+        while cur_addr not in self._source_routes:
+            if self.mote.is_my_ipv6_addr(cur_addr):
+                sourceRoute = ()
+                self._source_routes[cur_addr] = sourceRoute
+                break
+            elif cur_addr in visited:
+                # routing loop is detected; cannot return an effective
+                # source-routing header
+                sourceRoute = None
+                break
+            elif cur_addr not in self.parentChildfromDAOs:
+                # no DAO from this node
+                sourceRoute = None
+                self._source_routes[cur_addr] = sourceRoute
+                break
+            path.append(cur_addr)
+            visited.add(cur_addr)
+            cur_addr = self.parentChildfromDAOs[cur_addr]
+        else:
+            sourceRoute = self._source_routes[cur_addr]
+
+        # cache the routes to all the nodes on the way down to dst_addr
+        for addr in reversed(path):
+            if sourceRoute is not None:
+                sourceRoute = sourceRoute + (addr,)
+            self._source_routes[addr] = sourceRoute
+
+    def _invalidate_source_routes(self, addr):
+        stack   = [addr]
+        visited = set()
+        while stack:
+            addr = stack.pop()
+            if addr in visited:
+                continue
+            visited.add(addr)
+            self._source_routes.pop(addr, None)
+            stack.extend(self.childrenfromDAOs.get(addr, ()))
 
 
 class RplOFBase(object):
@@ -577,7 +625,16 @@ class RplOF0(RplOFBase):
 
     def __init__(self, rpl):
         super(RplOF0, self).__init__(rpl)
-        self.neighbors = []
+        # neighbors are indexed by MAC address; dict keeps the order in
+        # which they were added
+        self.neighbors = {}
+        # min-heap of (rank, order, mac_addr) on the computed rank of the
+        # neighbors. an entry is valid only while it is the one registered
+        # in _parent_heap_entries; the others are discarded lazily
+        self._parent_heap = []
+        self._parent_heap_entries = {}
+        self._neighbor_order = {}
+        self._num_added_neighbors = 0
 
     @property
     def parents(self):
@@ -585,26 +642,20 @@ class RplOF0(RplOFBase):
         # least. See section 3.5.1 of RFC 6550:
         #    "MinHopRankIncrease is the minimum increase in Rank between a node
         #     and any of its DODAG parents."
-        _parents = []
-        for neighbor in self.neighbors:
-            if self._calculate_rank(neighbor) is None:
-                # skip this one
-                continue
-
+        return [
+            neighbor for mac_addr, neighbor in self.neighbors.items()
             if (
-                    (self.rank is None)
-                    or
-                    (
-                        d.RPL_MINHOPRANKINCREASE <=
-                        self.rank - neighbor[u'advertised_rank']
-                    )
-                ):
-                _parents.append(neighbor)
-
-        return _parents
+                (mac_addr in self._parent_heap_entries)
+                and
+                self._is_parent(neighbor)
+            )
+        ]
 
     def reset(self):
-        self.neighbors = []
+        self.neighbors = {}
+        self._parent_heap = []
+        self._parent_heap_entries = {}
+        self._neighbor_order = {}
         super(RplOF0, self).reset()
 
     def update(self, dio):
@@ -698,18 +749,18 @@ class RplOF0(RplOFBase):
             u'numTxAck': 0,
             u'etx': self.ETX_DEFAULT
         }
-        self.neighbors.append(neighbor)
+        self.neighbors[mac_addr] = neighbor
+        self._neighbor_order[mac_addr] = self._num_added_neighbors
+        self._num_added_neighbors += 1
         self._update_neighbor_rank_increase(neighbor)
         return neighbor
 
     def _find_neighbor(self, mac_addr):
-        for neighbor in self.neighbors:
-            if neighbor[u'mac_addr'] == mac_addr:
-                return neighbor
-        return None
+        return self.neighbors.get(mac_addr)
 
     def _update_neighbor_rank(self, neighbor, new_advertised_rank):
         neighbor[u'advertised_rank'] = new_advertised_rank
+        self._update_parent_heap(neighbor)
 
     def _update_neighbor_rank_increase(self, neighbor):
         if neighbor[u'etx'] > self.UPPER_LIMIT_OF_ACCEPTABLE_ETX:
@@ -727,10 +778,71 @@ class RplOF0(RplOFBase):
             # ETX is 3, which is defined in Section 5.1.1 of RFC 8180
             assert step_of_rank <= self.MAXIMUM_STEP_OF_RANK
             neighbor[u'rank_increase'] = step_of_rank * d.RPL_MINHOPRANKINCREASE
+        self._update_parent_heap(neighbor)
 
         if neighbor == self.preferred_parent:
             self.rank = self._calculate_rank(self.preferred_parent)
 
+    def _update_parent_heap(self, neighbor):
+        # called whenever advertised_rank or rank_increase of a neighbor
+        # changes
+        mac_addr = neighbor[u'mac_addr']
+        rank = self._calculate_rank(neighbor)
+        entry = self._parent_heap_entries.get(mac_addr)
+        if (entry is not None) and (entry[0] == rank):
+            # no change
+            return
+
+        if rank is None:
+            # this neighbor cannot be a parent; its entry, if any, gets stale
+            self._parent_heap_entries.pop(mac_addr, None)
+        else:
+            entry = (rank, self._neighbor_order[mac_addr], mac_addr)
+            self._parent_heap_entries[mac_addr] = entry
+            heapq.heappush(self._parent_heap, entry)
+
+        if len(self._parent_heap) > 2 * len(self._parent_heap_entries) + 8:
+            # too many stale entries; rebuild the heap
+            self._parent_heap = list(self._parent_heap_entries.values())
+            heapq.heapify(self._parent_heap)
+
+    def _is_parent(self, neighbor):
+        return (
+            (self.rank is None)
+            or
+            (
+                d.RPL_MINHOPRANKINCREASE <=
+                self.rank - neighbor[u'advertised_rank']
+            )
+        )
+
+    def _find_best_parent(self):
+        # return the parent having the lowest rank, the one added first
+        # among parents of the same rank, or None
+        heap = self._parent_heap
+        while heap and (heap[0] is not self._parent_heap_entries.get(heap[0][2])):
+            heapq.heappop(heap)
+        if not heap:
+            return None
+
+        rank, _, mac_addr = heap[0]
+        if (self.rank is None) or (rank <= self.rank):
+            # a neighbor whose rank is not higher than ours has an
+            # advertised rank lower than ours by MinHopRankIncrease at
+            # least; it is a parent
+            return self.neighbors[mac_addr]
+
+        # all the neighbors would give us a higher rank; some of them may
+        # not be parents
+        candidates = [
+            entry for entry in self._parent_heap_entries.values()
+            if self._is_parent(self.neighbors[entry[2]])
+        ]
+        if candidates:
+            return self.neighbors[min(candidates)[2]]
+        else:
+            return None
+
     def _calculate_rank(self, neighbor):
         if (
                 (neighbor is None)
@@ -775,13 +887,11 @@ class RplOF0(RplOFBase):
             # the parent. otherwise, we may create a routing loop.
             return
 
-        try:
-            candidate = min(self.parents, key=self._calculate_rank)
-            new_rank = self._calculate_rank(candidate)
-        except ValueError:
-            # self.parents is empty
-            candidate = None
+        candidate = self._find_best_parent()
+        if candidate is None:
             new_rank = None
+        else:
+            new_rank = self._parent_heap_entries[candidate[u'mac_addr']][0]
 
         if new_rank is None:
             # we don't have any available parent
@@ -992,13 +1102,9 @@ class RplOFBestLinkPDR(RplOF0):
         return ret_val
 
     def _find_mote_id(self, mac_addr):
-        mote_id = None
-        for mote in self.engine.motes:
-            if mote.is_my_mac_addr(mac_addr):
-                mote_id = mote.id
-                break
-        assert mote_id is not None
-        return mote_id
+        mote = self.engine.get_mote_by_mac_addr(mac_addr)
+        assert mote is not None
+        return mote.id
 
     def _update_link_quality_of_neighbors(self):
         for neighbor in self.neighbors:
@@ -1058,27 +1164,21 @@ class RplOFBestLinkPDR(RplOF0):
 
     def _update_mean_link_pdr(self, neighbor):
         # we will calculate the mean PDR value over all the available
-        # channels and both of the directions
-        neighbor[u'mean_link_pdr'] = numpy.mean([
-            self.connectivity.get_pdr(src_id, dst_id, channel)
-            for channel in self.mote.tsch.hopping_sequence
-            for src_id, dst_id in [
-                (self.mote.id, neighbor[u'mote_id']),
-                (neighbor[u'mote_id'], self.mote.id)
-            ]
-        ])
+        # channels and both of the directions; the means over the channels
+        # are maintained by the connectivity matrix
+        neighbor[u'mean_link_pdr'] = (
+            self.connectivity.get_mean_pdr(self.mote.id, neighbor[u'mote_id'])
+            +
+            self.connectivity.get_mean_pdr(neighbor[u'mote_id'], self.mote.id)
+        ) / 2
 
     def _update_mean_link_rssi(self, neighbor):
         # we will calculate the mean RSSI value over all the available
         # channels.
-        neighbor[u'mean_link_rssi'] = numpy.mean([
-            self.connectivity.get_rssi(
-                src_id = self.mote.id,
-                dst_id = neighbor[u'mote_id'],
-                channel = channel
-            )
-            for channel in self.mote.tsch.hopping_sequence
-        ])
+        neighbor[u'mean_link_rssi'] = self.connectivity.get_mean_rssi(
+            src_id = self.mote.id,
+            dst_id = neighbor[u'mote_id']
+        )
 
     def _find_best_parent(self):
         # find a parent which brings the best rank for us. use mote_id
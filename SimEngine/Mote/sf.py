@@ -7,10 +7,9 @@ import random
 import sys
 from abc import abstractmethod
 
-import netaddr
-
 import SimEngine
 from . import MoteDefines as d
+from . import addr
 from . import sixp
 
 # =========================== defines =========================================
@@ -29,6 +28,11 @@ class SchedulingFunctionBase(object):
 
     SLOTFRAME_HANDLE = 0
 
+    # when True, TSCH reports unused cells in a batch per slotframe with
+    # indication_cells_elapsed() instead of one by one; the SF still
+    # accounts them one by one
+    batch_cell_accounting = False
+
     def __init__(self, mote):
 
         # store params
@@ -75,6 +79,16 @@ class SchedulingFunctionBase(object):
     def indication_rx_cell_elapsed(self, cell, received_packet):
         raise NotImplementedError() # abstractmethod
 
+    def indication_cells_elapsed(self, tx_cells, rx_cells):
+        """[from TSCH] cells passed without being used during the last
+        slotframe; called at the beginning of every slotframe when
+        batch_cell_accounting is True.
+        """
+        for cell in tx_cells:
+            self.indication_tx_cell_elapsed(cell, sent_packet=None)
+        for cell in rx_cells:
+            self.indication_rx_cell_elapsed(cell, received_packet=None)
+
     @abstractmethod
     def indication_parent_change(self, old_parent, new_parent):
         """
@@ -153,6 +167,11 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         self.rx_cell_utilization  = 0
         self.locked_slots         = set([]) # slots in on-going ADD transactions
         self.retry_count          = {}      # indexed by MAC address
+        # when batch_cell_accounting is True, TSCH reports the unused cells
+        # once per slotframe, in indication_cells_elapsed(); this saves a
+        # call per unused cell, not the utilization checks, which are made
+        # for every cell counted as in the per-cell mode
+        self.batch_cell_accounting = self.settings.sf_batch_cell_accounting
 
     # ======================= public ==========================================
 
@@ -209,27 +228,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 (cell.options == [d.CELLOPTION_TX])
             ):
             self._update_cell_counters(self.TX_CELL_OPT, bool(sent_packet))
-            # adapt number of cells if necessary
-            if d.MSF_MAX_NUMCELLS <= self.num_tx_cells_elapsed:
-                tx_cell_utilization = (
-                    self.num_tx_cells_used /
-                    float(self.num_tx_cells_elapsed)
-                )
-                if tx_cell_utilization != self.tx_cell_utilization:
-                    self.log(
-                        SimEngine.SimLog.LOG_MSF_TX_CELL_UTILIZATION,
-                        {
-                            u'_mote_id'    : self.mote.id,
-                            u'neighbor'    : preferred_parent,
-                            u'value'       : u'{0}% -> {1}%'.format(
-                                int(self.tx_cell_utilization * 100),
-                                int(tx_cell_utilization * 100)
-                            )
-                        }
-                    )
-                    self.tx_cell_utilization = tx_cell_utilization
-                self._adapt_to_traffic(preferred_parent, self.TX_CELL_OPT)
-                self._reset_cell_counters(self.TX_CELL_OPT)
+            self._check_tx_cell_utilization(preferred_parent)
 
     def indication_rx_cell_elapsed(self, cell, received_packet):
         preferred_parent = self.mote.rpl.getPreferredParent()
@@ -272,6 +271,51 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 # on its viewpoint. Remove them now.
                 self._clear_cells(received_packet[u'mac'][u'srcMac'])
 
+    def indication_cells_elapsed(self, tx_cells, rx_cells):
+        preferred_parent = self.mote.rpl.getPreferredParent()
+        if not preferred_parent:
+            # nothing to do
+            return
+
+        # count the cells in the same way as indication_tx_cell_elapsed()
+        # and indication_rx_cell_elapsed() do for unused cells; a counter
+        # reaching MSF_MAX_NUMCELLS closes its window right away
+        for cell in tx_cells:
+            if (
+                    (cell.mac_addr == preferred_parent)
+                    and
+                    (cell.options == [d.CELLOPTION_TX])
+                ):
+                self.num_tx_cells_elapsed += 1
+                self._check_tx_cell_utilization(preferred_parent)
+
+        count_autonomous_rx_cells = None
+        for cell in rx_cells:
+            if (
+                    (cell.mac_addr == preferred_parent)
+                    and
+                    (cell.options == [d.CELLOPTION_RX])
+                ):
+                counted = True
+            elif (
+                    (cell.mac_addr == None)
+                    and
+                    (
+                        cell.slotframe.slotframe_handle ==
+                        self.SLOTFRAME_HANDLE_AUTONOMOUS_CELLS
+                    )
+                ):
+                if count_autonomous_rx_cells is None:
+                    count_autonomous_rx_cells = not self.get_negotiated_rx_cells(
+                        preferred_parent
+                    )
+                counted = count_autonomous_rx_cells
+            else:
+                counted = False
+            if counted:
+                self.num_rx_cells_elapsed += 1
+                self._check_rx_cell_utilization(preferred_parent)
+
     def indication_parent_change(self, old_parent, new_parent):
         assert old_parent != new_parent
 
@@ -507,12 +551,38 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
     def _handle_rx_cell_elapsed_event(self, used_by_parent):
         preferred_parent = self.mote.rpl.getPreferredParent()
         self._update_cell_counters(self.RX_CELL_OPT, used_by_parent)
+        self._check_rx_cell_utilization(preferred_parent)
+
+    def _check_tx_cell_utilization(self, preferred_parent):
+        # adapt number of cells if necessary
+        if d.MSF_MAX_NUMCELLS <= self.num_tx_cells_elapsed:
+            tx_cell_utilization = (
+                self.num_tx_cells_used /
+                float(self.num_tx_cells_elapsed)
+            )
+            if tx_cell_utilization != self.tx_cell_utilization:
+                self.log(
+                    SimEngine.SimLog.LOG_MSF_TX_CELL_UTILIZATION,
+                    {
+                        u'_mote_id'    : self.mote.id,
+                        u'neighbor'    : preferred_parent,
+                        u'value'       : u'{0}% -> {1}%'.format(
+                            int(self.tx_cell_utilization * 100),
+                            int(tx_cell_utilization * 100)
+                        )
+                    }
+                )
+                self.tx_cell_utilization = tx_cell_utilization
+            self._adapt_to_traffic(preferred_parent, self.TX_CELL_OPT)
+            self._reset_cell_counters(self.TX_CELL_OPT)
+
+    def _check_rx_cell_utilization(self, preferred_parent):
         # adapt number of cells if necessary
-        rx_cell_utilization = (
-            self.num_rx_cells_used /
-            float(self.num_rx_cells_elapsed)
-        )
         if d.MSF_MAX_NUMCELLS <= self.num_rx_cells_elapsed:
+            rx_cell_utilization = (
+                self.num_rx_cells_used /
+                float(self.num_rx_cells_elapsed)
+            )
             if rx_cell_utilization != self.rx_cell_utilization:
                 self.log(
                     SimEngine.SimLog.LOG_MSF_RX_CELL_UTILIZATION,
@@ -750,30 +820,33 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         self._add_cells(neighbor, dst_cell_list, cell_options)
         self._delete_cells(neighbor, src_cell_list, cell_options)
 
-    def _get_available_slots(self):
-        return list(
-            set(self.mote.tsch.get_available_slots(self.SLOTFRAME_HANDLE_NEGOTIATED_CELLS)) -
-            self.locked_slots
+    def _is_available_slot(self, slot_offset):
+        return (
+            (slot_offset not in self.locked_slots)
+            and
+            self.mote.tsch.is_available_slot(
+                slot_offset,
+                self.SLOTFRAME_HANDLE_NEGOTIATED_CELLS
+            )
         )
 
     def _create_available_cell_list(self, cell_list_len):
-        available_slots = self._get_available_slots()
-        # remove slot offset 0 that is reserved for the minimal shared
-        # cell
-        if 0 in available_slots:
-            available_slots.remove(0)
-
-        # remove the slot offset used for the autonomous RX cell
         autonomous_rx_cell = self.get_autonomous_rx_cell()
         assert autonomous_rx_cell
-        if autonomous_rx_cell.slot_offset in available_slots:
-            available_slots.remove(autonomous_rx_cell.slot_offset)
 
-        if len(available_slots) < cell_list_len:
-            # we don't have enough available cells; no cell is selected
-            selected_slots = []
-        else:
-            selected_slots = random.sample(available_slots, cell_list_len)
+        # exclude slot offset 0 that is reserved for the minimal shared
+        # cell and the slot offset used for the autonomous RX cell
+        excluded_slots = self.locked_slots.union(
+            [0, autonomous_rx_cell.slot_offset]
+        )
+
+        # we get [] when we don't have enough available cells; no cell is
+        # selected then
+        selected_slots = self.mote.tsch.sample_available_slots(
+            cell_list_len,
+            excluded_slots,
+            self.SLOTFRAME_HANDLE_NEGOTIATED_CELLS
+        )
 
         cell_list = []
         for slot_offset in selected_slots:
@@ -912,11 +985,9 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         slots_in_cell_list = set(
             [c[u'slotOffset'] for c in proposed_cells]
         )
-        available_slots  = list(
-            slots_in_cell_list.intersection(
-                set(self._get_available_slots())
-            )
-        )
+        available_slots  = [
+            s for s in slots_in_cell_list if self._is_available_slot(s)
+        ]
 
         # prepare cell_list
         candidate_cells = [
@@ -1300,18 +1371,12 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 (num_cells <= len(candidate_cells))
             ):
             # find available cells in the received candidate cell list
-            slots_in_slotframe = set(range(0, self.settings.tsch_slotframeLength))
-            slots_in_use       = set(
-                self.mote.tsch.get_busy_slots(self.SLOTFRAME_HANDLE_NEGOTIATED_CELLS)
-            )
             candidate_slots    = set(
                 [c[u'slotOffset'] for c in candidate_cells]
             )
-            available_slots    = list(
-                candidate_slots.intersection(
-                    set(self._get_available_slots())
-                )
-            )
+            available_slots    = [
+                s for s in candidate_slots if self._is_available_slot(s)
+            ]
 
             code = d.SIXP_RC_SUCCESS
             cell_list = []
@@ -1374,10 +1439,33 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         slotframe = self.mote.tsch.get_slotframe(
             self.SLOTFRAME_HANDLE_AUTONOMOUS_CELLS
         )
+        # the autonomous cells depend on nothing else, so that they are
+        # shared by all the motes of the engine
+        key = (slotframe.length, self.settings.phy_numChans)
+        try:
+            table = self.engine.msf_autonomous_cells[key]
+        except KeyError:
+            table = {}
+            self.engine.msf_autonomous_cells[key] = table
+
+        try:
+            return table[mac_addr]
+        except KeyError:
+            # the hash is computed only once for a MAC address
+            ret = self._compute_autonomous_cell_by_hash(mac_addr, *key)
+            table[mac_addr] = ret
+            return ret
+
+    def _compute_autonomous_cell_by_hash(
+            self,
+            mac_addr,
+            slotframe_length,
+            num_channels
+        ):
         hash_value = self._sax(mac_addr)
 
-        slot_offset = int(1 + (hash_value % (slotframe.length - 1)))
-        channel_offset = int(hash_value % self.settings.phy_numChans)
+        slot_offset = int(1 + (hash_value % (slotframe_length - 1)))
+        channel_offset = int(hash_value % num_channels)
 
         return (slot_offset, channel_offset)
 
@@ -1391,7 +1479,11 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
 
         # assuming v (seed) is 0
         hash_value = 0
-        for word in netaddr.EUI(mac_addr).words:
+        # the eight octets of the EUI-64, most significant first; each one is
+        # taken as a 16-bit word, that is, 0x00 and the octet
+        mac_addr_int = addr.mac_addr_to_int(mac_addr)
+        for shift in range(56, -8, -8):
+            word = (mac_addr_int >> shift) & 0xFF
             for byte in divmod(word, 0x100):
                 left_shifted = (hash_value << LEFT_SHIFT_NUM)
                 right_shifted = (hash_value >> RIGHT_SHIFT_NUM)
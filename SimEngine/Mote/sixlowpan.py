@@ -12,15 +12,17 @@ from past.utils import old_div
 from builtins import object
 from abc import abstractmethod
 import copy
+import heapq
+import itertools
 import math
 import random
 
-import netaddr
-
 # Simulator-wide modules
 import SimEngine
 from SimEngine.SimEngineDefines import SECOND
 from . import MoteDefines as d
+from . import addr
+from .NetDefines import Packet, MacInfo, NetInfo
 
 # =========================== defines =========================================
 
@@ -61,6 +63,9 @@ class Sixlowpan(object):
         assert u'srcIp' in packet[u'net']
         assert u'dstIp' in packet[u'net']
 
+        # the upper layers may give a dict
+        packet = Packet.from_dict(packet)
+
         goOn = True
 
         # put hop_limit field to the net header
@@ -87,7 +92,11 @@ class Sixlowpan(object):
             if (
                     (self.mote.dagRoot)
                     and
-                    ((netaddr.IPAddress(packet[u'net'][u'srcIp']).words[0] & 0xFE80) != 0xFE80)
+                    (
+                        addr.is_ipv6_link_local_addr_int(
+                            addr.ipv6_addr_to_int(packet[u'net'][u'srcIp'])
+                        ) is False
+                    )
                 ):
                 sourceRoute = self.mote.rpl.computeSourceRoute(packet[u'net'][u'dstIp'])
                 if sourceRoute==None:
@@ -102,9 +111,9 @@ class Sixlowpan(object):
                     goOn = False
                 else:
                     assert 1 <= len(sourceRoute)
-                    packet[u'net'][u'dstIp'] = sourceRoute.pop(0)
-                    if len(sourceRoute) > 0:
-                        packet[u'net'][u'sourceRoute'] = sourceRoute
+                    packet[u'net'][u'dstIp'] = sourceRoute[0]
+                    if len(sourceRoute) > 1:
+                        packet[u'net'][u'sourceRoute'] = sourceRoute[1:]
 
         # find link-layer destination
         if goOn:
@@ -120,10 +129,10 @@ class Sixlowpan(object):
 
         # add MAC header
         if goOn:
-            packet[u'mac'] = {
-                u'srcMac': self.mote.get_mac_addr(),
-                u'dstMac': dstMac
-            }
+            packet[u'mac'] = MacInfo(
+                srcMac = self.mote.get_mac_addr(),
+                dstMac = dstMac
+            )
 
         # cut packet into fragments
         if goOn:
@@ -171,9 +180,14 @@ class Sixlowpan(object):
 
             # source routing header
             elif 'sourceRoute' in packet[u'net']:
-                packet[u'net'][u'dstIp'] = packet[u'net'][u'sourceRoute'].pop(0)
-                if len(packet[u'net'][u'sourceRoute']) == 0:
+                # the list is shared with the transmitted packet; don't
+                # modify it in place
+                sourceRoute = packet[u'net'][u'sourceRoute']
+                packet[u'net'][u'dstIp'] = sourceRoute[0]
+                if len(sourceRoute) == 1:
                     del packet[u'net'][u'sourceRoute']
+                else:
+                    packet[u'net'][u'sourceRoute'] = sourceRoute[1:]
 
         # handle packet
         if goOn:
@@ -263,40 +277,45 @@ class Sixlowpan(object):
             goOn = False
 
         # === create forwarded packet
-        if goOn:
-            fwdPacket             = {}
+        if goOn and (rxPacket[u'type'] == d.PKT_TYPE_FRAG):
+            # the fragmentation sublayer has made the fragment to forward
+            # with its own headers (see FragmentForwarding.fragRecv())
+            fwdPacket = rxPacket
+            if u'hop_limit' in fwdPacket[u'net']:
+                fwdPacket[u'net'][u'hop_limit'] -= 1
+        elif goOn:
+            # the headers of rxPacket may be shared with the packet we
+            # received (copy-on-write); make our own ones for the forwarded
+            # packet
+            fwdPacket             = Packet()
             # type
-            fwdPacket[u'type']     = copy.deepcopy(rxPacket[u'type'])
+            fwdPacket[u'type']     = rxPacket[u'type']
             # app
             if 'app' in rxPacket:
-                fwdPacket[u'app']  = copy.deepcopy(rxPacket[u'app'])
+                fwdPacket[u'app']  = rxPacket[u'app']
             # net
-            fwdPacket[u'net']      = copy.deepcopy(rxPacket[u'net'])
+            fwdPacket[u'net']      = rxPacket[u'net'].copy()
             if 'hop_limit' in fwdPacket[u'net']:
                 assert fwdPacket[u'net'][u'hop_limit'] > 1
                 fwdPacket[u'net'][u'hop_limit'] -= 1
 
             # mac
-            if fwdPacket[u'type'] == d.PKT_TYPE_FRAG:
-                # fragment already has mac header (FIXME: why?)
-                fwdPacket[u'mac']  = copy.deepcopy(rxPacket[u'mac'])
+            # find next hop
+            dstMac = self._find_nexthop_mac_addr(fwdPacket)
+            if dstMac==None:
+                # we cannot find a next-hop; drop this packet
+                self.mote.drop_packet(
+                    packet  = rxPacket,
+                    reason  = SimEngine.SimLog.DROPREASON_NO_ROUTE,
+                )
+                # stop handling this packet
+                goOn = False
             else:
-                # find next hop
-                dstMac = self._find_nexthop_mac_addr(fwdPacket)
-                if dstMac==None:
-                    # we cannot find a next-hop; drop this packet
-                    self.mote.drop_packet(
-                        packet  = rxPacket,
-                        reason  = SimEngine.SimLog.DROPREASON_NO_ROUTE,
-                    )
-                    # stop handling this packet
-                    goOn = False
-                else:
-                    # add MAC header
-                    fwdPacket[u'mac'] = {
-                        'srcMac': self.mote.get_mac_addr(),
-                        'dstMac': dstMac
-                    }
+                # add MAC header
+                fwdPacket[u'mac'] = MacInfo(
+                    srcMac = self.mote.get_mac_addr(),
+                    dstMac = dstMac
+                )
 
         # log
         if goOn:
@@ -332,16 +351,14 @@ class Sixlowpan(object):
 
     def _find_nexthop_mac_addr(self, packet):
         mac_addr = None
-        src_ip_addr = netaddr.IPAddress(packet[u'net'][u'srcIp'])
-        dst_ip_addr = netaddr.IPAddress(packet[u'net'][u'dstIp'])
+        src_ip_addr = addr.ipv6_addr_to_int(packet[u'net'][u'srcIp'])
+        dst_ip_addr = addr.ipv6_addr_to_int(packet[u'net'][u'dstIp'])
         # use lower 64 bits and invert U/L bit
-        derived_dst_mac = str(
-            netaddr.EUI(
-                (int(dst_ip_addr) & 0xFFFFFFFFFFFFFFFF) ^ 0x0200000000000000
-            )
+        derived_dst_mac = addr.int_to_mac_addr(
+            addr.ipv6_addr_int_to_mac_addr_int(dst_ip_addr)
         )
 
-        if (dst_ip_addr.words[0] & 0xFF00) == 0xFF00:
+        if addr.is_ipv6_multicast_addr_int(dst_ip_addr):
             # this is an IPv6 multicast address
             mac_addr = d.BROADCAST_ADDRESS
 
@@ -355,10 +372,10 @@ class Sixlowpan(object):
         else:
             if self.mote.rpl.dodagId is None:
                 # upward during secure join process
-                mac_addr = str(self.mote.tsch.join_proxy)
+                mac_addr = addr.int_to_mac_addr(int(self.mote.tsch.join_proxy))
             elif (
                     (
-                        ((src_ip_addr.words[0] & 0xFE80) == 0xFE80)
+                        addr.is_ipv6_link_local_addr_int(src_ip_addr)
                     )
                     or
                     (
@@ -379,6 +396,51 @@ class Sixlowpan(object):
         return mac_addr
 
 
+class ExpirationHeap(object):
+    """Keep track of the entries of a fragment table and their expirations
+
+    The table is a dict of dicts, indexed by srcMac and then by
+    datagram_tag; each entry has "expiration" in ASN. Entries are added
+    and removed through this class, which keeps the number of the entries
+    and a min-heap of their expirations. An entry removed before its
+    expiration leaves a stale item in the heap, which is skipped when it
+    reaches the top.
+    """
+
+    def __init__(self, table):
+        self.table       = table
+        self.num_entries = 0
+        self._heap       = []
+        self._counter    = itertools.count()
+
+    def add(self, srcMac, datagram_tag, entry):
+        if srcMac not in self.table:
+            self.table[srcMac] = {}
+        assert datagram_tag not in self.table[srcMac]
+        self.table[srcMac][datagram_tag] = entry
+        self.num_entries += 1
+        heapq.heappush(
+            self._heap,
+            (entry[u'expiration'], next(self._counter), srcMac, datagram_tag, entry)
+        )
+
+    def remove(self, srcMac, datagram_tag):
+        del self.table[srcMac][datagram_tag]
+        if len(self.table[srcMac]) == 0:
+            del self.table[srcMac]
+        self.num_entries -= 1
+        if self.num_entries == 0:
+            # every item in the heap is stale
+            self._heap = []
+
+    def delete_expired(self, asn):
+        # delete entries whose expiration is older than asn
+        while self._heap and (self._heap[0][0] < asn):
+            _, _, srcMac, datagram_tag, entry = heapq.heappop(self._heap)
+            if self.table.get(srcMac, {}).get(datagram_tag) is entry:
+                self.remove(srcMac, datagram_tag)
+
+
 class Fragmentation(object):
     """The base class for forwarding implementations of fragments
     """
@@ -407,6 +469,9 @@ class Fragmentation(object):
         # - "fragments" holds received fragments, although only their
         # datagram_offset and lengths are stored in the "fragments" list.
         self.reassembly_buffers   = {}
+        self.reassembly_buffer_expirations = ExpirationHeap(
+            self.reassembly_buffers
+        )
 
     #======================== public ==========================================
 
@@ -475,14 +540,14 @@ class Fragmentation(object):
             for i in range(0, number_of_fragments):
 
                 # common part of fragment packet
-                fragment = {
-                    u'type':                d.PKT_TYPE_FRAG,
-                    u'net': {
-                        u'datagram_size':   packet[u'pkt_len'],
-                        u'datagram_tag':    outgoing_datagram_tag,
-                        u'datagram_offset': datagram_offset
-                    }
-                }
+                fragment = Packet(
+                    type                    = d.PKT_TYPE_FRAG,
+                    net                     = NetInfo(
+                        datagram_size       = packet[u'pkt_len'],
+                        datagram_tag        = outgoing_datagram_tag,
+                        datagram_offset     = datagram_offset
+                    )
+                )
 
                 # put additional fields to the first and the last fragment
                 if   i == 0:
@@ -514,7 +579,7 @@ class Fragmentation(object):
                 datagram_offset += fragment[u'net'][u'packet_length']
 
                 # copy the MAC header
-                fragment[u'mac'] = copy.deepcopy(packet[u'mac'])
+                fragment[u'mac'] = packet[u'mac'].copy()
 
                 # add the fragment to a returning list
                 returnVal += [fragment]
@@ -555,9 +620,7 @@ class Fragmentation(object):
         if (srcMac not in self.reassembly_buffers) or (incoming_datagram_tag not in self.reassembly_buffers[srcMac]):
             # dagRoot has no memory limitation for reassembly buffer
             if not self.mote.dagRoot:
-                total_reassembly_buffers_num = 0
-                for i in self.reassembly_buffers:
-                    total_reassembly_buffers_num += len(self.reassembly_buffers[i])
+                total_reassembly_buffers_num = self.reassembly_buffer_expirations.num_entries
                 if total_reassembly_buffers_num == self.settings.sixlowpan_reassembly_buffers_num:
                     # no room for a new entry
                     self.mote.drop_packet(
@@ -567,13 +630,14 @@ class Fragmentation(object):
                     return
 
             # create a new reassembly buffer
-            if srcMac not in self.reassembly_buffers:
-                self.reassembly_buffers[srcMac] = {}
-            if incoming_datagram_tag not in self.reassembly_buffers[srcMac]:
-                self.reassembly_buffers[srcMac][incoming_datagram_tag] = {
+            self.reassembly_buffer_expirations.add(
+                srcMac,
+                incoming_datagram_tag,
+                {
                     u'expiration': self.engine.getAsn() + buffer_lifetime,
                     u'fragments': []
                 }
+            )
 
         if datagram_offset not in [x[u'datagram_offset'] for x in self.reassembly_buffers[srcMac][incoming_datagram_tag][u'fragments']]:
 
@@ -606,9 +670,7 @@ class Fragmentation(object):
         packet[u'net'][u'packet_length'] = datagram_size
 
         # reassembly is done, delete buffer
-        del self.reassembly_buffers[srcMac][incoming_datagram_tag]
-        if len(self.reassembly_buffers[srcMac]) == 0:
-            del self.reassembly_buffers[srcMac]
+        self.reassembly_buffer_expirations.remove(srcMac, incoming_datagram_tag)
 
         return packet
 
@@ -620,18 +682,7 @@ class Fragmentation(object):
         return ret
 
     def _delete_expired_reassembly_buffer(self):
-        if len(self.reassembly_buffers) == 0:
-            return
-
-        for srcMac in list(self.reassembly_buffers.keys()):
-            for incoming_datagram_tag in list(self.reassembly_buffers[srcMac].keys()):
-                # delete expired reassembly buffer
-                if self.reassembly_buffers[srcMac][incoming_datagram_tag][u'expiration'] < self.engine.getAsn():
-                    del self.reassembly_buffers[srcMac][incoming_datagram_tag]
-
-            # delete an reassembly buffer entry if it's empty
-            if len(self.reassembly_buffers[srcMac]) == 0:
-                del self.reassembly_buffers[srcMac]
+        self.reassembly_buffer_expirations.delete_expired(self.engine.getAsn())
 
 class PerHopReassembly(Fragmentation):
     """
@@ -653,6 +704,7 @@ class FragmentForwarding(Fragmentation):
     def __init__(self, sixlowpan):
         super(FragmentForwarding, self).__init__(sixlowpan)
         self.vrb_table       = {}
+        self.vrb_table_expirations = ExpirationHeap(self.vrb_table)
 
     #======================== public ==========================================
 
@@ -682,7 +734,7 @@ class FragmentForwarding(Fragmentation):
                 # dagRoot has no memory limitation for VRB Table
                 pass
             else:
-                total_vrb_table_entry_num = sum([len(e) for _, e in list(self.vrb_table.items())])
+                total_vrb_table_entry_num = self.vrb_table_expirations.num_entries
                 assert total_vrb_table_entry_num <= self.settings.fragmentation_ff_vrb_table_size
                 if total_vrb_table_entry_num == self.settings.fragmentation_ff_vrb_table_size:
                     # no room for a new entry
@@ -693,32 +745,31 @@ class FragmentForwarding(Fragmentation):
                     return
 
 
-            if srcMac not in self.vrb_table:
-                self.vrb_table[srcMac] = {}
-
             # By specification, a VRB Table entry is supposed to have:
             # - incoming srcMac
             # - incoming datagram_tag
             # - outgoing dstMac (nexthop)
             # - outgoing datagram_tag
 
-            if incoming_datagram_tag in self.vrb_table[srcMac]:
+            if (srcMac in self.vrb_table) and (incoming_datagram_tag in self.vrb_table[srcMac]):
                 # duplicate first fragment is silently discarded
                 return
             else:
-                self.vrb_table[srcMac][incoming_datagram_tag] = {}
+                vrb_entry = {}
 
             if self.mote.is_my_ipv6_addr(fragment[u'net'][u'dstIp']):
                 # this is a special entry for fragments destined to the mote
-                self.vrb_table[srcMac][incoming_datagram_tag][u'outgoing_datagram_tag'] = None
+                vrb_entry[u'outgoing_datagram_tag'] = None
             else:
-                self.vrb_table[srcMac][incoming_datagram_tag][u'dstMac']                = dstMac
-                self.vrb_table[srcMac][incoming_datagram_tag][u'outgoing_datagram_tag'] = self._get_next_datagram_tag()
+                vrb_entry[u'dstMac']                = dstMac
+                vrb_entry[u'outgoing_datagram_tag'] = self._get_next_datagram_tag()
 
-            self.vrb_table[srcMac][incoming_datagram_tag][u'expiration'] = self.engine.getAsn() + entry_lifetime
+            vrb_entry[u'expiration'] = self.engine.getAsn() + entry_lifetime
 
             if u'missing_fragment' in self.settings.fragmentation_ff_discard_vrb_entry_policy:
-                self.vrb_table[srcMac][incoming_datagram_tag][u'next_offset'] = 0
+                vrb_entry[u'next_offset'] = 0
+
+            self.vrb_table_expirations.add(srcMac, incoming_datagram_tag, vrb_entry)
 
         # when missing_fragment is in discard_vrb_entry_policy
         # - if the incoming fragment is the expected one, update the next_offset
@@ -731,9 +782,7 @@ class FragmentForwarding(Fragmentation):
             if datagram_offset == self.vrb_table[srcMac][incoming_datagram_tag][u'next_offset']:
                 self.vrb_table[srcMac][incoming_datagram_tag][u'next_offset'] += packet_length
             else:
-                del self.vrb_table[srcMac][incoming_datagram_tag]
-                if len(self.vrb_table[srcMac]) == 0:
-                    del self.vrb_table[srcMac]
+                self.vrb_table_expirations.remove(srcMac, incoming_datagram_tag)
 
         # find entry in VRB table and forward fragment
         if (srcMac in self.vrb_table) and (incoming_datagram_tag in self.vrb_table[srcMac]):
@@ -746,22 +795,23 @@ class FragmentForwarding(Fragmentation):
 
             else:
                 # need to create a new packet in order to distinguish between the
-                # received packet and a forwarding packet.
-                fwdFragment = {
-                    u'type':       copy.deepcopy(fragment[u'type']),
-                    u'net':        copy.deepcopy(fragment[u'net']),
-                    u'mac': {
-                        u'srcMac': self.mote.get_mac_addr(),
-                        u'dstMac': self.vrb_table[srcMac][incoming_datagram_tag][u'dstMac']
-                    }
-                }
+                # received packet and a forwarding packet. it shares "app"
+                # and the values of the network header with the received
+                # fragment (copy-on-write); only the MAC header and the
+                # datagram_tag are its own. forward() sends it as it is.
+                vrb_entry = self.vrb_table[srcMac][incoming_datagram_tag]
+                fwdFragment = Packet(
+                    type       = fragment[u'type'],
+                    app        = fragment.get(u'app'),
+                    net        = fragment[u'net'].copy(),
+                    mac        = MacInfo(
+                        srcMac = self.mote.get_mac_addr(),
+                        dstMac = vrb_entry[u'dstMac']
+                    )
+                )
 
                 # forwarding fragment should have the outgoing datagram_tag
-                fwdFragment[u'net'][u'datagram_tag'] = self.vrb_table[srcMac][incoming_datagram_tag][u'outgoing_datagram_tag']
-
-                # copy app field if necessary
-                if u'app' in fragment:
-                    fwdFragment[u'app'] = copy.deepcopy(fragment[u'app'])
+                fwdFragment[u'net'][u'datagram_tag'] = vrb_entry[u'outgoing_datagram_tag']
 
                 ret = fwdFragment
 
@@ -781,23 +831,11 @@ class FragmentForwarding(Fragmentation):
                 and
                 ((datagram_offset + packet_length) == datagram_size)
            ):
-            del self.vrb_table[srcMac][incoming_datagram_tag]
-            if len(self.vrb_table[srcMac]) == 0:
-                del self.vrb_table[srcMac]
+            self.vrb_table_expirations.remove(srcMac, incoming_datagram_tag)
 
         return ret
 
     #======================== private ==========================================
 
     def _delete_expired_vrb_table_entry(self):
-        if len(self.vrb_table) == 0:
-            return
-
-        for srcMac in list(self.vrb_table.keys()):
-            for incoming_datagram_tag in list(self.vrb_table[srcMac].keys()):
-                # too old
-                if self.vrb_table[srcMac][incoming_datagram_tag][u'expiration'] < self.engine.getAsn():
-                    del self.vrb_table[srcMac][incoming_datagram_tag]
-            # empty
-            if len(self.vrb_table[srcMac]) == 0:
-                del self.vrb_table[srcMac]
+        self.vrb_table_expirations.delete_expired(self.engine.getAsn())
@@ -12,10 +12,13 @@ from __future__ import absolute_import
 from builtins import range
 from builtins import object
 import copy
+import heapq
 import random
 
 # Mote sub-modules
 from . import MoteDefines as d
+from . import addr
+from .NetDefines import Packet, AppInfo, MacInfo
 
 # Simulator-wide modules
 import SimEngine
@@ -44,7 +47,12 @@ class SixP(object):
 
         # local variables
         self.seqnum_table      = {} # indexed by neighbor_id
-        self.transaction_table = {} # indexed by [initiator, responder]
+        self.transaction_table = {} # indexed by (initiator, responder)
+
+        # the timeouts of the transactions of all the motes are kept by a
+        # single timer wheel
+        if self.engine.sixp_timer_wheel is None:
+            self.engine.sixp_timer_wheel = SixPTimerWheel(self.engine)
 
     # ======================= public ==========================================
 
@@ -268,14 +276,10 @@ class SixP(object):
 
     def abort_transaction(self, initiator_mac_addr, responder_mac_addr):
         # make sure we have a transaction to abort
-        dummy_packet = {
-            u'mac': {
-                u'srcMac': initiator_mac_addr,
-                u'dstMac': responder_mac_addr
-            },
-            u'app': {u'msgType': d.SIXP_MSG_TYPE_REQUEST}
-        }
-        transaction_key = SixPTransaction.get_transaction_key(dummy_packet)
+        transaction_key = SixPTransaction.make_transaction_key(
+            initiator_mac_addr,
+            responder_mac_addr
+        )
         transaction = self.transaction_table[transaction_key]
         assert transaction is not None
         transaction.invoke_callback(
@@ -473,18 +477,18 @@ class SixP(object):
             maxNumCells        = None,
             payload            = None
         ):
-        packet = {
-            u'type'       : d.PKT_TYPE_SIXP,
-            u'mac': {
-                u'srcMac' : self.mote.get_mac_addr(),
-                u'dstMac' : dstMac
-            },
-            u'app': {
-                u'msgType': msgType,
-                u'code'   : code,
-                u'seqNum' : None
-            }
-        }
+        packet = Packet(
+            type    = d.PKT_TYPE_SIXP,
+            mac     = MacInfo(
+                srcMac  = self.mote.get_mac_addr(),
+                dstMac  = dstMac
+            ),
+            app     = AppInfo(
+                msgType = msgType,
+                code    = code,
+                seqNum  = None
+            )
+        )
 
         if   msgType == d.SIXP_MSG_TYPE_REQUEST:
             # put the next SeqNum
@@ -657,6 +661,7 @@ class SixPTransaction(object):
         self.type             = self._determine_transaction_type()
         self.key              = self.get_transaction_key(request)
         self.is_valid         = False
+        self.timer_wheel      = self.engine.sixp_timer_wheel
 
         # for quick access
         self.seqNum           = request[u'app'][u'seqNum']
@@ -667,12 +672,6 @@ class SixPTransaction(object):
             self.peerMac      = self.responder
         else:
             self.peerMac      = self.initiator
-        self.event_uniqueTag = u'{0}-{1}-{2}-{3}'.format(
-            self.mote.id,
-            self.initiator,
-            self.responder,
-            '6P-transaction-timeout'
-        )
 
         # register itself to sixp
         self.mote.sixp.add_transaction(self)
@@ -696,7 +695,18 @@ class SixPTransaction(object):
             # shouldn't come here
             raise Exception()
 
-        return u'{0}-{1}'.format(initiator, responder)
+        return SixPTransaction.make_transaction_key(initiator, responder)
+
+    @staticmethod
+    def make_transaction_key(initiator, responder):
+        # MAC addresses are compared as interned integers; fall back to the
+        # strings for what is not an EUI-64
+        initiator_int = addr.mac_addr_to_int(initiator)
+        responder_int = addr.mac_addr_to_int(responder)
+        return (
+            initiator if initiator_int is None else initiator_int,
+            responder if responder_int is None else responder_int
+        )
 
     @property
     def last_packet(self):
@@ -720,12 +730,7 @@ class SixPTransaction(object):
             # use the default timeout value
             timeout_delay = self._get_default_timeout_seconds()
 
-        self.engine.scheduleIn(
-            delay          = timeout_delay,
-            cb             = self.timeout_handler,
-            uniqueTag      = self.event_uniqueTag,
-            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS,
-        )
+        self.timer_wheel.add(self, timeout_delay)
 
     def complete(self):
         self.log(
@@ -791,8 +796,8 @@ class SixPTransaction(object):
     # ======================= private ==========================================
 
     def invalidate(self):
-        # remove its timeout event if it exists
-        self.engine.removeFutureEvent(self.event_uniqueTag)
+        # remove its timeout if it exists
+        self.timer_wheel.remove(self)
 
         # delete the transaction from the 6P transaction table
         self.mote.sixp.delete_transaction(self)
@@ -884,3 +889,95 @@ class SixPTransaction(object):
             raise Exception()
 
         return one_way_delay * num_round_trips
+
+
+class SixPTimerWheel(object):
+    """
+    Timeouts of the 6P transactions of all the motes
+
+    Instead of scheduling one event per transaction, timeouts are put into
+    buckets of one slotframe; a single engine event fires the earliest
+    non-empty bucket and calls timeout_handler() of its transactions. A
+    timeout is rounded up to the end of its bucket, so that it never
+    expires earlier than requested.
+    """
+
+    def __init__(self, engine):
+
+        # store params
+        self.engine   = engine
+
+        # singletons (quicker access, instead of recreating every time)
+        self.settings = SimEngine.SimSettings.SimSettings()
+
+        # local variables
+        self.tick            = (
+            self.settings.tsch_slotframeLength *
+            self.settings.tsch_slotDuration
+        )
+        self.buckets         = {} # indexed by tick number
+        self.tick_heap       = [] # tick numbers of self.buckets
+        self.tick_of         = {} # indexed by transaction
+        self.next_tick       = None # tick number of the scheduled event
+
+    # ======================= public ==========================================
+
+    def add(self, transaction, delay):
+        self.remove(transaction)
+
+        tick_number = int((self.engine.global_time + delay) // self.tick) + 1
+        if tick_number not in self.buckets:
+            self.buckets[tick_number] = {}
+            heapq.heappush(self.tick_heap, tick_number)
+        # a dict keeps the transactions in the order of their addition
+        self.buckets[tick_number][transaction] = None
+        self.tick_of[transaction] = tick_number
+
+        if (self.next_tick is None) or (tick_number < self.next_tick):
+            self._schedule(tick_number)
+
+    def remove(self, transaction):
+        tick_number = self.tick_of.pop(transaction, None)
+        if tick_number is None:
+            # not in the wheel
+            return
+        bucket = self.buckets[tick_number]
+        del bucket[transaction]
+        if not bucket:
+            # the tick number stays in self.tick_heap; it is skipped when it
+            # comes on the top
+            del self.buckets[tick_number]
+
+    def __len__(self):
+        return len(self.tick_of)
+
+    # ======================= private =========================================
+
+    def _schedule(self, tick_number):
+        self.next_tick = tick_number
+        self.engine.scheduleIn(
+            delay          = tick_number * self.tick - self.engine.global_time,
+            cb             = self._action_tick,
+            uniqueTag      = (u'SixPTimerWheel', u'_action_tick'),
+            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS,
+        )
+
+    def _schedule_next(self):
+        # drop the tick numbers of the buckets emptied by remove()
+        while self.tick_heap and (self.tick_heap[0] not in self.buckets):
+            heapq.heappop(self.tick_heap)
+        if self.tick_heap:
+            self._schedule(self.tick_heap[0])
+
+    def _action_tick(self):
+        # self.next_tick stays until the end so that a transaction added by
+        # a callback, which goes into a later bucket, doesn't schedule the
+        # event before the pending buckets
+        bucket = self.buckets.pop(self.next_tick, {})
+        for transaction in bucket:
+            del self.tick_of[transaction]
+        for transaction in bucket:
+            transaction.timeout_handler()
+
+        self.next_tick = None
+        self._schedule_next()
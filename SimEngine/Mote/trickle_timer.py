@@ -4,8 +4,8 @@ Trickle Timer: IETF RFC 6206 (https://tools.ietf.org/html/rfc6206)
 from __future__ import absolute_import
 from __future__ import division
 
-from builtins import str
 from builtins import object
+import heapq
 import inspect
 from past.utils import old_div
 import math
@@ -30,6 +30,11 @@ class TrickleTimer(object):
         self.engine   = SimEngine.MultiNetworkEngine.MultiNetworkSimEngineInstance()
         self.settings = SimEngine.SimSettings.SimSettings()
 
+        # the events of all the timers are kept by a single service
+        if self.engine.trickle_service is None:
+            self.engine.trickle_service = TrickleService(self.engine)
+        self.service  = self.engine.trickle_service
+
         # constants of this timer instance
         # min_interval is expected to given in milliseconds
         # max_interval is expected to be described as a number of doublings of the
@@ -38,13 +43,20 @@ class TrickleTimer(object):
         self.max_interval = self.min_interval * pow(2, i_doublings)
         
         self.redundancy_constant = k
-        self.uniqueTag_base = str(id(self))
 
         # variables
         self.counter = 0
         self.interval = 0
         self.user_callback = callback
         self.state = self.STATE_STOPPED
+        # ASNs of the pending events, None when not scheduled
+        self.asn_at_t = None
+        self.asn_at_i = None
+
+        # bound once, so that the same callbacks are handed to the service
+        # for every interval
+        self.callback_at_t = self._action_at_t
+        self.callback_at_i = self._action_at_i
 
     @property
     def is_running(self):
@@ -67,8 +79,10 @@ class TrickleTimer(object):
         self._start_next_interval()
 
     def stop(self):
-        self.engine.removeFutureEvent(self.uniqueTag_base + u'_at_i')
-        self.engine.removeFutureEvent(self.uniqueTag_base + u'_at_t')
+        self.service.remove(self.callback_at_i, self.asn_at_i)
+        self.service.remove(self.callback_at_t, self.asn_at_t)
+        self.asn_at_i = None
+        self.asn_at_t = None
         self.state = self.STATE_STOPPED
 
     def reset(self):
@@ -126,42 +140,128 @@ class TrickleTimer(object):
             # the current ASN
             asn = self.engine.getAsn() + 1
 
-        def _callback():
-            if self.counter < self.redundancy_constant:
-                #  Section 4.2:
-                #    4.  At time t, Trickle transmits if and only if the
-                #        counter c is less than the redundancy constant k.
-                self.user_callback()
-            else:
-                # do nothing
-                pass
-
-        self.engine.scheduleAtAsn(
-            asn            = asn,
-            cb             = _callback,
-            uniqueTag      = self.uniqueTag_base + u'_at_t',
-            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS
-        )
+        self.service.remove(self.callback_at_t, self.asn_at_t)
+        self.asn_at_t = asn
+        self.service.add(self.callback_at_t, asn)
 
     def _schedule_event_at_end_of_interval(self):
         slot_len = self.settings.tsch_slotDuration # convert to ms
         asn = self.engine.getAsn() + int(math.ceil(old_div(self.interval, slot_len)))
 
-        def _callback():
-            # doubling the interval
-            #
-            # Section 4.2:
-            #   5.  When the interval I expires, Trickle doubles the interval
-            #       length.  If this new interval length would be longer than
-            #       the time specified by Imax, Trickle sets the interval
-            #       length I to be the time specified by Imax.
-            self.interval = self.interval * 2
-            if self.max_interval < self.interval:
-                self.interval = self.max_interval
-            self._start_next_interval()
+        self.service.remove(self.callback_at_i, self.asn_at_i)
+        self.asn_at_i = asn
+        self.service.add(self.callback_at_i, asn)
+
+    def _action_at_t(self):
+        self.asn_at_t = None
+        if self.counter < self.redundancy_constant:
+            #  Section 4.2:
+            #    4.  At time t, Trickle transmits if and only if the
+            #        counter c is less than the redundancy constant k.
+            self.user_callback()
+        else:
+            # do nothing
+            pass
+
+    def _action_at_i(self):
+        self.asn_at_i = None
+        # doubling the interval
+        #
+        # Section 4.2:
+        #   5.  When the interval I expires, Trickle doubles the interval
+        #       length.  If this new interval length would be longer than
+        #       the time specified by Imax, Trickle sets the interval
+        #       length I to be the time specified by Imax.
+        self.interval = self.interval * 2
+        if self.max_interval < self.interval:
+            self.interval = self.max_interval
+        self._start_next_interval()
+
+
+class TrickleService(object):
+    """
+    Pending events of all the Trickle timers
 
+    The callbacks of the timers are put into buckets indexed by ASN; a
+    single engine event fires the earliest non-empty bucket, calling the
+    callbacks in the order they were added. Removing a callback from its
+    bucket is O(1): resetting a timer moves its two callbacks to other
+    buckets, and reschedules the engine event only when one of them gets
+    earlier than the pending bucket.
+    """
+
+    def __init__(self, engine):
+
+        # store params
+        self.engine    = engine
+
+        # local variables
+        self.buckets   = {} # indexed by ASN
+        self.asn_heap  = [] # ASNs of self.buckets
+        self.next_asn  = None # ASN of the scheduled event
+        self.num_callbacks = 0 # callbacks in self.buckets
+
+    # ======================= public ==========================================
+
+    def add(self, callback, asn):
+        if asn not in self.buckets:
+            self.buckets[asn] = {}
+            heapq.heappush(self.asn_heap, asn)
+        # a dict keeps the callbacks in the order of their addition
+        if callback not in self.buckets[asn]:
+            self.buckets[asn][callback] = None
+            self.num_callbacks += 1
+
+        if (self.next_asn is None) or (asn < self.next_asn):
+            self._schedule(asn)
+
+    def remove(self, callback, asn):
+        if asn is None:
+            # not scheduled
+            return
+        bucket = self.buckets.get(asn)
+        if (bucket is None) or (callback not in bucket):
+            return
+        del bucket[callback]
+        self.num_callbacks -= 1
+        if not bucket:
+            # the ASN stays in self.asn_heap; it is skipped when it comes on
+            # the top
+            del self.buckets[asn]
+
+    def __len__(self):
+        return self.num_callbacks
+
+    # ======================= private =========================================
+
+    def _schedule(self, asn):
+        self.next_asn = asn
         self.engine.scheduleAtAsn(
             asn            = asn,
-            cb             = _callback,
-            uniqueTag      = self.uniqueTag_base + u'_at_i',
-            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS)
+            cb             = self._action_fire,
+            uniqueTag      = (u'TrickleService', u'_action_fire'),
+            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS
+        )
+
+    def _schedule_next(self):
+        # drop the ASNs of the buckets emptied by remove()
+        while self.asn_heap and (self.asn_heap[0] not in self.buckets):
+            heapq.heappop(self.asn_heap)
+        if self.asn_heap:
+            self._schedule(self.asn_heap[0])
+
+    def _action_fire(self):
+        # callbacks schedule their next events at later ASNs; self.next_asn
+        # stays until the end so that they don't schedule the event before
+        # the pending buckets. A callback removed from this bucket by
+        # another one is skipped.
+        bucket = self.buckets.get(self.next_asn, {})
+        while bucket:
+            callback = next(iter(bucket))
+            del bucket[callback]
+            self.num_callbacks -= 1
+            callback()
+        self.buckets.pop(self.next_asn, None)
+
+        self.next_asn = None
+        self._schedule_next()
@@ -11,14 +11,14 @@ from builtins import range
 from builtins import object
 from dataclasses import asdict, dataclass
 from past.utils import old_div
-import copy
-from itertools import chain
+import bisect
+from itertools import chain, count, islice
 import random
 
 import netaddr
 
 from SimEngine.SimEngineDefines import MILLISECOND, SECOND
-from SimEngine.Mote.NetDefines import Packet
+from SimEngine.Mote.NetDefines import Packet, MacInfo, copy_headers
 
 # Mote sub-modules
 from . import MoteDefines as d
@@ -46,10 +46,16 @@ class Tsch(object):
         self.settings = SimEngine.SimSettings.SimSettings()
         self.log      = SimEngine.SimLog.SimLog().log
 
+        # with a compiled schedule, the engine wakes up the motes at their
+        # active slots instead of each mote scheduling its own wake-up
+        self.schedule_dispatcher = self.engine.schedule_dispatcher
+        if self.schedule_dispatcher is not None:
+            self.schedule_dispatcher.register(self)
+
         # local variables
         self.guard_time       = 3 * MILLISECOND
         self.slotframes       = {}
-        self.txQueue          = []
+        self.txQueue          = TxQueue()
         if self.settings.tsch_tx_queue_size >= 0:
             self.txQueueSize  = self.settings.tsch_tx_queue_size
         elif self.settings.tsch_tx_queue_size == -1:
@@ -86,11 +92,21 @@ class Tsch(object):
         # pending bit
         self.pending_bit_enabled            = False
         self.args_for_next_pending_bit_task = None
+        # next wake-up merged across slotframes; valid as long as the
+        # generations of the slotframes don't change
+        self.next_active_asn                = None
+        self.next_active_asn_key            = None
+        # unused cells to report to SF at the next slotframe, when SF has
+        # batch_cell_accounting enabled
+        self.elapsed_tx_cells               = []
+        self.elapsed_rx_cells               = []
+        self.elapsed_cells_slotframe_number = None
 
         assert self.settings.phy_numChans <= len(d.TSCH_HOPPING_SEQUENCE)
         self.hopping_sequence = (
             d.TSCH_HOPPING_SEQUENCE[:self.settings.phy_numChans]
         )
+        self.hopping_sequence_length = len(self.hopping_sequence)
 
         # install the default slotframe
         self.add_slotframe(
@@ -147,6 +163,8 @@ class Tsch(object):
             self.stopSendingEBs()
             self.delete_minimal_cell()
             self.mote.sf.stop()
+            # the unused cells not reported to SF yet are dropped here only
+            self.clear_elapsed_cells()
             self.mote.sixp.clear_transaction_table()
             self.mote.secjoin.setIsJoined(False)
             self.asnLastSync = None
@@ -178,17 +196,29 @@ class Tsch(object):
         else:
             return 0
 
+    def is_available_slot(self, slot_offset, slotframe_handle=0):
+        if slotframe_handle in self.slotframes:
+            slotframe = self.slotframes[slotframe_handle]
+            return slotframe.is_available_slot(slot_offset)
+        else:
+            return False
+
+    def sample_available_slots(
+            self,
+            num_slots,
+            excluded_slots,
+            slotframe_handle=0
+        ):
+        if slotframe_handle in self.slotframes:
+            slotframe = self.slotframes[slotframe_handle]
+            return slotframe.sample_available_slots(num_slots, excluded_slots)
+        else:
+            return []
+
     def get_cell(self, slot_offset, channel_offset, mac_addr, slotframe_handle=0):
         if slotframe_handle in self.slotframes:
             slotframe = self.slotframes[slotframe_handle]
-            cells = slotframe.get_cells_by_slot_offset(slot_offset)
-            for cell in cells:
-                if (
-                        (cell.channel_offset == channel_offset)
-                        and
-                        (cell.mac_addr == mac_addr)
-                    ):
-                    return cell
+            return slotframe.get_cell(slot_offset, channel_offset, mac_addr)
         return None
 
     def get_cells(self, mac_addr=None, slotframe_handle=None):
@@ -218,9 +248,10 @@ class Tsch(object):
     def add_slotframe(self, slotframe_handle, length):
         assert slotframe_handle not in self.slotframes
         self.slotframes[slotframe_handle] = SlotFrame(
-            mote_id          = self.mote.id,
-            slotframe_handle = slotframe_handle,
-            num_slots        = length
+            mote_id             = self.mote.id,
+            slotframe_handle    = slotframe_handle,
+            num_slots           = length,
+            schedule_dispatcher = self.schedule_dispatcher
         )
         self.log(
             SimEngine.SimLog.LOG_TSCH_ADD_SLOTFRAME,
@@ -241,6 +272,10 @@ class Tsch(object):
                 u'length'         : self.slotframes[slotframe_handle].length
             }
         )
+        if self.schedule_dispatcher is not None:
+            slotframe = self.slotframes[slotframe_handle]
+            for slot_offset in slotframe.busy_slots:
+                self.schedule_dispatcher.delete_slot(slotframe, slot_offset)
         del self.slotframes[slotframe_handle]
 
     # packet
@@ -326,7 +361,8 @@ class Tsch(object):
             channelOffset,
             cellOptions,
             neighbor,
-            link_type
+            link_type,
+            slotframe_handle
         )
         slotframe.add(cell)
 
@@ -354,18 +390,36 @@ class Tsch(object):
         if self.getIsSync():
             self._schedule_next_active_slot()
 
+    def clear_elapsed_cells(self):
+        # drop the unused cells not reported yet; they may belong to
+        # slotframes which are gone
+        self.elapsed_tx_cells = []
+        self.elapsed_rx_cells = []
+        self.elapsed_cells_slotframe_number = None
+
     # tx queue interface with upper layers
 
     @property
-    def droppable_normal_packet_index(self):
-        for rindex, packet in enumerate(reversed(self.txQueue)):
+    def txQueue(self):
+        return self._tx_queue
+
+    @txQueue.setter
+    def txQueue(self, frames):
+        # keep the per-dstMac index even when a list is given
+        if isinstance(frames, TxQueue):
+            self._tx_queue = frames
+        else:
+            self._tx_queue = TxQueue(frames)
+
+    @property
+    def droppable_normal_packet(self):
+        for packet in reversed(self.txQueue):
             if (
                     (packet[u'mac'][u'priority'] is False)
                     and
                     (self.pktToSend != packet)
                 ):
-                # return index of the packet
-                return len(self.txQueue) - rindex - 1
+                return packet
         return None
 
     def enqueue(self, packet, priority=False):
@@ -388,7 +442,7 @@ class Tsch(object):
                 (
                     (priority is False)
                     or
-                    self.droppable_normal_packet_index is None
+                    self.droppable_normal_packet is None
                 )
             ):
             # my TX queue is full
@@ -440,22 +494,18 @@ class Tsch(object):
                 if len(self.txQueue) == self.txQueueSize:
                     assert not self.txQueue[-1][u'mac'][u'priority']
                     # drop the last one in the queue
-                    packet_index_to_drop = self.droppable_normal_packet_index
-                    packet_to_drop = self.dequeue_by_index(packet_index_to_drop)
+                    packet_to_drop = self.droppable_normal_packet
+                    self.txQueue.remove(packet_to_drop)
                     self.mote.drop_packet(
                         packet = packet_to_drop,
                         reason  = SimEngine.SimLog.DROPREASON_TXQUEUE_FULL
                     )
-                index = len(self.txQueue)
-                for i, _ in enumerate(self.txQueue):
-                    if self.txQueue[i][u'mac'][u'priority'] is False:
-                        index = i
-                        break
-                self.txQueue.insert(index, packet)
+                # TxQueue puts it after the other priority packets
+                self.txQueue.append(packet)
             else:
                 packet[u'mac'][u'priority'] = False
                 # add to txQueue
-                self.txQueue    += [packet]
+                self.txQueue.append(packet)
 
         if (
                 goOn
@@ -485,10 +535,7 @@ class Tsch(object):
                 and
                 isinstance(self.mote.sf, SchedulingFunctionMSF)
                 and
-                not [
-                    _pkt for _pkt in self.txQueue
-                    if _pkt[u'mac'][u'dstMac'] == packet[u'mac'][u'dstMac']
-                ]
+                self.txQueue.get_num_frames(packet[u'mac'][u'dstMac']) == 0
                 and
                 self.mote.sf.get_autonomous_tx_cell(packet[u'mac'][u'dstMac'])
             ):
@@ -526,26 +573,30 @@ class Tsch(object):
             else:
                 # return the first one in the TX queue, whose destination MAC
                 # is not associated with any of allocated (dedicated) TX cells
-                for packet in self.txQueue:
-                    packet_to_send = packet # tentatively
+                eligible_dst_mac_addrs = set()
+                for dst_mac_addr in self.txQueue.get_dst_mac_addrs():
                     for _, slotframe in list(self.slotframes.items()):
-                        dedicated_tx_cells = [cell for cell in slotframe.get_cells_by_mac_addr(packet[u'mac'][u'dstMac']) if d.CELLOPTION_TX in cell.options]
+                        dedicated_tx_cells = [cell for cell in slotframe.get_cells_by_mac_addr(dst_mac_addr) if d.CELLOPTION_TX in cell.options]
                         if len(dedicated_tx_cells) > 0:
-                            packet_to_send = None
-                            break # try the next packet in TX queue
-
-                    if packet_to_send is not None:
-                        # found a good packet to send
-                        break
+                            break
+                    else:
+                        eligible_dst_mac_addrs.add(dst_mac_addr)
+
+                if eligible_dst_mac_addrs:
+                    for packet in self.txQueue:
+                        if (
+                                packet[u'mac'][u'dstMac'] in
+                                eligible_dst_mac_addrs
+                            ):
+                            # found a good packet to send
+                            packet_to_send = packet
+                            break
 
                 # if no suitable packet is found, packet_to_send remains None
         else:
-            for packet in self.txQueue:
-                if packet[u'mac'][u'dstMac'] == dst_mac_addr:
-                    # return the first one having the dstMac
-                    packet_to_send = packet
-                    break
-            # if no packet is found, packet_to_send remains None
+            # return the first one having the dstMac; if no packet is found,
+            # packet_to_send remains None
+            packet_to_send = self.txQueue.get_first_frame(dst_mac_addr)
 
         return packet_to_send
 
@@ -553,29 +604,13 @@ class Tsch(object):
         if dst_mac_addr is None:
             return len(self.txQueue)
         else:
-            return len(
-                [
-                    pkt for pkt in self.txQueue if (
-                        pkt[u'mac'][u'dstMac'] == dst_mac_addr
-                    )
-                ]
-            )
+            return self.txQueue.get_num_frames(dst_mac_addr)
 
     def remove_packets_in_tx_queue(self, type, dstMac=None):
-        i = 0
-        while i < len(self.txQueue):
-            if (
-                    (self.txQueue[i][u'type'] == type)
-                    and
-                    (
-                        (dstMac is None)
-                        or
-                        (self.txQueue[i][u'mac'][u'dstMac'] == dstMac)
-                    )
-                ):
-                del self.txQueue[i]
-            else:
-                i += 1
+        self.txQueue.remove_frames_if(
+            condition    = lambda packet: packet[u'type'] == type,
+            dst_mac_addr = dstMac
+        )
 
     # interface with radio
 
@@ -716,11 +751,12 @@ class Tsch(object):
         active_cell = self.active_cell
 
         self.active_cell = None
-        # copy the received packet to a new packet instance since the passed
-        # "packet" should be kept as it is so that Connectivity can use it
-        # after this rxDone() process.
-        new_packet = copy.deepcopy(packet)
-        packet = new_packet
+        # the passed "packet" should be kept as it is so that Connectivity
+        # and the other receivers can use it after this rxDone() process.
+        # the headers are copied since we may update them; the rest is
+        # shared (copy-on-write)
+        if packet:
+            packet = copy_headers(packet)
         # make sure I'm in the right state
         assert self.waitingFor == d.WAITING_FOR_RX
 
@@ -988,6 +1024,10 @@ class Tsch(object):
 
         assert self.getIsSync()
 
+        if self.schedule_dispatcher is not None:
+            # the dispatcher wakes us up at our next active slot
+            return
+
         asn       = self.engine.getAsn()
         tsCurrent = asn % self.settings.tsch_slotframeLength
 
@@ -997,19 +1037,35 @@ class Tsch(object):
             self.engine.removeFutureEvent(uniqueTag=(self.mote.id, u'_action_active_cell'))
             return
 
-        try:
-            tsDiffMin = min(
-                [
-                    slotframe.get_num_slots_to_next_active_cell(asn)
-                    for _, slotframe in list(self.slotframes.items()) if (
-                        len(slotframe.get_busy_slots()) > 0
-                    )
-                ]
-            )
-        except ValueError:
-            # we don't have any cell; return without scheduling the next active
-            # slot
-            return
+        schedule_key = tuple(
+            (slotframe_handle, slotframe.generation)
+            for slotframe_handle, slotframe in self.slotframes.items()
+        )
+        if (
+                (self.next_active_asn is not None)
+                and
+                (self.next_active_asn_key == schedule_key)
+                and
+                (asn < self.next_active_asn)
+            ):
+            # the schedule hasn't changed since the last computation
+            if self.engine.is_scheduled((self.mote.id, u'_action_active_cell')):
+                return
+            tsDiffMin = self.next_active_asn - asn
+        else:
+            tsDiffMin = None
+            for slotframe in self.slotframes.values():
+                diff = slotframe.get_num_slots_to_next_active_cell(asn)
+                if (diff is not None) and ((tsDiffMin is None) or (diff < tsDiffMin)):
+                    tsDiffMin = diff
+            if tsDiffMin is None:
+                # we don't have any cell; return without scheduling the next
+                # active slot
+                self.next_active_asn = None
+                return
+            self.next_active_asn     = asn + tsDiffMin
+            self.next_active_asn_key = schedule_key
+
         # schedule at that ASN
         self.engine.scheduleAtAsn(
             asn            = asn+tsDiffMin,
@@ -1030,6 +1086,15 @@ class Tsch(object):
         # make sure we are not busy sending a packet
         assert self.pktToSend == None
 
+        batch_cell_accounting = self.mote.sf.batch_cell_accounting
+        if batch_cell_accounting:
+            slotframe_number = asn // self.settings.tsch_slotframeLength
+            if slotframe_number != self.elapsed_cells_slotframe_number:
+                # the first active slot in this slotframe; report the cells
+                # which have elapsed in the previous active slotframe
+                self._report_elapsed_cells()
+                self.elapsed_cells_slotframe_number = slotframe_number
+
         # section 6.2.6.4 of IEEE 802.15.4-2015:
         # "When, for any given timeslot, a device has links in multiple
         # slotframes, transmissions take precedence over receives, and lower
@@ -1053,12 +1118,14 @@ class Tsch(object):
         if self.active_cell:
             if self.pktToSend is None:
                 assert self.active_cell.is_rx_on()
-                self._action_RX()
+                self._action_RX(
+                    channel = self._get_physical_channel(self.active_cell, asn)
+                )
             else:
                 assert self.active_cell.is_tx_on()
                 self._action_TX(
                     pktToSend = self.pktToSend,
-                    channel   = self._get_physical_channel(self.active_cell)
+                    channel   = self._get_physical_channel(self.active_cell, asn)
                 )
                 # update cell stats
                 self.active_cell.increment_num_tx()
@@ -1074,6 +1141,13 @@ class Tsch(object):
         for cell in candidate_cells:
             # call methods against unselected (non-active) cells
             if cell != self.active_cell:
+                if batch_cell_accounting:
+                    # report them later at once
+                    if cell.is_tx_on():
+                        self.elapsed_tx_cells.append(cell)
+                    if cell.is_rx_on():
+                        self.elapsed_rx_cells.append(cell)
+                    continue
                 if cell.is_tx_on():
                     self.mote.sf.indication_tx_cell_elapsed(
                         cell        = cell,
@@ -1087,6 +1161,13 @@ class Tsch(object):
         # schedule the next active slot
         self._schedule_next_active_slot()
 
+    def _report_elapsed_cells(self):
+        tx_cells = self.elapsed_tx_cells
+        rx_cells = self.elapsed_rx_cells
+        self.elapsed_tx_cells = []
+        self.elapsed_rx_cells = []
+        self.mote.sf.indication_cells_elapsed(tx_cells, rx_cells)
+
     def _action_TX(self, pktToSend, channel):
         # set the pending bit field
         if (
@@ -1095,14 +1176,8 @@ class Tsch(object):
                 (
                     # we have more than one packet destined to the same
                     # neighbor
-                    len(
-                        [
-                            packet for packet in self.txQueue
-                            if (
-                                packet[u'mac'][u'dstMac'] ==
-                                pktToSend[u'mac'][u'dstMac']
-                            )
-                        ]
+                    self.txQueue.get_num_frames(
+                        pktToSend[u'mac'][u'dstMac']
                     ) > 1
                 )
                 and
@@ -1120,21 +1195,23 @@ class Tsch(object):
         # indicate that we're waiting for the TX operation to finish
         self.waitingFor = d.WAITING_FOR_TX
 
-    def _action_RX(self):
+    def _action_RX(self, channel=None):
 
-        # start listening
-        self.mote.radio.startRx(
+        if channel is None:
             channel = self._get_physical_channel(self.active_cell)
-        )
+
+        # start listening
+        self.mote.radio.startRx(channel=channel)
 
         # indicate that we're waiting for the RX operation to finish
         self.waitingFor = d.WAITING_FOR_RX
 
-    def _get_physical_channel(self, cell):
+    def _get_physical_channel(self, cell, asn=None):
         # see section 6.2.6.3 of IEEE 802.15.4-2015
+        if asn is None:
+            asn = self.engine.getAsn()
         return self.hopping_sequence[
-            (self.engine.getAsn() + cell.channel_offset) %
-            len(self.hopping_sequence)
+            (asn + cell.channel_offset) % self.hopping_sequence_length
         ]
 
     # EBs
@@ -1158,15 +1235,15 @@ class Tsch(object):
             newEB = None
         else:
             # create
-            newEB = {
-                u'type':            d.PKT_TYPE_EB,
-                u'mac': {
-                    u'srcMac':      self.mote.get_mac_addr(),
-                    u'dstMac':      d.BROADCAST_ADDRESS,     # broadcast
-                    u'join_metric': self.mote.rpl.getDagRank() - 1
-                },
-                u'pkt_len':        d.PKT_LEN_EB,  # bytes
-            }
+            newEB = Packet(
+                type        = d.PKT_TYPE_EB,
+                mac         = MacInfo(
+                    srcMac      = self.mote.get_mac_addr(),
+                    dstMac      = d.BROADCAST_ADDRESS,     # broadcast
+                    join_metric = self.mote.rpl.getDagRank() - 1
+                ),
+                pkt_len     = d.PKT_LEN_EB,  # bytes
+            )
 
             # log
             self.log(
@@ -1448,13 +1525,9 @@ class Tsch(object):
         assert self.waitingFor == None
         assert self.pktToSend == None
 
-        for packet in self.txQueue:
-            if (
-                    packet[u'mac'][u'dstMac'] ==
-                    self.args_for_next_pending_bit_task[u'dstMac']
-                ):
-                self.pktToSend = packet
-                break
+        self.pktToSend = self.txQueue.get_first_frame(
+            self.args_for_next_pending_bit_task[u'dstMac']
+        )
 
         if self.pktToSend is None:
             # done
@@ -1520,9 +1593,9 @@ class Clock(object):
 
     def desync(self):
         self.source             = None
+        self._source_clock      = None
         self._clock_off_on_sync = 0
-        self._accumulated_error = 0
-        self._last_clock_access = None
+        self._sync_time         = None
 
     def sync(self, clock_source=None):
         if self.mote.dagRoot is True:
@@ -1532,47 +1605,49 @@ class Clock(object):
         else:
             if clock_source is None:
                 assert self.source is not None
-            else:
-                self.source = clock_source
+            elif clock_source != self.source:
+                self.source        = clock_source
+                self._source_clock = None
 
             # the clock could be off by between 0 and 30 usec (clock interval)
             # from the clock source when 32.768 Hz oscillators are used on the
             # both sides. in addition, the clock source also off from a certain
             # amount of time from its source.
             off_from_source = random.random() * self._clock_interval
-            source_clock = self.get_clock_by_mac_addr(self.source)
-            self._clock_off_on_sync = off_from_source + source_clock.get_drift()
+            if self._source_clock is None:
+                # the clock of the source is looked up once per source
+                self._source_clock = self.get_clock_by_mac_addr(self.source)
+            self._clock_off_on_sync = (
+                off_from_source + self._source_clock.get_drift()
+            )
 
-        self._accumulated_error = 0
-        self._last_clock_access = self.engine.getAsn()
+        # start a new sync epoch; the drift grows linearly from here
+        self._sync_time = self.engine.global_time
 
-    def get_drift(self):
+    def get_drift(self, global_time=None):
+        """
+        Return the offset of the clock from the clock of the DAGRoot at
+        global_time (now by default). The drift is evaluated in closed form,
+        the offset on sync plus the error rate times the time elapsed since
+        the sync, so that reading it has no side effect.
+        """
         if self.mote.dagRoot is True:
             # if we're the DAGRoot, we are the clock source of the entire
             # network. our clock never drifts from itself. Its clock drift is
             # taken into accout by motes who use our clock as their reference
             # clock.
-            error = 0
-        elif self._last_clock_access:
-            assert self._last_clock_access <= self.engine.global_time
-            elapsed_time  = self.engine.global_time - self._last_clock_access
-            error = elapsed_time * self._error_rate
-        else:
-            # self._last_clock_access is None; we're desynchronized.
-            # in this case, we will return 0 as drift, although there
-            # should be a better thing to do.
-            error = None
-
-        if error:
-            # update the variables
-            self._accumulated_error += error
-            self._last_clock_access = self.engine.global_time
-
-            # return the result
-            return self._clock_off_on_sync + self._accumulated_error
-        else:
+            return 0
+        elif self._sync_time is None:
+            # we're desynchronized. in this case, we will return 0 as drift,
+            # although there should be a better thing to do.
             return 0
 
+        if global_time is None:
+            global_time = self.engine.global_time
+        assert self._sync_time <= global_time
+        elapsed_time = global_time - self._sync_time
+        return self._clock_off_on_sync + elapsed_time * self._error_rate
+
     def _initialize_error_rate(self):
         # private variables:
         # the clock drifts by its error rate. for simplicity, we double the
@@ -1588,16 +1663,396 @@ class Clock(object):
         return random.uniform(-1 * max_drift * 2, max_drift * 2)
 
 
+class TxQueue(object):
+    """
+    Queue of the frames to transmit, which keeps the frames of each
+    destination MAC address in sub-queues as well
+
+    Each frame gets a key when it is put into the queue; the frames are
+    held in insertion-ordered dicts indexed by their keys, so that a frame
+    is unlinked in O(1). The priority frames are held ahead of the normal
+    ones: a frame having the priority flag is put after the other priority
+    frames, and a normal frame at the tail of the queue.
+
+    A sub-queue has the frames in the same order as the TX queue. The
+    frames are indexed by their destination and their priority at the time
+    they are put into the queue.
+    """
+
+    def __init__(self, frames=()):
+        self.key_counter = count()
+        # key -> frame
+        self.priority_frames = {}
+        self.normal_frames = {}
+        # dstMac -> {key -> frame}
+        self.priority_frames_by_dst_mac = {}
+        self.normal_frames_by_dst_mac = {}
+        # key -> dstMac of the frame when it was put
+        self.dst_mac_addrs = {}
+        # id(frame) -> keys of the frame; a frame can be put more than once
+        self.keys_by_frame_id = {}
+        self.extend(frames)
+
+    @staticmethod
+    def _get_dst_mac_addr(frame):
+        if (u'mac' in frame) and (u'dstMac' in frame[u'mac']):
+            return frame[u'mac'][u'dstMac']
+        else:
+            return None
+
+    @staticmethod
+    def _is_priority_frame(frame):
+        return (
+            (u'mac' in frame)
+            and
+            (frame[u'mac'].get(u'priority') is True)
+        )
+
+    @property
+    def num_priority_frames(self):
+        return len(self.priority_frames)
+
+    def _get_frames(self, key):
+        # return the frames and the sub-queues of the section having the key
+        if key in self.priority_frames:
+            return (self.priority_frames, self.priority_frames_by_dst_mac)
+        else:
+            return (self.normal_frames, self.normal_frames_by_dst_mac)
+
+    def _get_key(self, index):
+        num_frames = len(self)
+        if index < 0:
+            index += num_frames
+        if not (0 <= index < num_frames):
+            raise IndexError(u'TX queue index out of range')
+
+        if index < len(self.priority_frames):
+            frames = self.priority_frames
+        else:
+            frames = self.normal_frames
+            index -= len(self.priority_frames)
+
+        if index == len(frames) - 1:
+            return next(reversed(frames))
+        else:
+            # walk from the head of the section
+            return next(islice(frames, index, None))
+
+    def _find_key(self, frame):
+        keys = self.keys_by_frame_id.get(id(frame))
+        if keys:
+            # the first one in the TX queue
+            return min(
+                keys,
+                key=lambda key: (key not in self.priority_frames, key)
+            )
+
+        # look for an equal frame as list.remove() does, only among the
+        # frames having the same dstMac
+        dst_mac_addr = self._get_dst_mac_addr(frame)
+        for frames_by_dst_mac in [
+                self.priority_frames_by_dst_mac,
+                self.normal_frames_by_dst_mac
+            ]:
+            sub_queue = frames_by_dst_mac.get(dst_mac_addr, {})
+            for key, _frame in sub_queue.items():
+                if _frame == frame:
+                    return key
+        return None
+
+    def _unlink(self, key):
+        (frames, frames_by_dst_mac) = self._get_frames(key)
+        frame = frames.pop(key)
+
+        dst_mac_addr = self.dst_mac_addrs.pop(key)
+        sub_queue = frames_by_dst_mac[dst_mac_addr]
+        del sub_queue[key]
+        if len(sub_queue) == 0:
+            del frames_by_dst_mac[dst_mac_addr]
+
+        keys = self.keys_by_frame_id[id(frame)]
+        keys.remove(key)
+        if len(keys) == 0:
+            del self.keys_by_frame_id[id(frame)]
+
+        return frame
+
+    def get_frames(self, dst_mac_addr):
+        return (
+            list(self.priority_frames_by_dst_mac.get(dst_mac_addr, {}).values())
+            +
+            list(self.normal_frames_by_dst_mac.get(dst_mac_addr, {}).values())
+        )
+
+    def get_first_frame(self, dst_mac_addr):
+        for frames_by_dst_mac in [
+                self.priority_frames_by_dst_mac,
+                self.normal_frames_by_dst_mac
+            ]:
+            if dst_mac_addr in frames_by_dst_mac:
+                return next(iter(frames_by_dst_mac[dst_mac_addr].values()))
+        return None
+
+    def get_num_frames(self, dst_mac_addr):
+        return (
+            len(self.priority_frames_by_dst_mac.get(dst_mac_addr, {}))
+            +
+            len(self.normal_frames_by_dst_mac.get(dst_mac_addr, {}))
+        )
+
+    def get_dst_mac_addrs(self):
+        return list(
+            dict.fromkeys(
+                chain(
+                    self.priority_frames_by_dst_mac,
+                    self.normal_frames_by_dst_mac
+                )
+            )
+        )
+
+    def remove_frames_if(self, condition, dst_mac_addr=None):
+        """
+        Remove all the frames satisfying the condition in a single pass
+        :param condition: a function taking a frame, returning True to
+                          remove the frame
+        :param dst_mac_addr: if not None, only the frames destined to this
+                             MAC address are examined
+        """
+        if dst_mac_addr is None:
+            frames = chain(
+                self.priority_frames.items(),
+                self.normal_frames.items()
+            )
+        else:
+            frames = chain(
+                self.priority_frames_by_dst_mac.get(dst_mac_addr, {}).items(),
+                self.normal_frames_by_dst_mac.get(dst_mac_addr, {}).items()
+            )
+        for key in [key for (key, frame) in frames if condition(frame)]:
+            self._unlink(key)
+
+    # list interface
+
+    def append(self, frame):
+        key = next(self.key_counter)
+        if self._is_priority_frame(frame):
+            frames = self.priority_frames
+            frames_by_dst_mac = self.priority_frames_by_dst_mac
+        else:
+            frames = self.normal_frames
+            frames_by_dst_mac = self.normal_frames_by_dst_mac
+        dst_mac_addr = self._get_dst_mac_addr(frame)
+
+        frames[key] = frame
+        frames_by_dst_mac.setdefault(dst_mac_addr, {})[key] = frame
+        self.dst_mac_addrs[key] = dst_mac_addr
+        self.keys_by_frame_id.setdefault(id(frame), []).append(key)
+
+    def extend(self, frames):
+        for frame in frames:
+            self.append(frame)
+
+    def __iadd__(self, frames):
+        self.extend(frames)
+        return self
+
+    def pop(self, index=-1):
+        return self._unlink(self._get_key(index))
+
+    def remove(self, frame):
+        key = self._find_key(frame)
+        if key is None:
+            raise ValueError(u'frame is not in the TX queue')
+        self._unlink(key)
+
+    def clear(self):
+        self.priority_frames = {}
+        self.normal_frames = {}
+        self.priority_frames_by_dst_mac = {}
+        self.normal_frames_by_dst_mac = {}
+        self.dst_mac_addrs = {}
+        self.keys_by_frame_id = {}
+
+    def __len__(self):
+        return len(self.priority_frames) + len(self.normal_frames)
+
+    def __iter__(self):
+        return chain(
+            self.priority_frames.values(),
+            self.normal_frames.values()
+        )
+
+    def __reversed__(self):
+        return chain(
+            reversed(self.normal_frames.values()),
+            reversed(self.priority_frames.values())
+        )
+
+    def __contains__(self, frame):
+        return self._find_key(frame) is not None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        key = self._get_key(index)
+        (frames, _) = self._get_frames(key)
+        return frames[key]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, TxQueue)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return u'TxQueue({0!r})'.format(list(self))
+
+
+class ScheduleDispatcher(object):
+    """
+    Compiled schedule of all the motes
+
+    For each slotframe length, the motes are indexed by the slot offsets
+    where they have cells; SlotFrame.add() and delete() keep the index
+    current. A single event per active ASN wakes up the synchronized motes
+    having a cell on that ASN, instead of each mote scheduling its own
+    _action_active_cell event.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+        self.tschs = {} # indexed by mote_id
+        # slotframe length -> {slot_offset: {mote_id: number of slotframes}}
+        self.motes_by_slot = {}
+        # slotframe length -> sorted list of the slot offsets in motes_by_slot
+        self.busy_slots = {}
+        # ASN of the scheduled dispatch
+        self.next_asn = None
+
+    def register(self, tsch):
+        self.tschs[tsch.mote.id] = tsch
+
+    def add_slot(self, slotframe, slot_offset):
+        length = slotframe.length
+        if length not in self.motes_by_slot:
+            self.motes_by_slot[length] = {}
+            self.busy_slots[length] = []
+        motes = self.motes_by_slot[length]
+        if slot_offset not in motes:
+            motes[slot_offset] = {}
+            bisect.insort(self.busy_slots[length], slot_offset)
+        mote_ids = motes[slot_offset]
+        mote_ids[slotframe.mote_id] = mote_ids.get(slotframe.mote_id, 0) + 1
+
+        # dispatch earlier, in case the slot comes before the scheduled one
+        asn = self.engine.getAsn()
+        num_slots = (slot_offset - asn) % length
+        if num_slots == 0:
+            num_slots = length
+        if (self.next_asn is None) or (asn + num_slots < self.next_asn):
+            self._schedule_dispatch(asn + num_slots)
+
+    def delete_slot(self, slotframe, slot_offset):
+        # a scheduled dispatch is kept; it does nothing if no mote is left
+        length = slotframe.length
+        motes = self.motes_by_slot[length]
+        mote_ids = motes[slot_offset]
+        mote_ids[slotframe.mote_id] -= 1
+        if mote_ids[slotframe.mote_id] == 0:
+            del mote_ids[slotframe.mote_id]
+        if len(mote_ids) == 0:
+            del motes[slot_offset]
+            del self.busy_slots[length][
+                bisect.bisect_left(self.busy_slots[length], slot_offset)
+            ]
+        if len(motes) == 0:
+            del self.motes_by_slot[length]
+            del self.busy_slots[length]
+
+    def get_mote_ids_at_asn(self, asn):
+        mote_ids = set()
+        for length, motes in self.motes_by_slot.items():
+            slot_offset = asn % length
+            if slot_offset in motes:
+                mote_ids.update(motes[slot_offset])
+        return sorted(mote_ids)
+
+    def get_num_slots_to_next_dispatch(self, asn):
+        ret_val = None
+        for length, busy_slots in self.busy_slots.items():
+            current_slot_offset = asn % length
+            i = bisect.bisect_right(busy_slots, current_slot_offset)
+            if i < len(busy_slots):
+                num_slots = busy_slots[i] - current_slot_offset
+            else:
+                # wrap around; this can be the current slot offset itself
+                num_slots = busy_slots[0] + length - current_slot_offset
+            if (ret_val is None) or (num_slots < ret_val):
+                ret_val = num_slots
+        return ret_val
+
+    def _schedule_dispatch(self, asn):
+        self.next_asn = asn
+        self.engine.scheduleAtAsn(
+            asn            = asn,
+            cb             = self._action_dispatch,
+            uniqueTag      = (u'ScheduleDispatcher', u'_action_dispatch'),
+            intraSlotOrder = d.INTRASLOTORDER_STARTSLOT,
+        )
+
+    def _action_dispatch(self):
+        asn = self.engine.getAsn()
+        self.next_asn = None
+
+        for mote_id in self.get_mote_ids_at_asn(asn):
+            tsch = self.tschs[mote_id]
+            if tsch.getIsSync():
+                tsch._action_active_cell()
+
+        # schedule the next dispatch, unless a new cell has already done it
+        num_slots = self.get_num_slots_to_next_dispatch(asn)
+        if (
+                (num_slots is not None)
+                and
+                (
+                    (self.next_asn is None)
+                    or
+                    (asn + num_slots < self.next_asn)
+                )
+            ):
+            self._schedule_dispatch(asn + num_slots)
+
 class SlotFrame(object):
-    def __init__(self, mote_id, slotframe_handle, num_slots):
+
+    # source of the generation numbers, shared among all the slotframes
+    _generations = count()
+
+    def __init__(
+            self,
+            mote_id,
+            slotframe_handle,
+            num_slots,
+            schedule_dispatcher=None
+        ):
         self.log = SimEngine.SimLog.SimLog().log
 
         self.mote_id = mote_id
         self.slotframe_handle = slotframe_handle
         self.length = num_slots
+        self.schedule_dispatcher = schedule_dispatcher
         self.slots  = {}
+        # sorted list of the slot offsets in self.slots
+        self.busy_slots = []
+        # sorted list of the slot offsets not in self.slots
+        self.free_slots = list(range(num_slots))
         # index by neighbor_mac_addr for quick access
         self.cells  = {}
+        # index by (slot_offset, channel_offset, mac_addr) for get_cell()
+        self.cells_by_location = {}
+        # changed on every add(), delete() and set_length()
+        self.generation = next(self._generations)
 
     def __repr__(self):
         return u'slotframe(length: {0}, num_cells: {1})'.format(
@@ -1607,8 +2062,15 @@ class SlotFrame(object):
 
     def add(self, cell):
         assert cell.slot_offset < self.length
+        assert cell.slotframe_handle in [None, self.slotframe_handle]
         if cell.slot_offset not in self.slots:
             self.slots[cell.slot_offset] = [cell]
+            bisect.insort(self.busy_slots, cell.slot_offset)
+            del self.free_slots[
+                bisect.bisect_left(self.free_slots, cell.slot_offset)
+            ]
+            if self.schedule_dispatcher is not None:
+                self.schedule_dispatcher.add_slot(self, cell.slot_offset)
         else:
             self.slots[cell.slot_offset] += [cell]
 
@@ -1616,7 +2078,13 @@ class SlotFrame(object):
             self.cells[cell.mac_addr] = [cell]
         else:
             self.cells[cell.mac_addr] += [cell]
+        location = (cell.slot_offset, cell.channel_offset, cell.mac_addr)
+        if location not in self.cells_by_location:
+            self.cells_by_location[location] = [cell]
+        else:
+            self.cells_by_location[location] += [cell]
         cell.slotframe = self
+        self.generation = next(self._generations)
 
         # log
         self.log(
@@ -1639,8 +2107,19 @@ class SlotFrame(object):
         self.cells[cell.mac_addr].remove(cell)
         if len(self.cells[cell.mac_addr]) == 0:
             del self.cells[cell.mac_addr]
+        location = (cell.slot_offset, cell.channel_offset, cell.mac_addr)
+        self.cells_by_location[location].remove(cell)
+        if len(self.cells_by_location[location]) == 0:
+            del self.cells_by_location[location]
         if len(self.slots[cell.slot_offset]) == 0:
             del self.slots[cell.slot_offset]
+            del self.busy_slots[
+                bisect.bisect_left(self.busy_slots, cell.slot_offset)
+            ]
+            bisect.insort(self.free_slots, cell.slot_offset)
+            if self.schedule_dispatcher is not None:
+                self.schedule_dispatcher.delete_slot(self, cell.slot_offset)
+        self.generation = next(self._generations)
 
         # log
         self.log(
@@ -1662,6 +2141,14 @@ class SlotFrame(object):
         else:
             return []
 
+    def get_cell(self, slot_offset, channel_offset, mac_addr):
+        location = (slot_offset, channel_offset, mac_addr)
+        if location in self.cells_by_location:
+            # the first one added, as get_cells_by_slot_offset() lists it
+            return self.cells_by_location[location][0]
+        else:
+            return None
+
     def get_cells_at_asn(self, asn):
         slot_offset = asn % self.length
         return self.get_cells_by_slot_offset(slot_offset)
@@ -1673,18 +2160,18 @@ class SlotFrame(object):
             return []
 
     def get_busy_slots(self):
-        busy_slots = list(self.slots.keys())
-        # busy_slots.sort()
-        return busy_slots
+        return self.busy_slots[:]
 
     def get_num_slots_to_next_active_cell(self, asn):
-        diff = 1
-        while diff <= self.length:
-            slot_offset = (asn + diff) % self.length
-            if slot_offset in self.slots:
-                return diff
-            diff += 1
-        return None
+        if not self.busy_slots:
+            return None
+        current_slot_offset = asn % self.length
+        i = bisect.bisect_right(self.busy_slots, current_slot_offset)
+        if i < len(self.busy_slots):
+            return self.busy_slots[i] - current_slot_offset
+        else:
+            # wrap around; this can be the current slot offset itself
+            return self.busy_slots[0] + self.length - current_slot_offset
 
     def get_available_slots(self):
         """
@@ -1692,8 +2179,52 @@ class SlotFrame(object):
         :return: a list of slot offsets (int)
         :rtype: list
         """
-        all_slots = set(range(self.length))
-        return list(all_slots - set(self.get_busy_slots()))
+        return self.free_slots[:]
+
+    def is_available_slot(self, slot_offset):
+        return (
+            (0 <= slot_offset < self.length)
+            and
+            (slot_offset not in self.slots)
+        )
+
+    def sample_available_slots(self, num_slots, excluded_slots):
+        """
+        Pick slot offsets at random out of the available ones
+        :param num_slots: the number of slot offsets to pick
+        :param excluded_slots: a set of slot offsets not to pick
+        :return: a list of num_slots slot offsets, or [] if the slotframe
+                 doesn't have enough available slots
+        :rtype: list
+        """
+        num_excluded = len(
+            [s for s in excluded_slots if self.is_available_slot(s)]
+        )
+        num_available = len(self.free_slots) - num_excluded
+        if num_available < num_slots:
+            return []
+        elif (num_excluded + num_slots) * 2 > len(self.free_slots):
+            # a draw out of free_slots would hit an excluded or an already
+            # picked slot offset more often than not; filter them out first
+            return random.sample(
+                [s for s in self.free_slots if s not in excluded_slots],
+                num_slots
+            )
+
+        # draw from free_slots until we get enough slot offsets; at least
+        # half of free_slots is neither excluded nor picked at any draw,
+        # then less than two draws per slot offset are expected. A dict
+        # keeps the slot offsets in the order they are picked.
+        selected_slots = {}
+        while len(selected_slots) < num_slots:
+            slot_offset = random.choice(self.free_slots)
+            if (
+                    (slot_offset not in excluded_slots)
+                    and
+                    (slot_offset not in selected_slots)
+                ):
+                selected_slots[slot_offset] = None
+        return list(selected_slots)
 
     def get_cells_filtered(self, mac_addr="", cell_options=None):
         """
@@ -1727,21 +2258,59 @@ class SlotFrame(object):
             slot_offset = new_length
             while slot_offset < self.length:
                 if slot_offset in self.slots:
-                    for cell in self.slots[slot_offset]:
+                    for cell in self.slots[slot_offset][:]:
                         self.delete(cell)
                 slot_offset += 1
 
         # apply the new length
+        if self.schedule_dispatcher is not None:
+            # the slots are indexed by the length of the slotframe
+            for slot_offset in self.busy_slots:
+                self.schedule_dispatcher.delete_slot(self, slot_offset)
+        if new_length < self.length:
+            del self.free_slots[
+                bisect.bisect_left(self.free_slots, new_length):
+            ]
+        else:
+            self.free_slots.extend(range(self.length, new_length))
         self.length = new_length
+        self.generation = next(self._generations)
+        if self.schedule_dispatcher is not None:
+            for slot_offset in self.busy_slots:
+                self.schedule_dispatcher.add_slot(self, slot_offset)
 
 class Cell(object):
+
+    # bit assigned to each cell option in Cell.options_bitmask
+    OPTION_BITS = {
+        d.CELLOPTION_TX:     0x01,
+        d.CELLOPTION_RX:     0x02,
+        d.CELLOPTION_SHARED: 0x04,
+    }
+
+    __slots__ = [
+        u'slot_offset',
+        u'channel_offset',
+        u'options',
+        u'options_bitmask',
+        u'mac_addr',
+        u'link_type',
+        u'slotframe_handle',
+        u'key',
+        u'slotframe',
+        u'num_tx',
+        u'num_tx_ack',
+        u'num_rx',
+    ]
+
     def __init__(
             self,
             slot_offset,
             channel_offset,
             options,
             mac_addr=None,
-            link_type=d.LINKTYPE_NORMAL
+            link_type=d.LINKTYPE_NORMAL,
+            slotframe_handle=None
         ):
 
         # FIXME: is_advertising is not used effectively now
@@ -1750,11 +2319,26 @@ class Cell(object):
         assert slot_offset    < 0x10000
         assert channel_offset < 0x10000
 
-        self.slot_offset    = slot_offset
-        self.channel_offset = channel_offset
-        self.options        = options
-        self.mac_addr       = mac_addr
-        self.link_type      = link_type
+        self.slot_offset      = slot_offset
+        self.channel_offset   = channel_offset
+        self.options          = options
+        self.options_bitmask  = 0
+        for option in options:
+            self.options_bitmask |= self.OPTION_BITS[option]
+        self.mac_addr         = mac_addr
+        self.link_type        = link_type
+        self.slotframe_handle = slotframe_handle
+
+        # identity of the cell; none of its fields changes once the cell is
+        # created, which makes it usable for __eq__() and __hash__()
+        self.key = (
+            slotframe_handle,
+            slot_offset,
+            channel_offset,
+            mac_addr,
+            self.options_bitmask,
+            link_type
+        )
 
         # back reference to slotframe; this will be set in SlotFrame.add()
         self.slotframe = None
@@ -1779,7 +2363,15 @@ class Cell(object):
         )
 
     def __eq__(self, other):
-        return str(self) == str(other)
+        if not isinstance(other, Cell):
+            return False
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.key)
 
     def increment_num_tx(self):
         self.num_tx += 1
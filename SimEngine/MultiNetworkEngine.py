@@ -29,11 +29,12 @@ import traceback
 import json
 
 from . import Mote
+from .Mote import addr
 from . import SimSettings
 from . import SimLog
 from . import Connectivity
 from . import SimConfig
-from .SimEngineDefines import TIME_RESOLUTION, TIME_STEP, Event
+from .SimEngineDefines import TIME_RESOLUTION, TIME_STEP, FIDELITY_SUBSLOT, FIDELITY_SLOT, FIDELITY_ADAPTIVE, Event
 
 
 class SingletonMeta(type):
@@ -70,6 +71,7 @@ class DiscreteEventEngine(threading.Thread, metaclass=SingletonMeta):
             self.global_time                    = 0
             self.time_step                      = TIME_STEP
             self.time_resolution                = TIME_RESOLUTION
+            self.fidelity                       = FIDELITY_SUBSLOT
             self.events                         = []
 
             # initialize parent class
@@ -233,6 +235,10 @@ class DiscreteEventEngine(threading.Thread, metaclass=SingletonMeta):
         heap_top = self._heap_top()
         if not heap_top:
             return False
+        if self.fidelity == FIDELITY_SLOT:
+            # a step covers a whole slot; events on the slot boundary belong
+            # to the current step
+            return heap_top.time > self.global_time
         return heap_top.time >= self.global_time
     
     def removeFutureEvent(self, uniqueTag):
@@ -343,7 +349,12 @@ class NetworkInstance:
         self.verbose:bool = engine.verbose
         self.network_id:str = network_id
         self.motes:dict = {}  # mote_id -> Mote instance
+        self.motes_by_mac_addr_int:dict = {}  # MAC address (int) -> Mote instance
         self.start_time = start_time  # global time offset in the engine
+        # current ASN, valid while asn_start_time <= global_time < asn_end_time
+        self.asn = 0
+        self.asn_start_time = start_time
+        self.asn_end_time = start_time  # the first access computes the ASN
         self.root_mote_id = None  # to be set when the network is started
         self.engine:MultiNetworkSimEngine = engine
 
@@ -353,12 +364,26 @@ class NetworkInstance:
             # we should withdraw the previous root mote and then set the new one
             raise ValueError("Root mote is already set for network {0}".format(self.network_id))
         self.root_mote_id = mote.id
-        self.motes[mote.id] = mote
+        self._add_mote(mote)
         mote.setDagRoot()
-    
+
+    def _add_mote(self, mote: Mote.Mote):
+        """add a mote to the network, indexing it by its MAC address"""
+        self.motes[mote.id] = mote
+        self.motes_by_mac_addr_int[mote.mac_addr_int] = mote
+
+    def _update_mote_mac_addr(self, mote: Mote.Mote, old_mac_addr_int):
+        """re-index a mote of the network whose MAC address has changed"""
+        if self.motes_by_mac_addr_int.get(old_mac_addr_int) is mote:
+            del self.motes_by_mac_addr_int[old_mac_addr_int]
+            self.motes_by_mac_addr_int[mote.mac_addr_int] = mote
+
+    def get_mote_by_mac_addr(self, mac_addr):
+        return self.motes_by_mac_addr_int.get(addr.mac_addr_to_int(mac_addr))
+
     def _actionEndSlotframe(self):
         """Called at each end of slotframe_iteration."""
-        slotframe_iteration = int(old_div(self.engine._get_current_network_asn(self.network_id), self.engine.settings.tsch_slotframeLength))
+        slotframe_iteration = int(old_div(self.engine._get_network_asn(self), self.engine.settings.tsch_slotframeLength))
         
         # print
         if self.verbose:
@@ -367,7 +392,7 @@ class NetworkInstance:
         # schedule next statistics collection
         self.engine.scheduleAtAsn(
             network_id       = self.network_id,
-            asn              = self.engine._get_current_network_asn(self.network_id) + self.engine.settings.tsch_slotframeLength,
+            asn              = self.engine._get_network_asn(self) + self.engine.settings.tsch_slotframeLength,
             cb               = self._actionEndSlotframe,
             uniqueTag        = (u'DiscreteEventEngine', u'_actionEndSlotframe'),
             intraSlotOrder   = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS
@@ -388,6 +413,13 @@ class MultiNetworkSimEngine(DiscreteEventEngine):
         
         # multi-network specific variables
         self.networks = {}  # network_id -> NetworkInstance
+        self.motes_by_mac_addr_int = {}  # MAC address (int) -> Mote instance
+        self.schedule_dispatcher = None  # set when tsch_compiled_schedule is enabled
+        self.radio_stats = None  # radio activity counters of all the motes
+        self.sixp_timer_wheel = None  # 6P transaction timeouts of all the motes
+        self.trickle_service = None  # events of all the Trickle timers
+        self.app_scheduler = None  # application packet arrivals of all the motes
+        self.msf_autonomous_cells = {}  # MSF autonomous cells of all the motes, by (slotframe length, number of channels) and MAC address
         self.network_channels = defaultdict(set)  # channel -> set of network_ids using this channel, and this network channels should be initialized in _init_additional_local_variables
         self.connectivity = None
 
@@ -429,11 +461,18 @@ class MultiNetworkSimEngine(DiscreteEventEngine):
         assert type(current_asn) is int
         return current_asn
 
+    def _get_network_asn(self, network: NetworkInstance):
+        """current ASN of a network, computed once per slot"""
+        if not (network.asn_start_time <= self.global_time < network.asn_end_time):
+            network.asn = self._get_current_network_asn(network.network_id)
+            network.asn_start_time = self.global_time
+            network.asn_end_time = self.asn_to_global_time(network.asn + 1, network.network_id)
+        return network.asn
+
     def getAsn(self):
         """This function is used to be compatible with the previous one
             TODO: change the code to remove all getAsn"""
-        network_id = self.default_network_id
-        return self._get_current_network_asn(network_id)
+        return self._get_network_asn(self.networks[self.default_network_id])
 
 
     def asn_to_global_time(self, asn, network_id:str):
@@ -509,6 +548,26 @@ class MultiNetworkSimEngineInstance(MultiNetworkSimEngine):
         # apply the random seed; log the seed after self.log is initialized
         random.seed(a=self.random_seed)
 
+        # select the propagation fidelity; with slot fidelity the engine
+        # advances one slot per step and Connectivity resolves the whole slot
+        # in a single pass
+        self.fidelity = self.settings.conn_fidelity
+        if   self.fidelity == FIDELITY_SLOT:
+            self.time_step = int(self.settings.tsch_slotDuration)
+        elif self.fidelity in [FIDELITY_SUBSLOT, FIDELITY_ADAPTIVE]:
+            self.time_step = TIME_STEP
+        else:
+            raise ValueError(u'unsupported conn_fidelity: {0}'.format(self.fidelity))
+
+        # the motes are not assigned to networks; the radio activity of all
+        # of them is accounted in a single table
+        self.radio_stats = Mote.radio.RadioStats(self, self.settings.exec_numMotes)
+
+        # with a compiled schedule, one event per active slot wakes up all
+        # the motes having a cell on that slot
+        if self.settings.tsch_compiled_schedule:
+            self.schedule_dispatcher = Mote.tsch.ScheduleDispatcher(self)
+
         if hasattr(self.settings, 'motes_eui64') and self.settings.motes_eui64:
             eui64_table = self.settings.motes_eui64[:]
             if len(eui64_table) < self.settings.exec_numMotes:
@@ -521,9 +580,11 @@ class MultiNetworkSimEngineInstance(MultiNetworkSimEngine):
             for id, eui64 in zip(range(self.settings.exec_numMotes), eui64_table)
         ]
         
-        eui64_list = set([mote.get_mac_addr() for mote in self.motes])
-        if len(eui64_list) != len(self.motes):
-            assert len(eui64_list) < len(self.motes)
+        self.motes_by_mac_addr_int = dict(
+            [(mote.mac_addr_int, mote) for mote in self.motes]
+        )
+        if len(self.motes_by_mac_addr_int) != len(self.motes):
+            assert len(self.motes_by_mac_addr_int) < len(self.motes)
             raise ValueError(u'given motes_eui64 causes dulicates')
 
         self.connectivity               = Connectivity.Connectivity(self)
@@ -570,7 +631,7 @@ class MultiNetworkSimEngineInstance(MultiNetworkSimEngine):
         for network in self.networks.values():
             # schedule first statistics collection for each network
             self.scheduleAtAsn(
-                asn              = self._get_current_network_asn(network_id=network.network_id) + self.settings.tsch_slotframeLength,
+                asn              = self._get_network_asn(network) + self.settings.tsch_slotframeLength,
                 cb               = network._actionEndSlotframe,
                 uniqueTag        = (u'DiscreteEventEngine', u'_actionEndSlotframe'),
                 intraSlotOrder   = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS
@@ -597,8 +658,13 @@ class MultiNetworkSimEngineInstance(MultiNetworkSimEngine):
         )
 
     def get_mote_by_mac_addr(self, mac_addr):
-        for mote in self.motes:
-            if mote.is_my_mac_addr(mac_addr):
-                return mote
-        return None
+        return self.motes_by_mac_addr_int.get(addr.mac_addr_to_int(mac_addr))
+
+    def update_mote_mac_addr(self, mote, old_mac_addr_int):
+        """re-index a mote whose MAC address has changed"""
+        if self.motes_by_mac_addr_int.get(old_mac_addr_int) is mote:
+            del self.motes_by_mac_addr_int[old_mac_addr_int]
+            self.motes_by_mac_addr_int[mote.mac_addr_int] = mote
+        for network in self.networks.values():
+            network._update_mote_mac_addr(mote, old_mac_addr_int)
 
@@ -22,6 +22,7 @@ import traceback
 import json
 
 from . import Mote
+from .Mote import addr
 from . import SimSettings
 from . import SimLog
 from . import Connectivity
@@ -68,6 +69,7 @@ class DiscreteEventEngine(threading.Thread):
             self.events                         = {}
             self.uniqueTagSchedule              = {}
             self.random_seed                    = None
+            self.motes_by_mac_addr_int          = {}
             self._init_additional_local_variables()
 
             # initialize parent class
@@ -210,10 +212,12 @@ class DiscreteEventEngine(threading.Thread):
         return self.asn
 
     def get_mote_by_mac_addr(self, mac_addr):
-        for mote in self.motes:
-            if mote.is_my_mac_addr(mac_addr):
-                return mote
-        return None
+        return self.motes_by_mac_addr_int.get(addr.mac_addr_to_int(mac_addr))
+
+    def update_mote_mac_addr(self, mote, old_mac_addr_int):
+        if self.motes_by_mac_addr_int.get(old_mac_addr_int) is mote:
+            del self.motes_by_mac_addr_int[old_mac_addr_int]
+            self.motes_by_mac_addr_int[mote.mac_addr_int] = mote
 
     #=== scheduling
 
@@ -404,9 +408,11 @@ class SimEngine(DiscreteEventEngine):
             )
         ]
 
-        eui64_list = set([mote.get_mac_addr() for mote in self.motes])
-        if len(eui64_list) != len(self.motes):
-            assert len(eui64_list) < len(self.motes)
+        self.motes_by_mac_addr_int = dict(
+            [(mote.mac_addr_int, mote) for mote in self.motes]
+        )
+        if len(self.motes_by_mac_addr_int) != len(self.motes):
+            assert len(self.motes_by_mac_addr_int) < len(self.motes)
             raise ValueError(u'given motes_eui64 causes dulicates')
 
         self.connectivity               = Connectivity.Connectivity(self)
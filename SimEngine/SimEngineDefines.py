@@ -12,6 +12,11 @@ elif TIME_RESOLUTION == 'us':
     MICROSECOND = 1
 TIME_STEP = MICROSECOND * 100  # 100 microseconds
 
+# propagation fidelity (conn_fidelity)
+FIDELITY_SUBSLOT  = 'subslot'  # capture/lock-on model, resolved every TIME_STEP
+FIDELITY_SLOT     = 'slot'     # one propagation pass per ASN
+FIDELITY_ADAPTIVE = 'adaptive' # FIDELITY_SUBSLOT only on contended channels
+
 
 class EventView(NamedTuple):
     time: int
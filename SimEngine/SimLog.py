@@ -96,6 +96,7 @@ LOG_TSCH_DELETE_SLOTFRAME         = {u'type': u'tsch.delete_slotframe',     u'ke
 
 # === mote info
 LOG_RADIO_STATS                   = {u'type': u'radio.stats',               u'keys': [u'_mote_id', u'idle_listen', u'tx_data_rx_ack', u'tx_data', u'rx_data_tx_ack', u'rx_data', u'sleep']}
+LOG_RADIO_STATS_ALL               = {u'type': u'radio.stats_all',           u'keys': [u'mote_ids', u'idle_listen', u'tx_data_rx_ack', u'tx_data', u'rx_data_tx_ack', u'rx_data', u'sleep', u'charge']}
 LOG_MAC_ADD_ADDR                  = {u'type': u'mac.add_addr',              u'keys': [u'_mote_id', u'type', u'addr']}
 LOG_IPV6_ADD_ADDR                 = {u'type': u'ipv6.add_addr',             u'keys': [u'_mote_id', u'type', u'addr']}
 
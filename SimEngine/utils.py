@@ -7,6 +7,8 @@ def dataclass_to_dict(obj: Any) -> Any:
         return [dataclass_to_dict(item) for item in obj]
     elif isinstance(obj, dict):
         return {k: dataclass_to_dict(v) for k, v in obj.items()}
+    elif hasattr(obj, 'to_dict'):
+        return dataclass_to_dict(obj.to_dict())
     elif hasattr(obj, '__dataclass_fields__'):  
         result = {}
         for field_name in obj.__dataclass_fields__:
@@ -42,6 +42,29 @@ def openfile(func):
 def mean(numbers):
     return float(sum(numbers)) / max(len(numbers), 1)
 
+def compute_lifetimes(charge_uC, charge_time_s, sync_time_s):
+    """
+    Compute the average current and the AA battery lifetime of motes at once
+    :param charge_uC: charge consumed by each mote
+    :param charge_time_s: time at which each charge was logged
+    :param sync_time_s: time at which each mote got synchronized
+    :return: (avg_current_uA, lifetime_AA_years), NaN for the motes which
+             consumed no charge since they got synchronized
+    :rtype: tuple of numpy.ndarray
+    """
+    charge_uC      = np.asarray(charge_uC, dtype=float)
+    elapsed_s      = (
+        np.asarray(charge_time_s, dtype=float) -
+        np.asarray(sync_time_s, dtype=float)
+    )
+    valid          = (charge_uC > 0) & (elapsed_s > 0)
+    avg_current_uA = np.full(charge_uC.shape, np.nan)
+    avg_current_uA[valid] = charge_uC[valid] / elapsed_s[valid]
+    lifetime_AA_years = (
+        (BATTERY_AA_CAPACITY_mAh * 1000 / avg_current_uA) / (24.0 * 365)
+    )
+    return (avg_current_uA, lifetime_AA_years)
+
 def init_mote():
     return {
         'upstream_num_tx': 0,
@@ -174,24 +197,54 @@ def kpis_all(inputfile):
             allstats[run_id][mote_id]['charge_time_s'] = global_time / SECOND
             allstats[run_id][mote_id]['charge']     = charge
 
+        elif logline['_type'] == SimLog.LOG_RADIO_STATS_ALL['type']:
+            # the charge of all the motes, computed by the simulator
+            for (mote_id, charge) in zip(logline['mote_ids'], logline['charge']):
+
+                # only log non-dagRoot charge
+                if mote_id == DAGROOT_ID:
+                    continue
+
+                if mote_id not in allstats[run_id]:
+                    allstats[run_id][mote_id] = init_mote()
+                allstats[run_id][mote_id]['charge_time_s'] = global_time / SECOND
+                allstats[run_id][mote_id]['charge']        = charge
+
     # === compute advanced motestats
 
     for (run_id, per_mote_stats) in list(allstats.items()):
+
+        # avg_current, lifetime_AA of all the motes of the run at once
+        mote_ids = [
+            mote_id for (mote_id, motestats) in list(per_mote_stats.items())
+            if (
+                (mote_id != 0)
+                and
+                (motestats['sync_time_s'] is not None)
+                and
+                (motestats['charge_time_s'] is not None)
+            )
+        ]
+        (avg_currents_uA, lifetimes_AA_years) = compute_lifetimes(
+            charge_uC     = [per_mote_stats[m]['charge'] for m in mote_ids],
+            charge_time_s = [per_mote_stats[m]['charge_time_s'] for m in mote_ids],
+            sync_time_s   = [per_mote_stats[m]['sync_time_s'] for m in mote_ids]
+        )
+        for (mote_id, avg_current_uA, lifetime_AA_years) in zip(
+                mote_ids,
+                avg_currents_uA.tolist(),
+                lifetimes_AA_years.tolist()
+            ):
+            motestats = per_mote_stats[mote_id]
+            if np.isnan(avg_current_uA):
+                motestats['lifetime_AA_years'] = 'N/A'
+            else:
+                motestats['avg_current_uA']    = avg_current_uA
+                motestats['lifetime_AA_years'] = lifetime_AA_years
+
         for (mote_id, motestats) in list(per_mote_stats.items()):
             if mote_id != 0:
 
-                if (motestats['sync_time_s'] is not None) and (motestats['charge_time_s'] is not None):
-                    # avg_current, lifetime_AA
-                    if (
-                            (motestats['charge'] <= 0)
-                            or
-                            (motestats['charge_time_s'] <= motestats['sync_time_s'])
-                        ):
-                        motestats['lifetime_AA_years'] = 'N/A'
-                    else:
-                        motestats['avg_current_uA'] = motestats['charge']/float((motestats['charge_time_s']-motestats['sync_time_s']))
-                        assert motestats['avg_current_uA'] > 0
-                        motestats['lifetime_AA_years'] = (BATTERY_AA_CAPACITY_mAh*1000/float(motestats['avg_current_uA']))/(24.0*365)
                 if motestats['join_time_s'] is not None:
                     # latencies, upstream_num_tx, upstream_num_rx, upstream_num_lost
                     for (appcounter, pktstats) in list(allstats[run_id][mote_id]['upstream_pkts'].items()):
@@ -1,9 +1,15 @@
 from __future__ import absolute_import
+import json
+import types
+
+import numpy
 import pytest
 
 from . import test_utils as u
 import SimEngine
 import SimEngine.Mote.MoteDefines as d
+from SimEngine.Mote.app import AppPeriodic, AppPoisson, APP_RNG_SEED_OFFSET
+from SimEngine.SimEngineDefines import SECOND
 
 
 APP = ['AppPeriodic', 'AppBurst']
@@ -70,3 +76,146 @@ def test_app_burst(sim_engine):
     logs = u.read_log_file(filter=['app.tx'])
     logs = [log for log in logs if log['_mote_id']==1]
     assert len(logs) == num_burst_packets
+
+def test_app_scheduler(sim_engine):
+    pk_period = 0.2 * SECOND
+    pk_period_var = 0.05
+    schedule_window = 2
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numMotes'     : 4,
+            'app'               : 'AppPeriodic',
+            'app_pkPeriod'      : pk_period,
+            'app_pkPeriodVar'   : pk_period_var,
+            'app_scheduleWindow': schedule_window,
+        }
+    )
+    apps = [mote.app for mote in sim_engine.motes[1:]]
+    scheduler = sim_engine.app_scheduler
+
+    # the scheduler is shared by all the applications
+    for app in apps:
+        assert app.scheduler is scheduler
+        app.startSendingData()
+    window_end_asn = (
+        sim_engine.getAsn() + 1 +
+        schedule_window * sim_engine.settings.tsch_slotframeLength
+    )
+    assert scheduler.window_end_asn == window_end_asn
+    window_end = sim_engine.asn_to_global_time(
+        window_end_asn,
+        sim_engine.default_network_id
+    )
+
+    # the arrivals in the window are generated for all the applications
+    for app in apps:
+        assert app in scheduler.apps
+        assert app.next_arrival >= window_end
+        assert len(scheduler.pending_asns[app]) > 0
+        for asn in scheduler.pending_asns[app]:
+            assert sim_engine.getAsn() < asn < window_end_asn
+            assert scheduler.buckets[asn][app] > 0
+    assert scheduler.next_asn == min(scheduler.buckets)
+    assert sim_engine.is_scheduled((u'AppTrafficScheduler', u'_action_dispatch'))
+    assert sim_engine.is_scheduled((u'AppTrafficScheduler', u'_action_window'))
+
+    # the earliest bucket is dispatched, one call per arrival
+    sent = []
+    for app in apps:
+        app._send_a_single_packet = (lambda app=app: sent.append(app))
+    asn = scheduler.next_asn
+    expected = []
+    for (app, count) in scheduler.buckets[asn].items():
+        expected += [app] * count
+    scheduler._action_dispatch()
+    assert sent == expected
+    assert asn not in scheduler.buckets
+    assert scheduler.next_asn == min(scheduler.buckets)
+
+    # a stopped application has no more arrival
+    num_arrivals = len(scheduler)
+    num_arrivals_of_app = sum(
+        scheduler.buckets[asn][apps[0]]
+        for asn in scheduler.pending_asns.get(apps[0], [])
+    )
+    scheduler.stop(apps[0])
+    assert apps[0] not in scheduler.apps
+    assert apps[0] not in scheduler.pending_asns
+    assert len(scheduler) == num_arrivals - num_arrivals_of_app
+
+def test_app_arrival_distributions(sim_engine):
+    pk_period = 0.2 * SECOND
+    pk_period_var = 0.05
+    sim_engine = sim_engine(
+        diff_config = {
+            'app_pkPeriod'   : pk_period,
+            'app_pkPeriodVar': pk_period_var,
+        }
+    )
+    rng = sim_engine.app_scheduler.rng
+    until = 1000 * pk_period
+
+    # AppPeriodic: intervals are uniform within pkPeriod +/- pkPeriodVar
+    apps = [types.SimpleNamespace(next_arrival=0.0) for _ in range(3)]
+    arrivals = AppPeriodic.generate_arrivals(apps, until, rng)
+    for (app, times) in zip(apps, arrivals):
+        assert times[0] == 0.0
+        assert times[-1] < until <= app.next_arrival
+        intervals = numpy.diff(numpy.append(times, app.next_arrival))
+        assert intervals.min() >= pk_period * (1 - pk_period_var)
+        assert intervals.max() <= pk_period * (1 + pk_period_var)
+
+    # AppPoisson: intervals are exponential with the mean of pkPeriod
+    apps = [types.SimpleNamespace(next_arrival=0.0) for _ in range(3)]
+    arrivals = AppPoisson.generate_arrivals(apps, until, rng)
+    for (app, times) in zip(apps, arrivals):
+        assert times[-1] < until <= app.next_arrival
+        intervals = numpy.diff(times)
+        assert intervals.min() > 0
+        assert abs(intervals.mean() - pk_period) < 0.1 * pk_period
+
+@pytest.mark.parametrize('random_seed', [1234, 'context'])
+def test_app_scheduler_seed(sim_engine, random_seed):
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_randomSeed': random_seed,
+            'app_pkPeriod'   : 60,
+        }
+    )
+
+    # the stream of the arrivals derives from the seed of the run
+    expected = numpy.random.default_rng(
+        sim_engine.random_seed + APP_RNG_SEED_OFFSET
+    )
+    assert (
+        sim_engine.app_scheduler.rng.random(10) == expected.random(10)
+    ).all()
+
+def test_app_trace(sim_engine, tmpdir):
+    trace_file = tmpdir.join('app_trace.json')
+    trace_file.write(json.dumps({'1': [0.5, 0.1, 3.0]}))
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numMotes'     : 3,
+            'app'               : 'AppTrace',
+            'app_traceFile'     : str(trace_file),
+            'app_scheduleWindow': 1,
+        }
+    )
+    scheduler = sim_engine.app_scheduler
+    mote_1 = sim_engine.motes[1]
+    mote_2 = sim_engine.motes[2]
+
+    mote_1.app.startSendingData()
+    mote_2.app.startSendingData()
+
+    # mote_2 has no arrival in the trace
+    assert mote_2.app not in scheduler.apps
+    # the arrivals of mote_1 in the first window are scheduled in the slots
+    # where they fall
+    slot_duration = sim_engine.settings.tsch_slotDuration
+    assert scheduler.pending_asns[mote_1.app] == set([
+        int(0.1 * SECOND // slot_duration),
+        int(0.5 * SECOND // slot_duration)
+    ])
+    assert mote_1.app.next_arrival == 3.0 * SECOND
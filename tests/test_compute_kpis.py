@@ -8,12 +8,14 @@ import subprocess
 import sys
 import types
 
+import numpy
 import pytest
 
 from . import test_utils as u
 from SimEngine import SimLog
 from SimEngine import SimSettings
 import SimEngine.Mote.MoteDefines as d
+from bin import compute_kpis
 
 
 @pytest.fixture(params=['PerHopReassembly', 'FragmentForwarding'])
@@ -192,3 +194,50 @@ def test_compute_battery_lifetime(sim_engine):
 
     # test done
     assert True
+
+def test_radio_stats_all(sim_engine):
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numSlotframesPerRun' : 1,
+            'exec_numMotes'            : 3,
+        }
+    )
+    mote_1 = sim_engine.motes[1]
+    mote_2 = sim_engine.motes[2]
+
+    # make up radio activities
+    mote_1.radio.stats['tx_data'] = 100
+    sim_engine.radio_stats.update(mote_2.id, 'idle_listen', 10)
+    assert mote_2.radio.stats['idle_listen'] == 1
+    assert mote_2.radio.stats['sleep'] == 9
+    assert mote_2.radio.stats['last_updated'] == 10
+
+    # the counters of all the motes are logged in one record
+    sim_engine.radio_stats._log_stats()
+    logs = u.read_log_file(['radio.stats_all'])
+    assert len(logs) == 1
+    log = logs[0]
+    assert log['mote_ids'] == [0, 1, 2]
+    assert log['tx_data'] == [0, 100, 0]
+    assert log['idle_listen'] == [0, 0, 1]
+    assert log['sleep'] == [0, 0, 9]
+    assert log['charge'][0] == 0
+    assert log['charge'][1] == pytest.approx(100 * d.CHARGE_TxData_uC)
+    assert log['charge'][2] == pytest.approx(
+        d.CHARGE_IdleListen_uC + 9 * d.CHARGE_Sleep_uC
+    )
+
+def test_compute_lifetimes():
+    # the motes are computed at once; the ones which consumed no charge
+    # since they got synchronized have no lifetime
+    (avg_current_uA, lifetime_AA_years) = compute_kpis.compute_lifetimes(
+        charge_uC     = [100, 0, 50, 10],
+        charge_time_s = [10, 10, 10, 5],
+        sync_time_s   = [5, 5, 10, 6]
+    )
+    assert avg_current_uA[0] == pytest.approx(20)
+    assert lifetime_AA_years[0] == pytest.approx(
+        (compute_kpis.BATTERY_AA_CAPACITY_mAh * 1000 / 20) / (24.0 * 365)
+    )
+    assert all(numpy.isnan(avg_current_uA[1:]))
+    assert all(numpy.isnan(lifetime_AA_years[1:]))
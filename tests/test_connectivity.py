@@ -19,6 +19,7 @@ from . import test_utils as u
 import SimEngine.Mote.MoteDefines as d
 from SimEngine import SimLog
 from SimEngine.Connectivity import ConnectivityMatrixK7
+from SimEngine.SimEngineDefines import Event
 
 #============================ helpers =========================================
 
@@ -63,6 +64,34 @@ def test_linear_matrix(sim_engine):
                     assert matrix.get_rssi(c, p, channel) == -1000
 
 
+def test_mean_link_quality(sim_engine):
+    engine = sim_engine(
+        diff_config = {
+            'exec_numMotes': 3,
+            'conn_class':    'Linear',
+            'phy_numChans':  4,
+        }
+    )
+    connectivity = engine.connectivity
+    matrix = connectivity.matrix
+    channels = d.TSCH_HOPPING_SEQUENCE[:4]
+
+    assert connectivity.get_mean_pdr(1, 0)  ==  1.00
+    assert connectivity.get_mean_rssi(1, 0) ==   -10
+    assert connectivity.get_mean_pdr(2, 0)  ==  0.00
+    assert connectivity.get_mean_rssi(2, 0) == -1000
+
+    # a cached mean is updated when a value of the link is set
+    matrix.set_pdr(1, 0, channels[0], 0.6)
+    assert connectivity.get_mean_pdr(1, 0) == pytest.approx(0.9)
+    assert connectivity.get_mean_pdr(0, 1) == 1.00
+
+    matrix.set_rssi_both_directions(0, 1, channels[1], -50)
+    assert connectivity.get_mean_rssi(0, 1) == -20
+    assert connectivity.get_mean_rssi(1, 0) == -20
+    assert connectivity.get_mean_pdr(1, 0) == pytest.approx(0.9)
+
+
 #=== verify propagate function doesn't raise exception
 
 def test_propagate(sim_engine):
@@ -1074,6 +1103,327 @@ def test_propagation(sim_engine, fixture_propagation_test_type):
         # num_frames when no frame is dropped
         assert num_transmissions == num_frames
 
+@pytest.fixture(params=['slot', 'adaptive'])
+def fixture_fidelity(request):
+    return request.param
+
+def test_fidelity(sim_engine, fixture_fidelity):
+    # with the 'slot' fidelity, the engine advances one slot per step and
+    # every slot is resolved by a single call of propagate(). with the
+    # 'adaptive' fidelity, a channel having only one transmitter is resolved
+    # at slot resolution as well.
+    num_frames = 10
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numSlotframesPerRun': num_frames * 2,
+            'exec_numMotes'           : 2,
+            'secjoin_enabled'         : False,
+            'app_pkPeriod'            : 0,
+            'rpl_of'                  : 'OFNone',
+            'rpl_daoPeriod'           : 0,
+            'rpl_extensions'          : [],
+            'sf_class'                : 'SFNone',
+            'tsch_slotframeLength'    : 2,
+            'tsch_probBcast_ebProb'   : 0,
+            'tsch_keep_alive_interval': 0,
+            'tsch_tx_queue_size'      : num_frames,
+            'conn_class'              : 'Linear',
+            'conn_fidelity'           : fixture_fidelity,
+            'phy_numChans'            : 1
+        }
+    )
+    root = sim_engine.motes[0]
+    mote = sim_engine.motes[1]
+
+    if fixture_fidelity == 'slot':
+        assert sim_engine.time_step == sim_engine.settings.tsch_slotDuration
+        assert sim_engine.is_scheduled((None, u'Connectivity.propagate'))
+        assert not sim_engine.is_scheduled(
+            (None, u'Connectivity.multi_network_propagate')
+        )
+    else:
+        # nothing is on the air; the next propagation happens at the first
+        # step of the next slot
+        event = sim_engine.uniqueTagSchedule[
+            (None, u'Connectivity.multi_network_propagate')
+        ]
+        assert event.time == (
+            sim_engine.settings.tsch_slotDuration + sim_engine.time_step
+        )
+
+    # add a dedicated TX cell in order to avoid backoff wait
+    root.tsch.addCell(1, 0, mote.get_mac_addr(), [d.CELLOPTION_RX])
+    mote.tsch.addCell(1, 0, root.get_mac_addr(), [d.CELLOPTION_TX])
+
+    # get mote synchronized
+    eb = root.tsch._create_EB()
+    mote.tsch._action_receiveEB(eb)
+    eb_dummy = {
+        'type':            d.PKT_TYPE_EB,
+        'mac': {
+            'srcMac':      '00-00-00-AA-AA-AA',     # dummy
+            'dstMac':      d.BROADCAST_ADDRESS,     # broadcast
+            'join_metric': 1000
+        }
+    }
+    mote.tsch._action_receiveEB(eb_dummy)
+    root.rpl.trickle_timer.stop()
+    mote.rpl.trickle_timer.stop()
+
+    for seqno in range(num_frames):
+        mote.tsch.enqueue({
+            'type': d.PKT_TYPE_KEEP_ALIVE,
+            'mac': {
+                'srcMac': mote.get_mac_addr(),
+                'dstMac': root.get_mac_addr()
+            },
+            'app': { 'seq': seqno },
+            'pkt_len': 0
+        })
+
+    u.run_until_end(sim_engine)
+
+    # every frame goes through on the first attempt and gets ACKed
+    logs = u.read_log_file([SimLog.LOG_TSCH_TXDONE['type']])
+    assert len(logs) == num_frames
+    assert all([log['isACKed'] for log in logs])
+
+def _synchronize_motes(engine):
+    root = engine.motes[0]
+    eb = root.tsch._create_EB()
+    eb_dummy = {
+        'type':            d.PKT_TYPE_EB,
+        'mac': {
+            'srcMac':      '00-00-00-AA-AA-AA',     # dummy
+            'dstMac':      d.BROADCAST_ADDRESS,     # broadcast
+            'join_metric': 1000
+        }
+    }
+    for mote in engine.motes[1:]:
+        mote.tsch._action_receiveEB(eb)
+        mote.tsch._action_receiveEB(eb_dummy)
+        # align the clocks so that the radios open exactly when told
+        mote.tsch.clock.desync()
+    for mote in engine.motes:
+        mote.rpl.trickle_timer.stop()
+
+def _start_tx_rx(tx_mote, rx_mote, channel, pkt_len, unicast=False):
+    # open the radios as TSCH does in a TX cell and its peer RX cell
+    if unicast:
+        packet = {
+            u'type': d.PKT_TYPE_KEEP_ALIVE,
+            u'pkt_len': pkt_len,
+            u'mac': {
+                u'dstMac': rx_mote.get_mac_addr(),
+                u'srcMac': tx_mote.get_mac_addr(),
+                u'retriesLeft': tx_mote.tsch.max_tx_retries,
+                u'priority': False,
+                u'pending_bit': False
+            }
+        }
+    else:
+        packet = {
+            u'type': d.PKT_TYPE_EB,
+            u'pkt_len': pkt_len,
+            u'mac': {
+                u'dstMac': d.BROADCAST_ADDRESS,
+                u'srcMac': tx_mote.get_mac_addr(),
+                u'join_metric': 1000
+            }
+        }
+    rx_mote.tsch.waitingFor = d.WAITING_FOR_RX
+    rx_mote.radio.startRx(channel)
+    tx_mote.tsch.waitingFor = d.WAITING_FOR_TX
+    tx_mote.tsch.pktToSend = packet
+    tx_mote.radio.startTx(channel, packet)
+
+def _record_rx_done(mote, received):
+    original_rxdone = mote.radio.rxDone
+    def mock_rxdone(packet):
+        if packet is None:
+            received[mote.id] = None
+        else:
+            received[mote.id] = packet[u'mac'][u'srcMac']
+        return original_rxdone(packet)
+    mote.radio.rxDone = mock_rxdone
+
+def _record_tx_done(mote, acked):
+    original_txdone = mote.radio.txDone
+    def mock_txdone(isACKed):
+        acked[mote.id] = isACKed
+        return original_txdone(isACKed)
+    mote.radio.txDone = mock_txdone
+
+@pytest.mark.parametrize('unicast', [False, True])
+def test_fidelity_overlapping_networks(sim_engine, unicast):
+    # network A (1->2) and network B (3->4) share a channel, with B's slot
+    # grid three time steps behind A's; 5->6 is alone on another channel.
+    # the 'adaptive' fidelity has to deliver, drop and acknowledge the same
+    # frames as the 'subslot' fidelity, whether the frames overlap or not
+    results = {}
+    for fidelity in ['subslot', 'adaptive']:
+        engine = sim_engine(
+            diff_config = {
+                'exec_numSlotframesPerRun': 10000,
+                'exec_numMotes'           : 7,
+                'conn_class'              : 'FullyMeshed',
+                'conn_fidelity'           : fidelity,
+                'secjoin_enabled'         : False,
+                'app_pkPeriod'            : 0,
+                'rpl_of'                  : 'OFNone',
+                'rpl_daoPeriod'           : 0,
+                'rpl_extensions'          : [],
+                'sf_class'                : 'SFNone',
+                'tsch_probBcast_ebProb'   : 0,
+                'tsch_keep_alive_interval': 0,
+                'phy_numChans'            : 2
+            }
+        )
+        connectivity = engine.connectivity
+
+        # they listen only in the minimal cell, at the first slot of a
+        # slotframe
+        _synchronize_motes(engine)
+
+        channel_ab = d.TSCH_HOPPING_SEQUENCE[0]
+        channel_solo = d.TSCH_HOPPING_SEQUENCE[1]
+        # B is much stronger than A at both receivers
+        for (src_id, dst_id, rssi) in [(1, 2, -70), (3, 2, -40), (3, 4, -40), (1, 4, -90)]:
+            connectivity.matrix.set_rssi(src_id, dst_id, channel_ab, rssi)
+
+        received = {}
+        acked = {}
+        for mote_id in [2, 4, 6]:
+            _record_rx_done(engine.motes[mote_id], received)
+        for mote_id in [1, 3, 5]:
+            _record_tx_done(engine.motes[mote_id], acked)
+
+        motes = engine.motes
+        slot_start = engine.asn_to_global_time(2, engine.default_network_id)
+        for (start_time, uniqueTag, callback) in [
+                (
+                    slot_start + engine.time_step,
+                    u'network_a',
+                    lambda: (
+                        _start_tx_rx(motes[1], motes[2], channel_ab, 50, unicast),
+                        _start_tx_rx(motes[5], motes[6], channel_solo, 100, unicast)
+                    )
+                ),
+                (
+                    slot_start + 4 * engine.time_step,
+                    u'network_b',
+                    lambda: _start_tx_rx(motes[3], motes[4], channel_ab, 50, unicast)
+                )
+            ]:
+            engine.scheduleAtPreciseTime(Event(
+                time           = start_time,
+                callback       = callback,
+                uniqueTag      = (None, uniqueTag),
+                intraSlotOrder = d.INTRASLOTORDER_STARTSLOT
+            ))
+
+        u.run_until_(
+            engine,
+            engine.asn_to_global_time(3, engine.default_network_id)
+        )
+        results[fidelity] = (received, acked)
+        destroy_all_singletons(engine)
+
+    # A's frame is lost at 2 because of B's; B's and the lone frame go through
+    # and, when unicast, are acknowledged
+    assert results[u'subslot'] == (
+        {
+            2: None,
+            4: engine.motes[3].get_mac_addr(),
+            6: engine.motes[5].get_mac_addr()
+        },
+        {
+            1: False,
+            3: unicast,
+            5: unicast
+        }
+    )
+    assert results[u'adaptive'] == results[u'subslot']
+
+def test_adaptive_rx_window(sim_engine):
+    # with the 'adaptive' fidelity, a listener hears a frame starting within
+    # its guard time, and is declared idle only once its RX window closes
+    engine = sim_engine(
+        diff_config = {
+            'exec_numSlotframesPerRun': 10000,
+            'exec_numMotes'           : 4,
+            'conn_class'              : 'FullyMeshed',
+            'conn_fidelity'           : 'adaptive',
+            'secjoin_enabled'         : False,
+            'app_pkPeriod'            : 0,
+            'rpl_of'                  : 'OFNone',
+            'rpl_daoPeriod'           : 0,
+            'rpl_extensions'          : [],
+            'sf_class'                : 'SFNone',
+            'tsch_probBcast_ebProb'   : 0,
+            'tsch_keep_alive_interval': 0,
+            'phy_numChans'            : 2
+        }
+    )
+    _synchronize_motes(engine)
+
+    listener = engine.motes[2]
+    idle_listener = engine.motes[3]
+    received = {}
+    for mote in [listener, idle_listener]:
+        _record_rx_done(mote, received)
+
+    channel = d.TSCH_HOPPING_SEQUENCE[0]
+    idle_channel = d.TSCH_HOPPING_SEQUENCE[1]
+    slot_start = engine.asn_to_global_time(2, engine.default_network_id)
+    rx_time = slot_start + engine.time_step
+
+    def _start_rx():
+        for (mote, mote_channel) in [(listener, channel), (idle_listener, idle_channel)]:
+            mote.tsch.waitingFor = d.WAITING_FOR_RX
+            mote.radio.startRx(mote_channel)
+
+    # the transmitter opens its radio 1 ms after the listener, within the
+    # listener's guard time
+    tx_start_time = rx_time + 10 * engine.time_step
+    assert tx_start_time < rx_time + listener.tsch.guard_time
+    def _start_tx():
+        packet = {
+            u'type': d.PKT_TYPE_EB,
+            u'pkt_len': 50,
+            u'mac': {
+                u'dstMac': d.BROADCAST_ADDRESS,
+                u'srcMac': engine.motes[1].get_mac_addr(),
+                u'join_metric': 1000
+            }
+        }
+        engine.motes[1].tsch.waitingFor = d.WAITING_FOR_TX
+        engine.motes[1].tsch.pktToSend = packet
+        engine.motes[1].radio.startTx(channel, packet)
+
+    for (start_time, uniqueTag, callback) in [
+            (rx_time, u'start_rx', _start_rx),
+            (tx_start_time, u'start_tx', _start_tx)
+        ]:
+        engine.scheduleAtPreciseTime(Event(
+            time           = start_time,
+            callback       = callback,
+            uniqueTag      = (None, uniqueTag),
+            intraSlotOrder = d.INTRASLOTORDER_STARTSLOT
+        ))
+
+    # the frame is received while the idle listener is still within its
+    # guard time
+    u.run_until_(engine, rx_time + listener.tsch.guard_time - 2 * engine.time_step)
+    assert received == {listener.id: engine.motes[1].get_mac_addr()}
+    assert idle_listener.radio.state == d.RADIO_STATE_LISTENING
+
+    u.run_until_(engine, engine.asn_to_global_time(3, engine.default_network_id))
+    assert received == {
+        listener.id: engine.motes[1].get_mac_addr(),
+        idle_listener.id: None
+    }
+
 @pytest.fixture(params=[1.0, 0.0])
 def fixture_pdr(request):
     return request.param
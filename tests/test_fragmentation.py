@@ -18,6 +18,7 @@ from SimEngine.SimEngineDefines import SECOND
 from . import test_utils as u
 import SimEngine
 import SimEngine.Mote.MoteDefines as d
+from SimEngine.Mote.NetDefines import Packet
 
 # =========================== helpers =========================================
 
@@ -740,3 +741,96 @@ class TestFragmentForwarding(object):
             else:
                 # the last fragment shouldn't affect the entry
                 assert get_memory_usage(root, sim_settings.fragmentation) == 1
+
+
+    def test_forwarded_fragment_shares_payload(self, sim_engine):
+        sim_engine = sim_engine(
+            diff_config = {
+                'exec_numMotes': 3,
+                'fragmentation': 'FragmentForwarding',
+            },
+            force_initial_routing_and_scheduling_state = True
+        )
+
+        root = sim_engine.motes[0]
+        hop1 = sim_engine.motes[1]
+        hop2 = sim_engine.motes[2]
+
+        # capture fragments to be sent by hop1
+        enqueued_fragments = []
+        hop1.tsch.enqueue = enqueued_fragments.append
+
+        fragment = Packet.from_dict(
+            {
+                'type': d.PKT_TYPE_FRAG,
+                'mac': {
+                    'srcMac'         : hop2.get_mac_addr(),
+                    'dstMac'         : hop1.get_mac_addr()
+                },
+                'app': {
+                    'rank'           : 768
+                },
+                'net': {
+                    'srcIp'          : hop2.get_ipv6_global_addr(),
+                    'dstIp'          : root.get_ipv6_global_addr(),
+                    'hop_limit'      : d.IPV6_DEFAULT_HOP_LIMIT,
+                    'packet_length'  : 90,
+                    'datagram_size'  : 180,
+                    'datagram_tag'   : 1,
+                    'datagram_offset': 0,
+                },
+                'pkt_len': 90
+            }
+        )
+        received_net = fragment['net'].to_dict()
+        hop1.sixlowpan.recvPacket(fragment)
+
+        assert len(enqueued_fragments) == 1
+        fwd_fragment = enqueued_fragments[0]
+        outgoing_datagram_tag = (
+            hop1.sixlowpan.fragmentation.vrb_table
+            [hop2.get_mac_addr()][1][u'outgoing_datagram_tag']
+        )
+
+        # the payload is shared; the headers are of the forwarded fragment
+        assert fwd_fragment['app'] is fragment['app']
+        assert fwd_fragment['net'] is not fragment['net']
+        assert fwd_fragment['mac']['srcMac'] == hop1.get_mac_addr()
+        assert fwd_fragment['mac']['dstMac'] == root.get_mac_addr()
+        assert fwd_fragment['net']['datagram_tag'] == outgoing_datagram_tag
+        assert fwd_fragment['net']['hop_limit'] == d.IPV6_DEFAULT_HOP_LIMIT - 1
+        assert fwd_fragment['net']['datagram_size'] == 180
+
+        # the received fragment is intact
+        assert fragment['net'].to_dict() == received_net
+
+
+def test_expiration_heap():
+    from SimEngine.Mote.sixlowpan import ExpirationHeap
+
+    table = {}
+    expirations = ExpirationHeap(table)
+
+    expirations.add('mac_1', 1, {'expiration': 10})
+    expirations.add('mac_1', 2, {'expiration': 30})
+    expirations.add('mac_2', 1, {'expiration': 20})
+    assert expirations.num_entries == 3
+
+    # remove an entry before its expiration, then add another one with the
+    # same key; the stale item in the heap must not remove the new one
+    expirations.remove('mac_2', 1)
+    assert 'mac_2' not in table
+    expirations.add('mac_2', 1, {'expiration': 40})
+    assert expirations.num_entries == 3
+
+    # an entry expires when its expiration is older than the given ASN
+    expirations.delete_expired(10)
+    assert sorted(table['mac_1'].keys()) == [1, 2]
+    expirations.delete_expired(25)
+    assert list(table['mac_1'].keys()) == [2]
+    assert list(table['mac_2'].keys()) == [1]
+    assert expirations.num_entries == 2
+
+    expirations.delete_expired(41)
+    assert table == {}
+    assert expirations.num_entries == 0
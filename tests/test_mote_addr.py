@@ -141,3 +141,52 @@ def test_motes_eui64(sim_engine, fixture_motes_eui64, fixture_exec_num_motes):
                 base_eui64 = netaddr.EUI('02-00-00-00-00-00-00-00')
                 auto_eui64 = netaddr.EUI(base_eui64.value + mote.id)
                 assert mote.get_mac_addr() == str(auto_eui64)
+
+def test_addr_registry():
+    from SimEngine.Mote import addr
+
+    mac_addr_int = addr.mac_addr_to_int('02-00-00-00-00-01-00-00')
+    assert mac_addr_int == 0x0200000000010000
+    assert addr.mac_addr_to_int(netaddr.EUI('02-00-00-00-00-01-00-00')) == mac_addr_int
+    assert addr.int_to_mac_addr(mac_addr_int) == '02-00-00-00-00-01-00-00'
+    assert addr.mac_addr_to_int(d.BROADCAST_ADDRESS) is None
+    assert addr.mac_addr_to_int(None) is None
+
+    ipv6_addr_int = addr.mac_addr_int_to_ipv6_addr_int(
+        mac_addr_int,
+        addr.ipv6_addr_to_int(d.IPV6_DEFAULT_PREFIX)
+    )
+    assert addr.int_to_ipv6_addr(ipv6_addr_int) == 'fd00::1:0'
+    assert addr.ipv6_addr_int_to_mac_addr_int(ipv6_addr_int) == mac_addr_int
+
+    assert addr.is_ipv6_link_local_addr_int(addr.ipv6_addr_to_int('fe80::1'))
+    assert not addr.is_ipv6_link_local_addr_int(ipv6_addr_int)
+    assert addr.is_ipv6_multicast_addr_int(
+        addr.ipv6_addr_to_int(d.IPV6_ALL_RPL_NODES_ADDRESS)
+    )
+    assert not addr.is_ipv6_multicast_addr_int(ipv6_addr_int)
+
+
+def test_get_mote_by_mac_addr(sim_engine):
+    sim_engine = sim_engine(diff_config={'exec_numMotes': 2})
+
+    root = sim_engine.motes[0]
+    mote = sim_engine.motes[1]
+    network = sim_engine._get_network(sim_engine.default_network_id)
+
+    assert sim_engine.get_mote_by_mac_addr(root.get_mac_addr()) is root
+    assert sim_engine.get_mote_by_mac_addr(mote.eui64) is mote
+    assert sim_engine.get_mote_by_mac_addr('01-23-45-67-89-ab-cd-ef') is None
+    assert sim_engine.get_mote_by_mac_addr(d.BROADCAST_ADDRESS) is None
+    assert network.get_mote_by_mac_addr(root.get_mac_addr()) is root
+    assert network.get_mote_by_mac_addr(mote.get_mac_addr()) is None
+
+    # the indexes follow a change of the MAC address
+    old_mac_addr = root.get_mac_addr()
+    root.set_eui64('01-23-45-67-89-ab-cd-ef')
+    assert root.get_mac_addr() == '01-23-45-67-89-AB-CD-EF'
+    assert root.is_my_ipv6_addr(root.get_ipv6_global_addr())
+    assert sim_engine.get_mote_by_mac_addr(old_mac_addr) is None
+    assert sim_engine.get_mote_by_mac_addr(root.get_mac_addr()) is root
+    assert network.get_mote_by_mac_addr(old_mac_addr) is None
+    assert network.get_mote_by_mac_addr(root.get_mac_addr()) is root
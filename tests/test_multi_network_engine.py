@@ -244,6 +244,8 @@ class TestMultiNetworkSimEngine:
             "app_pkLength":                                90,
             "app_burstTimestamp":                          None,
             "app_burstNumPackets":                         0,
+            "app_scheduleWindow":                          1,
+            "app_traceFile":                               None,
             "rpl_of":                                      "OF0",
             "rpl_daoPeriod":                               60,
             "rpl_extensions":                              ["dis_unicast"],
@@ -330,6 +332,26 @@ class TestMultiNetworkSimEngine:
         current_asn = mne._get_current_network_asn(network_id=network_id)
         assert current_asn == expected_asn  # (1000 - 0) // 10 = 100
 
+    def test_MNE_cached_network_asn(self):
+        network_id = '0001'
+        mne = self.init_MNE(network_id=network_id)
+        network = mne._get_network(network_id)
+        slot_duration = mne.settings.tsch_slotDuration
+
+        for global_time in [
+                5 * slot_duration,
+                5 * slot_duration + 1,
+                6 * slot_duration - 1,
+                6 * slot_duration,
+                3 * slot_duration,  # the time may go back in tests
+            ]:
+            mne.global_time = global_time
+            assert (
+                mne._get_network_asn(network) ==
+                mne._get_current_network_asn(network_id)
+            )
+        assert network.asn == 3
+
     def test_MNE_scheduleAtAsn(self):
         network_id = '0001'
         mne = self.init_MNE(network_id=network_id)
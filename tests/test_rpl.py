@@ -8,6 +8,7 @@ from __future__ import division
 from builtins import range
 from builtins import object
 from past.utils import old_div
+import random
 import types
 
 import pytest
@@ -102,6 +103,22 @@ def test_source_route_calculation(sim_engine):
     assert root.rpl.computeSourceRoute(addr[6]) == None
     assert root.rpl.computeSourceRoute(addr[7]) == None
 
+    # the cached routes of a subtree follow a change of its parent
+    '''
+       0 ----- 1 ------ 2 ----- 3 ---- 6 ---- 7
+                        |
+                        4 ----- 5
+    '''
+    root.rpl.addParentChildfromDAOs(parent_addr=addr[2], child_addr=addr[4])
+    root.rpl.addParentChildfromDAOs(parent_addr=addr[3], child_addr=addr[6])
+    assert root.rpl.computeSourceRoute(addr[3]) == [addr[1], addr[2], addr[3]]
+    assert root.rpl.computeSourceRoute(addr[5]) == [addr[1], addr[2], addr[4], addr[5]]
+    assert root.rpl.computeSourceRoute(addr[7]) == [addr[1], addr[2], addr[3], addr[6], addr[7]]
+
+    # the returned route can be modified by the caller
+    root.rpl.computeSourceRoute(addr[5]).pop(0)
+    assert root.rpl.computeSourceRoute(addr[5]) == [addr[1], addr[2], addr[4], addr[5]]
+
 
 def test_upstream_routing(sim_engine):
     sim_engine = sim_engine(
@@ -387,6 +404,48 @@ class TestOF0(object):
         assert mote.rpl.getPreferredParent() is None
 
 
+    def test_best_parent_selection(self, sim_engine):
+        sim_engine = sim_engine(
+            diff_config = {
+                'exec_numMotes'  : 2,
+                'secjoin_enabled': False
+            }
+        )
+
+        of = rpl.RplOF0(sim_engine.motes[1].rpl)
+        rng = random.Random(1)
+
+        def best_parent_by_scan():
+            parents = of.parents
+            if parents:
+                return min(parents, key=of._calculate_rank)
+            else:
+                return None
+
+        mac_addrs = ['00-00-00-00-00-00-01-{0:02X}'.format(i) for i in range(30)]
+        for mac_addr in mac_addrs:
+            of._add_neighbor(mac_addr)
+        assert of._find_neighbor(mac_addrs[3])['mac_addr'] == mac_addrs[3]
+        assert of._find_neighbor('00-00-00-00-00-00-02-00') is None
+        assert of._find_best_parent() is None
+
+        for _ in range(1000):
+            neighbor = of._find_neighbor(rng.choice(mac_addrs))
+            if rng.random() < 0.5:
+                of._update_neighbor_rank(
+                    neighbor,
+                    rng.choice([256, 512, 768, 1024, of.INFINITE_RANK])
+                )
+            else:
+                neighbor['etx'] = rng.choice([1.0, 1.5, 2.0, 3.0, 4.0])
+                of._update_neighbor_rank_increase(neighbor)
+            of.rank = rng.choice([None, 768, 1024, 1536])
+
+            assert of._find_best_parent() is best_parent_by_scan()
+            # stale entries don't accumulate
+            assert len(of._parent_heap) <= 2 * len(mac_addrs) + 8
+
+
 @pytest.fixture(params=['dis_unicast', 'dis_broadcast', None])
 def fixture_dis_mode(request):
     return request.param
@@ -527,9 +586,16 @@ def test_handle_routing_loop_at_root(sim_engine):
 
     # now root has a loop of addr_1 and addr_2; the following method call
     # causes an infinite loop unless a bugfix is in place
-    root.rpl.computeSourceRoute(addr_1)
+    assert root.rpl.computeSourceRoute(addr_1) is None
+    assert root.rpl.computeSourceRoute(addr_2) is None
 
-    assert True
+    # break the loop
+    root.rpl.addParentChildfromDAOs(
+        parent_addr = root.get_ipv6_global_addr(),
+        child_addr  = addr_1
+    )
+    assert root.rpl.computeSourceRoute(addr_1) == [addr_1]
+    assert root.rpl.computeSourceRoute(addr_2) == [addr_1, addr_2]
 
 @pytest.fixture(params=['smaller', 'same', 'larger'])
 def fixture_rank_value(request):
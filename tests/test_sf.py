@@ -543,6 +543,93 @@ class TestMSF(object):
         assert slot_offset == 1
         assert channel_offset == 0
 
+    def test_autonomous_cell_table(self, sim_engine):
+        sim_engine = sim_engine(
+            diff_config = {
+                'exec_numMotes': 10,
+                'sf_class'     : 'MSF'
+            }
+        )
+
+        mote = sim_engine.motes[0]
+        slotframe_length = mote.tsch.get_slotframe(
+            SchedulingFunctionMSF.SLOTFRAME_HANDLE_AUTONOMOUS_CELLS
+        ).length
+        num_channels = mote.settings.phy_numChans
+
+        def compute_by_hash(mac_addr):
+            hash_value = mote.sf._sax(mac_addr)
+            return (
+                1 + (hash_value % (slotframe_length - 1)),
+                hash_value % num_channels
+            )
+
+        # the cells are computed once and shared by the motes of the engine
+        table = sim_engine.msf_autonomous_cells
+        for _mote in sim_engine.motes:
+            mac_addr = _mote.get_mac_addr()
+            assert (
+                mote.sf._compute_autonomous_cell(mac_addr) ==
+                compute_by_hash(mac_addr)
+            )
+            assert (
+                table[(slotframe_length, num_channels)][mac_addr] ==
+                compute_by_hash(mac_addr)
+            )
+        assert list(table.keys()) == [(slotframe_length, num_channels)]
+
+    def test_batch_cell_accounting(self, sim_engine):
+        sim_engine = sim_engine(
+            diff_config = {
+                'exec_numMotes'           : 2,
+                'sf_class'                : 'MSF',
+                'sf_batch_cell_accounting': True
+            }
+        )
+
+        root = sim_engine.motes[0]
+        mote = sim_engine.motes[1]
+        parent = root.get_mac_addr()
+        mote.rpl.getPreferredParent = lambda: parent
+        mote.sf.retry_count[parent] = -1
+        requests = []
+        mote.sf._request_adding_cells = (
+            lambda neighbor, num_tx_cells, num_rx_cells=0:
+            requests.append((neighbor, num_tx_cells, num_rx_cells))
+        )
+        tx_cell = types.SimpleNamespace(
+            mac_addr = parent,
+            options  = [d.CELLOPTION_TX]
+        )
+        other_tx_cell = types.SimpleNamespace(
+            mac_addr = None,
+            options  = [d.CELLOPTION_TX, d.CELLOPTION_SHARED]
+        )
+
+        # used cells are counted as they elapse
+        num_used_cells = 90
+        for _ in range(num_used_cells):
+            mote.sf.indication_tx_cell_elapsed(
+                tx_cell,
+                sent_packet = {'type': d.PKT_TYPE_DATA}
+            )
+        assert mote.sf.num_tx_cells_elapsed == num_used_cells
+        assert requests == []
+
+        # the unused cells of a slotframe are counted at once; the window
+        # closes on the cell reaching MSF_MAX_NUMCELLS, and the rest of the
+        # batch goes into the next window
+        mote.sf.indication_cells_elapsed(
+            [tx_cell] * 30 + [other_tx_cell] * 10,
+            []
+        )
+        assert mote.sf.tx_cell_utilization == num_used_cells / d.MSF_MAX_NUMCELLS
+        assert requests == [(parent, 1, 0)]
+        assert mote.sf.num_tx_cells_elapsed == (
+            num_used_cells + 30 - d.MSF_MAX_NUMCELLS
+        )
+        assert mote.sf.num_tx_cells_used == 0
+
     def test_clear(self, sim_engine):
         sim_engine = sim_engine(
             diff_config = {
@@ -10,10 +10,13 @@ from SimEngine.SimEngineDefines import SECOND
 from . import test_utils as u
 import SimEngine.Mote.MoteDefines as d
 from SimEngine.Mote.sf import SchedulingFunctionBase
+from SimEngine.Mote.sixp import SixPTransaction
 from SimEngine         import SimLog
 
 # =========================== helpers =========================================
 
+TIMER_WHEEL_TICK_UNIQUE_TAG = (u'SixPTimerWheel', u'_action_tick')
+
 COMMON_SIM_ENGINE_ARGS = {
     'diff_config': {
         'exec_numMotes'           : 2,
@@ -264,6 +267,16 @@ class SchedulingFunctionThreeStepForAbortion(SchedulingFunctionThreeStep):
             )
 
 
+def _fire_tick(sim_engine):
+    # run the pending tick of the 6P timer wheel at its time, in place of
+    # the engine, and return that time
+    event = sim_engine.uniqueTagSchedule[TIMER_WHEEL_TICK_UNIQUE_TAG]
+    assert not event.cancelled
+    sim_engine.removeFutureEvent(TIMER_WHEEL_TICK_UNIQUE_TAG)
+    sim_engine.global_time = event.time
+    event.callback()
+    return event.time
+
 def install_sf(motes, sf_class):
     for mote in motes:
         mote.sf = sf_class(mote)
@@ -603,6 +616,140 @@ class TestTransaction(object):
         assert len(mote.sixp.transaction_table) == 0
         assert len(mote.tsch.txQueue) == 0
 
+    def test_timer_wheel(self, sim_engine):
+        sim_engine = sim_engine(**COMMON_SIM_ENGINE_ARGS)
+
+        # for quick access
+        mote_0 = sim_engine.motes[0]
+        mote_1 = sim_engine.motes[1]
+        timer_wheel = sim_engine.sixp_timer_wheel
+        tick_uniqueTag = TIMER_WHEEL_TICK_UNIQUE_TAG
+
+        # the timer wheel is shared by all the motes
+        assert timer_wheel is not None
+        assert mote_1.engine.sixp_timer_wheel is timer_wheel
+
+        request = {
+            u'type': d.PKT_TYPE_SIXP,
+            u'mac' : {
+                u'srcMac': mote_0.get_mac_addr(),
+                u'dstMac': mote_1.get_mac_addr()
+            },
+            u'app' : {
+                u'msgType' : d.SIXP_MSG_TYPE_REQUEST,
+                u'code'    : d.SIXP_CMD_COUNT,
+                u'seqNum'  : 0
+            }
+        }
+        result = {'timeout_time': None}
+        def request_callback(event, packet):
+            assert event == d.SIXP_CALLBACK_EVENT_TIMEOUT
+            result['timeout_time'] = sim_engine.global_time
+
+        # start a transaction whose request is never transmitted
+        start_time = sim_engine.global_time
+        timeout_seconds = 0.5 * SECOND
+        transaction = SixPTransaction(mote_0, request)
+        transaction.start(request_callback, timeout_seconds)
+        transaction_key = SixPTransaction.make_transaction_key(
+            mote_0.get_mac_addr(),
+            mote_1.get_mac_addr()
+        )
+        assert isinstance(transaction_key, tuple)
+        assert mote_0.sixp.transaction_table[transaction_key] is transaction
+        assert len(timer_wheel) == 1
+        assert sim_engine.is_scheduled(tick_uniqueTag)
+
+        # the timeout happens at the end of the slotframe where it expires
+        event = sim_engine.uniqueTagSchedule[tick_uniqueTag]
+        num_ticks = event.time / timer_wheel.tick
+        assert num_ticks == pytest.approx(round(num_ticks))
+        assert event.time >= start_time + timeout_seconds
+        assert event.time <= start_time + timeout_seconds + timer_wheel.tick
+        assert _fire_tick(sim_engine) == event.time
+        assert result['timeout_time'] == event.time
+        assert len(mote_0.sixp.transaction_table) == 0
+        assert len(timer_wheel) == 0
+        assert timer_wheel.next_tick is None
+
+        # a completed transaction leaves the wheel
+        transaction = SixPTransaction(mote_0, request)
+        transaction.start(None, timeout_seconds)
+        assert len(timer_wheel) == 1
+        transaction.complete()
+        assert len(timer_wheel) == 0
+        assert len(mote_0.sixp.transaction_table) == 0
+
+    def test_timer_wheel_timeout_starts_transaction(self, sim_engine):
+        sim_engine = sim_engine(**COMMON_SIM_ENGINE_ARGS)
+
+        # for quick access
+        mote_0 = sim_engine.motes[0]
+        mote_1 = sim_engine.motes[1]
+        timer_wheel = sim_engine.sixp_timer_wheel
+        tick = timer_wheel.tick
+
+        def create_request(initiator, responder):
+            return {
+                u'type': d.PKT_TYPE_SIXP,
+                u'mac' : {
+                    u'srcMac': initiator.get_mac_addr(),
+                    u'dstMac': responder.get_mac_addr()
+                },
+                u'app' : {
+                    u'msgType' : d.SIXP_MSG_TYPE_REQUEST,
+                    u'code'    : d.SIXP_CMD_COUNT,
+                    u'seqNum'  : 0
+                }
+            }
+
+        timeouts = []
+        def callback(event, packet):
+            assert event == d.SIXP_CALLBACK_EVENT_TIMEOUT
+            timeouts.append((packet[u'mac'][u'srcMac'], sim_engine.global_time))
+
+        # the timeout of the first transaction starts a new one, which expires
+        # after the second transaction does
+        def first_callback(event, packet):
+            callback(event, packet)
+            SixPTransaction(
+                mote_0,
+                create_request(mote_0, mote_1)
+            ).start(callback, 2 * tick)
+        SixPTransaction(
+            mote_0,
+            create_request(mote_0, mote_1)
+        ).start(first_callback, 0.5 * tick)
+        SixPTransaction(
+            mote_1,
+            create_request(mote_1, mote_0)
+        ).start(callback, 1.5 * tick)
+        assert len(timer_wheel) == 2
+
+        # the bucket of the second transaction is still the next one to fire
+        assert _fire_tick(sim_engine) == pytest.approx(tick)
+        assert len(timer_wheel) == 2
+        assert timer_wheel.next_tick == 2
+        assert (
+            sim_engine.uniqueTagSchedule[TIMER_WHEEL_TICK_UNIQUE_TAG].time ==
+            pytest.approx(2 * tick)
+        )
+        assert _fire_tick(sim_engine) == pytest.approx(2 * tick)
+        assert _fire_tick(sim_engine) == pytest.approx(4 * tick)
+        assert len(timer_wheel) == 0
+        assert not sim_engine.is_scheduled(TIMER_WHEEL_TICK_UNIQUE_TAG)
+
+        assert [src_mac_addr for (src_mac_addr, _) in timeouts] == [
+            mote_0.get_mac_addr(),
+            mote_1.get_mac_addr(),
+            mote_0.get_mac_addr()
+        ]
+        assert [global_time for (_, global_time) in timeouts] == [
+            pytest.approx(tick),
+            pytest.approx(2 * tick),
+            pytest.approx(4 * tick)
+        ]
+
 class TestSeqNum(object):
 
     @pytest.fixture(params=[0, 1, 2, 100, 200, 254, 255])
@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 from builtins import range
+import math
+
 import pytest
 
 from SimEngine.SimEngineDefines import MILLISECOND
@@ -113,8 +115,8 @@ def test_reset(sim_engine):
     trickle_timer.start()
 
     # get ASN of 't' and one of the end of the interval
-    original_event_at_t = sim_engine.uniqueTagSchedule[trickle_timer.uniqueTag_base + '_at_t']
-    original_event_at_end_of_interval = sim_engine.uniqueTagSchedule[trickle_timer.uniqueTag_base + '_at_i']
+    original_asn_at_t = trickle_timer.asn_at_t
+    original_asn_at_i = trickle_timer.asn_at_i
 
     u.run_until_asn(sim_engine, sim_engine.getAsn() + 1)
 
@@ -124,9 +126,21 @@ def test_reset(sim_engine):
     # interval should be the minimum value by reset()
     assert trickle_timer.interval == Imin
     # events should be re-scheduled accordingly
-
-    assert original_event_at_t is not sim_engine.uniqueTagSchedule[trickle_timer.uniqueTag_base + '_at_t']
-    assert original_event_at_end_of_interval is not sim_engine.uniqueTagSchedule[trickle_timer.uniqueTag_base + '_at_i']
+    service = sim_engine.trickle_service
+    assert trickle_timer.asn_at_i == sim_engine.getAsn() + int(
+        math.ceil(float(Imin) / sim_engine.settings.tsch_slotDuration)
+    )
+    assert trickle_timer.asn_at_t <= trickle_timer.asn_at_i
+    assert trickle_timer.callback_at_t in service.buckets[trickle_timer.asn_at_t]
+    assert trickle_timer.callback_at_i in service.buckets[trickle_timer.asn_at_i]
+    if original_asn_at_t != trickle_timer.asn_at_t:
+        assert trickle_timer.callback_at_t not in service.buckets.get(
+            original_asn_at_t, {}
+        )
+    if original_asn_at_i != trickle_timer.asn_at_i:
+        assert trickle_timer.callback_at_i not in service.buckets.get(
+            original_asn_at_i, {}
+        )
 
 
 def test_stop(sim_engine):
@@ -139,14 +153,66 @@ def test_stop(sim_engine):
     def _callback():
         pass
 
-    # clear all events because there are a lot of events scheduled when initializing sim_engine
-    sim_engine.events = type(sim_engine.events)()
     trickle_timer = TrickleTimer(Imin, Imax, K, _callback)
+    service = sim_engine.trickle_service
+    num_callbacks = len(service)
     trickle_timer.start()
-    assert len(sim_engine.events) == 2
+    assert len(service) == num_callbacks + 2
     trickle_timer.stop()
-    assert trickle_timer.state == trickle_timer.STATE_STOPPED 
-    # for all events, it should be cancelled
-    for event in sim_engine.events:
-        assert event.cancelled
+    assert trickle_timer.state == trickle_timer.STATE_STOPPED
+    # both of the events should be removed
+    assert len(service) == num_callbacks
+    assert trickle_timer.asn_at_t is None
+    assert trickle_timer.asn_at_i is None
+
+
+def test_service(sim_engine):
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numMotes': 1
+        }
+    )
+
+    result = {'fired': []}
+
+    trickle_timers = []
+    for i in range(3):
+        trickle_timer = TrickleTimer(
+            Imin, Imax, K,
+            lambda i=i: result['fired'].append(i)
+        )
+        trickle_timer.start()
+        trickle_timers.append(trickle_timer)
+
+    # all the timers share a single service, which has a single event
+    service = sim_engine.trickle_service
+    for trickle_timer in trickle_timers:
+        assert trickle_timer.service is service
+    # an emptied bucket is dropped when its event fires
+    assert service.next_asn <= min(service.buckets)
+    event = sim_engine.uniqueTagSchedule[(u'TrickleService', u'_action_fire')]
+    assert event.time == sim_engine.asn_to_global_time(
+        service.next_asn,
+        sim_engine.default_network_id
+    )
 
+    # reset all of them, as an inconsistency heard by all of them does; their
+    # callbacks move to other buckets
+    num_callbacks = len(service)
+    for trickle_timer in trickle_timers:
+        trickle_timer.reset()
+        assert trickle_timer.interval == Imin
+        assert trickle_timer.counter == 0
+    assert len(service) == num_callbacks
+
+    # Imin is shorter than a slot; all the events are in the next slot and
+    # their callbacks are called in the order they were added. Then, the
+    # next non-empty bucket is scheduled.
+    asn = service.next_asn
+    assert asn == sim_engine.getAsn() + 1
+    u.run_until_asn(sim_engine, asn)
+    assert result['fired'] == [0, 1, 2]
+    assert asn not in service.buckets
+    assert service.next_asn == min(service.buckets)
+    # the fired callbacks are counted out, the ones of the next intervals in
+    assert len(service) == sum(len(bucket) for bucket in service.buckets.values())
@@ -20,6 +20,7 @@ from . import test_utils as u
 import SimEngine.Mote.MoteDefines as d
 from SimEngine import SimLog
 from SimEngine.Mote import tsch
+from SimEngine.Mote.NetDefines import Packet, copy_headers
 
 # frame_type having "True" in "first_enqueuing" can be enqueued to TX queue
 # even if the queue is full.
@@ -210,6 +211,142 @@ def test_removeTypeFromQueue(sim_engine):
         {'type': 5},
     ]
 
+def test_packet_fields():
+    packet = Packet(
+        type    = d.PKT_TYPE_DATA,
+        mac     = {'srcMac': 'src', 'dstMac': 'dst'},
+        pkt_len = 10
+    )
+    # no room for attributes other than the known fields
+    with pytest.raises(AttributeError):
+        packet.dummy = True
+
+    # a dict header is converted; unknown keys go to the overflow map
+    assert packet['mac']['dstMac'] == 'dst'
+    packet['mac']['custom'] = 1
+    assert packet['mac'].extra == {'custom': 1}
+
+    # a field which is not set is absent
+    assert 'net' not in packet
+    assert 'pending_bit' not in packet['mac']
+    assert sorted(packet.keys()) == ['mac', 'pkt_len', 'type']
+    del packet['mac']['custom']
+    assert packet.to_dict() == {
+        'type': d.PKT_TYPE_DATA,
+        'mac': {'srcMac': 'src', 'dstMac': 'dst'},
+        'pkt_len': 10
+    }
+
+    # frequently used application keys have their own slots
+    packet['app'] = {'appcounter': 0, 'timestamp': 1, 'custom': 2}
+    assert packet['app'].extra == {'custom': 2}
+
+    # headers are compared with each other and with dicts
+    other = packet.copy()
+    other['app'] = {'custom': 2, 'timestamp': 1, 'appcounter': 0}
+    assert other == packet
+    assert other == packet.to_dict()
+    assert packet['mac'] == {'srcMac': 'src', 'dstMac': 'dst'}
+    assert packet['mac'] != {'srcMac': 'src', 'dstMac': 'dst', 'seqnum': 0}
+    assert packet['mac'] != packet['app']
+    # a key which has been removed from "extra" doesn't count
+    other['mac']['custom'] = 1
+    assert other != packet
+    del other['mac']['custom']
+    assert other['mac'].extra == {}
+    assert other == packet
+    other['app']['timestamp'] = 2
+    assert other != packet
+
+def test_copy_headers_on_reception():
+    packet = Packet.from_dict({
+        'type': d.PKT_TYPE_DATA,
+        'mac': {'srcMac': 'src', 'dstMac': 'dst'},
+        'net': {'srcIp': 'src', 'dstIp': 'dst', 'sourceRoute': ['hop']},
+        'app': {'appcounter': 0},
+        'pkt_len': 10
+    })
+
+    received_packet = copy_headers(packet)
+    received_packet['mac']['dstMac'] = 'next_hop'
+    received_packet['net']['hop_limit'] = 1
+    received_packet['net']['rank_error'] = True
+
+    # the transmitted packet is intact; the payload is shared
+    assert packet['mac']['dstMac'] == 'dst'
+    assert packet['net']['hop_limit'] is None
+    assert 'rank_error' not in packet['net']
+    assert received_packet['app'] is packet['app']
+    assert received_packet['net']['sourceRoute'] is packet['net']['sourceRoute']
+
+    # a dict (EB) is supported as well
+    eb = {'type': d.PKT_TYPE_EB, 'mac': {'srcMac': 'src'}}
+    received_eb = copy_headers(eb)
+    received_eb['mac']['dstMac'] = 'dst'
+    assert eb == {'type': d.PKT_TYPE_EB, 'mac': {'srcMac': 'src'}}
+
+def test_tx_queue_per_dst_mac_addr():
+    def frame(seq, dst_mac_addr):
+        return {'seq': seq, 'mac': {'dstMac': dst_mac_addr}}
+
+    tx_queue = tsch.TxQueue([frame(1, 'a'), frame(2, 'b'), frame(3, 'a')])
+    assert tx_queue.get_num_frames('a') == 2
+    assert tx_queue.get_num_frames('c') == 0
+    assert tx_queue.get_first_frame('a')['seq'] == 1
+    assert tx_queue.get_first_frame('c') is None
+
+    # a priority frame is put ahead of the normal frames, in its sub-queue
+    # as well
+    priority_frame = frame(4, 'a')
+    priority_frame['mac']['priority'] = True
+    tx_queue.append(priority_frame)
+    assert tx_queue.num_priority_frames == 1
+    assert [x['seq'] for x in tx_queue] == [4, 1, 2, 3]
+    assert [x['seq'] for x in reversed(tx_queue)] == [3, 2, 1, 4]
+    assert [x['seq'] for x in tx_queue.get_frames('a')] == [4, 1, 3]
+    assert tx_queue.get_first_frame('a') is priority_frame
+    assert tx_queue[1]['seq'] == 1
+    assert tx_queue[-1]['seq'] == 3
+
+    # a frame is removed by identity, or by equality as list.remove() does
+    tx_queue.pop(1)
+    tx_queue.remove(frame(2, 'b'))
+    assert frame(2, 'b') not in tx_queue
+    assert tx_queue.get_dst_mac_addrs() == ['a']
+    with pytest.raises(ValueError):
+        tx_queue.remove(frame(2, 'b'))
+
+    tx_queue.remove_frames_if(lambda x: x['seq'] == 3, dst_mac_addr='a')
+    assert tx_queue == [priority_frame]
+    assert tx_queue.get_frames('a') == [priority_frame]
+
+    tx_queue.pop(0)
+    assert tx_queue.num_priority_frames == 0
+    assert tx_queue.get_num_frames('a') == 0
+
+    # the same frame can be put more than once
+    tx_queue.extend([frame(5, 'b')] * 2)
+    tx_queue.remove(tx_queue[0])
+    assert len(tx_queue) == 1
+    tx_queue.clear()
+    assert len(tx_queue) == 0
+
+def test_tx_queue_setter(sim_engine):
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numMotes': 1
+        }
+    )
+    mote = sim_engine.motes[0]
+
+    # a list is wrapped into a TxQueue; a TxQueue is kept as it is
+    mote.tsch.txQueue = [{'seq': 1, 'mac': {'dstMac': 'a'}}]
+    tx_queue = mote.tsch.txQueue
+    assert isinstance(tx_queue, tsch.TxQueue)
+    assert tx_queue.get_num_frames('a') == 1
+    mote.tsch.txQueue = tx_queue
+    assert mote.tsch.txQueue is tx_queue
+
 @pytest.mark.parametrize('destination, packet_type, expected_cellOptions', [
     ('parent',    d.PKT_TYPE_DATA, [d.CELLOPTION_TX]),
 ])
@@ -568,6 +705,107 @@ def test_select_active_tx_cell(sim_engine):
     assert cell.mac_addr == neighbor_mac_addr_1
     assert packet == frame_1
 
+def test_compiled_schedule(sim_engine):
+    slotframe_length = 101
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numMotes'         : 1,
+            'tsch_slotframeLength'  : slotframe_length,
+            'tsch_compiled_schedule': True
+        }
+    )
+    root = sim_engine.motes[0]
+    dispatcher = sim_engine.schedule_dispatcher
+    assert root.tsch.getIsSync()
+    assert dispatcher.get_mote_ids_at_asn(0) == [root.id]
+
+    # a second slotframe with another length is dispatched as well
+    root.tsch.add_slotframe(slotframe_handle=1, length=7)
+    root.tsch.addCell(5, 1, None, [d.CELLOPTION_RX])
+    root.tsch.addCell(3, 1, None, [d.CELLOPTION_RX], slotframe_handle=1)
+    assert dispatcher.get_mote_ids_at_asn(5) == [root.id]
+    assert dispatcher.get_mote_ids_at_asn(10) == [root.id]
+    assert dispatcher.get_mote_ids_at_asn(4) == []
+    assert dispatcher.get_num_slots_to_next_dispatch(0) == 3
+
+    # record the ASNs where the root is woken up
+    active_asns = []
+    def _action_active_cell(self):
+        active_asns.append(self.engine.getAsn())
+    root.tsch._action_active_cell = types.MethodType(
+        _action_active_cell,
+        root.tsch
+    )
+    u.run_until_asn(sim_engine, 30)
+    assert active_asns == [3, 5, 10, 17, 24]
+
+    # the index follows deleteCell() and set_length()
+    root.tsch.deleteCell(5, 1, None, [d.CELLOPTION_RX])
+    assert dispatcher.get_mote_ids_at_asn(5) == []
+    root.tsch.get_slotframe(1).set_length(5)
+    assert dispatcher.get_mote_ids_at_asn(33) == [root.id]
+    assert dispatcher.get_mote_ids_at_asn(31) == []
+    root.tsch.delete_slotframe(1)
+    assert dispatcher.get_mote_ids_at_asn(33) == []
+
+def test_batch_cell_accounting(sim_engine):
+    slotframe_length = 10
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numMotes'           : 2,
+            'tsch_slotframeLength'    : slotframe_length,
+            'tsch_probBcast_ebProb'   : 0,
+            'tsch_keep_alive_interval': 0,
+            'app_pkPeriod'            : 0,
+            'secjoin_enabled'         : False,
+            'sf_class'                : 'SFNone',
+            'rpl_of'                  : 'OFNone',
+            'rpl_daoPeriod'           : 0,
+            'rpl_extensions'          : [],
+            'conn_fidelity'           : 'slot'
+        }
+    )
+    root = sim_engine.motes[0]
+    mote = sim_engine.motes[1]
+    root.rpl.trickle_timer.stop()
+
+    # get mote synchronized
+    eb = root.tsch._create_EB()
+    mote.tsch._action_receiveEB(eb)
+    mote.engine.removeFutureEvent((mote.id, 'tsch', 'wait_eb'))
+    mote.tsch._perform_synchronization()
+    assert mote.tsch.isSync
+    mote.rpl.trickle_timer.stop()
+
+    # record what TSCH reports to SF
+    mote.sf.batch_cell_accounting = True
+    reports = []
+    def indication_cells_elapsed(tx_cells, rx_cells):
+        reports.append((sim_engine.getAsn(), tx_cells, rx_cells))
+    mote.sf.indication_cells_elapsed = indication_cells_elapsed
+
+    # the TX cell has no frame to send, so that the RX cell is picked up at
+    # slot offset 5; the TX cell elapses unused
+    tx_cell_mac_addr = root.get_mac_addr()
+    mote.tsch.addCell(5, 1, tx_cell_mac_addr, [d.CELLOPTION_TX])
+    mote.tsch.addCell(5, 2, None, [d.CELLOPTION_RX])
+    tx_cell = mote.tsch.get_cell(5, 1, tx_cell_mac_addr)
+
+    # the unused cells are reported at the first active slot of every
+    # slotframe, i.e., at slot offset 5 of the first one and at the minimal
+    # cell of the following ones
+    u.run_until_asn(sim_engine, slotframe_length + 6)
+    assert [asn for (asn, _, _) in reports] == [5, slotframe_length]
+    assert reports[0][1:] == ([], [])
+    assert reports[1][1:] == ([tx_cell], [])
+    assert mote.tsch.elapsed_tx_cells == [tx_cell]
+    assert mote.tsch.elapsed_rx_cells == []
+
+    # the cells not reported yet are dropped on desynchronization
+    mote.tsch.setIsSync(False)
+    assert mote.tsch.elapsed_tx_cells == []
+    assert mote.tsch.elapsed_cells_slotframe_number is None
+
 def test_get_available_slots(sim_engine):
     sim_engine = sim_engine(
         diff_config = {
@@ -620,6 +858,11 @@ def test_get_physical_channel(sim_engine):
         else:
             pass
         previous_channel = mote.tsch._get_physical_channel(minimal_cell)
+        assert previous_channel in sim_engine.connectivity.channels
+        assert previous_channel == mote.tsch._get_physical_channel(
+            minimal_cell,
+            sim_engine.getAsn()
+        )
 
 
 @pytest.fixture(params=[False, True])
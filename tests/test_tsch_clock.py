@@ -107,3 +107,37 @@ def test_tsch_clock(sim_engine, with_keep_alive):
         assert len(keep_alive_logs) > 0
     else:
         assert len(keep_alive_logs) == 0
+
+
+def test_clock_drift_in_closed_form(sim_engine):
+    sim_engine = sim_engine(diff_config={'exec_numMotes': 3})
+    root = sim_engine.motes[0]
+    hop_1 = sim_engine.motes[1]
+    hop_2 = sim_engine.motes[2]
+    clock_interval = SECOND / sim_engine.settings.tsch_clock_frequency
+
+    assert root.tsch.clock.get_drift() == 0
+    assert hop_1.tsch.clock.get_drift() == 0
+
+    hop_1.tsch.clock.sync(root.get_mac_addr())
+    sync_time = sim_engine.global_time
+    offset = hop_1.tsch.clock.get_drift()
+    assert 0 <= offset < clock_interval
+
+    # reading the drift has no side effect
+    error_rate = hop_1.tsch.clock._error_rate
+    later = sync_time + 10 * SECOND
+    for _ in range(3):
+        assert (
+            hop_1.tsch.clock.get_drift(later) ==
+            pytest.approx(offset + 10 * SECOND * error_rate)
+        )
+    assert hop_1.tsch.clock.get_drift() == offset
+
+    # the drift of the time source at the sync is part of the offset
+    hop_2.tsch.clock.sync(hop_1.get_mac_addr())
+    offset_2 = hop_2.tsch.clock.get_drift() - hop_1.tsch.clock.get_drift()
+    assert 0 <= offset_2 < clock_interval
+
+    hop_1.tsch.clock.desync()
+    assert hop_1.tsch.clock.get_drift() == 0
@@ -395,3 +395,108 @@ def test_slotframe_set_length_with_cells(sim_engine):
     slotframe.set_length(new_length)
     assert slotframe.length == new_length
     assert len(slotframe.get_busy_slots()) == len(cells) - 1  # make sure we have the right amount of cells
+
+def test_get_num_slots_to_next_active_cell(sim_engine):
+    sim_engine = sim_engine() # need for log
+
+    slotframe = SlotFrame(None, 1, 101)
+    assert slotframe.get_num_slots_to_next_active_cell(0) is None
+
+    cell_10 = Cell(10, 0, [d.CELLOPTION_TX], 'test_mac_addr_1')
+    cell_50 = Cell(50, 0, [d.CELLOPTION_RX], 'test_mac_addr_2')
+    for c in [cell_50, cell_10]:
+        slotframe.add(c)
+    assert slotframe.get_busy_slots() == [10, 50]
+
+    assert slotframe.get_num_slots_to_next_active_cell(0) == 10
+    assert slotframe.get_num_slots_to_next_active_cell(10) == 40
+    assert slotframe.get_num_slots_to_next_active_cell(49) == 1
+    # wrap around
+    assert slotframe.get_num_slots_to_next_active_cell(50) == 61
+    assert slotframe.get_num_slots_to_next_active_cell(101 + 60) == 51
+
+    # the only cell is the one at the current slot offset
+    slotframe.delete(cell_10)
+    assert slotframe.get_busy_slots() == [50]
+    assert slotframe.get_num_slots_to_next_active_cell(50) == 101
+
+    # the generation changes on every update of the schedule
+    generation = slotframe.generation
+    slotframe.set_length(40)
+    assert slotframe.generation != generation
+    assert slotframe.get_num_slots_to_next_active_cell(0) is None
+
+def test_slotframe_set_length_with_cells_on_a_slot(sim_engine):
+    sim_engine = sim_engine() # need for log
+
+    slotframe = SlotFrame(None, 1, 101)
+    slotframe.add(Cell(70, 0, [d.CELLOPTION_TX], 'test_mac_addr_1'))
+    slotframe.add(Cell(70, 1, [d.CELLOPTION_TX], 'test_mac_addr_2'))
+
+    slotframe.set_length(50)
+    assert slotframe.get_busy_slots() == []
+    assert slotframe.get_cells_filtered() == []
+
+def test_get_cell(sim_engine):
+    sim_engine = sim_engine() # need for log
+
+    slotframe = SlotFrame(None, 1, 101)
+    cell = Cell(5, 3, [d.CELLOPTION_TX], 'test_mac_addr', slotframe_handle=1)
+    slotframe.add(cell)
+
+    assert slotframe.get_cell(5, 3, 'test_mac_addr') is cell
+    assert slotframe.get_cell(5, 4, 'test_mac_addr') is None
+    assert slotframe.get_cell(5, 3, 'dummy_mac_addr') is None
+
+    # cells are hashable by their key
+    same_cell = Cell(5, 3, [d.CELLOPTION_TX], 'test_mac_addr', slotframe_handle=1)
+    assert cell == same_cell
+    assert {cell: True}[same_cell] is True
+    assert cell != Cell(5, 3, [d.CELLOPTION_TX], 'test_mac_addr', slotframe_handle=2)
+    assert cell != Cell(5, 3, [d.CELLOPTION_RX], 'test_mac_addr', slotframe_handle=1)
+
+    # a cell for another slotframe cannot be added
+    with pytest.raises(AssertionError):
+        slotframe.add(Cell(6, 3, [d.CELLOPTION_TX], 'test_mac_addr', slotframe_handle=2))
+
+    slotframe.delete(cell)
+    assert slotframe.get_cell(5, 3, 'test_mac_addr') is None
+
+def test_sample_available_slots(sim_engine, monkeypatch):
+    sim_engine = sim_engine() # need for log
+
+    slotframe = SlotFrame(None, 1, 10)
+    for slot_offset in [1, 2, 3]:
+        slotframe.add(Cell(slot_offset, 0, [d.CELLOPTION_TX], 'test_mac_addr'))
+    assert slotframe.get_available_slots() == [0, 4, 5, 6, 7, 8, 9]
+    assert slotframe.is_available_slot(0)
+    assert not slotframe.is_available_slot(1)
+    assert not slotframe.is_available_slot(10)
+
+    # excluded slots and busy slots are never picked
+    for _ in range(100):
+        selected_slots = slotframe.sample_available_slots(2, set([0, 1, 9]))
+        assert len(set(selected_slots)) == 2
+        assert set(selected_slots).issubset(set([4, 5, 6, 7, 8]))
+    assert (
+        sorted(slotframe.sample_available_slots(5, set([0, 1, 9]))) ==
+        [4, 5, 6, 7, 8]
+    )
+    assert slotframe.sample_available_slots(6, set([0, 1, 9])) == []
+
+    # with most of the free slots excluded, the available ones are listed
+    # instead of being drawn out of the free slots
+    large_slotframe = SlotFrame(None, 1, 100)
+    def _choice(seq):
+        assert False
+    monkeypatch.setattr(random, 'choice', _choice)
+    selected_slots = large_slotframe.sample_available_slots(5, set(range(90)))
+    assert len(set(selected_slots)) == 5
+    assert set(selected_slots).issubset(set(range(90, 100)))
+    monkeypatch.undo()
+
+    # the free slots follow the slotframe length
+    slotframe.set_length(5)
+    assert slotframe.get_available_slots() == [0, 4]
+    slotframe.set_length(7)
+    assert slotframe.get_available_slots() == [0, 4, 5, 6]